@@ -7,11 +7,18 @@ Provides comprehensive administrative utilities and management functions
 import sqlite3
 import datetime
 import json
-import csv
 import logging
 import os
+import time
 from typing import Dict, List, Optional, Tuple
-from config import DATABASE_FILE
+from config import (
+    DATABASE_FILE, CLEANUP_CHUNK_SIZE, CLEANUP_CHUNK_PAUSE, MAX_TOKENS_PER_USER, BULK_TOKEN_CHUNK_SIZE,
+    ANALYTICS_RETENTION_DAYS
+)
+from database_setup import DatabaseManager
+from migrations import ROLLUP_SOURCES, COUNTER_SOURCE, COUNTED_TABLES
+from data_export import CsvExporter
+from leaderboard import Leaderboard
 
 logger = logging.getLogger(__name__)
 
@@ -20,505 +27,485 @@ class AdminToolkit:
     
     def __init__(self, db_file: str = DATABASE_FILE):
         self.db_file = db_file
+        self.db = DatabaseManager(db_file)
     
     def get_database_connection(self):
         """Get database connection with error handling"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self.db.connect(check_same_thread=True)
             conn.row_factory = sqlite3.Row  # Enable dict-like access
             return conn
         except Exception as e:
             logger.error(f"Database connection error: {e}")
             return None
     
-    def get_user_analytics(self, days: int = 30) -> Dict:
-        """Get comprehensive user analytics"""
+    def _collect(self, label: str, collect, *args) -> Dict:
+        """Run one analytics section on its own connection"""
         conn = self.get_database_connection()
         if not conn:
             return {}
         
         try:
-            cursor = conn.cursor()
-            
-            # Basic user stats
-            cursor.execute("SELECT COUNT(*) as total_users FROM users")
-            total_users = cursor.fetchone()['total_users']
-            
-            cursor.execute("SELECT COUNT(*) as active_users FROM users WHERE is_active = TRUE")
-            active_users = cursor.fetchone()['active_users']
-            
-            # New users in period
-            cursor.execute("""
-                SELECT COUNT(*) as new_users 
-                FROM users 
-                WHERE DATE(joined_on) >= DATE('now', '-' || ? || ' days')
-            """, (days,))
-            new_users = cursor.fetchone()['new_users']
-            
-            # Top users by tokens
-            cursor.execute("""
-                SELECT id, username, first_name, tokens, redemptions 
-                FROM users 
-                ORDER BY tokens DESC 
-                LIMIT 10
-            """)
-            top_token_users = [dict(row) for row in cursor.fetchall()]
-            
-            # Top users by redemptions
-            cursor.execute("""
-                SELECT id, username, first_name, tokens, redemptions 
-                FROM users 
-                ORDER BY redemptions DESC 
-                LIMIT 10
-            """)
-            top_redemption_users = [dict(row) for row in cursor.fetchall()]
-            
-            # Daily active users trend
-            cursor.execute("""
-                SELECT DATE(last_activity) as date, COUNT(*) as active_users
-                FROM users 
-                WHERE DATE(last_activity) >= DATE('now', '-' || ? || ' days')
-                GROUP BY DATE(last_activity)
-                ORDER BY date DESC
-            """, (days,))
-            daily_activity = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            return {
-                'total_users': total_users,
-                'active_users': active_users,
-                'new_users': new_users,
-                'top_token_users': top_token_users,
-                'top_redemption_users': top_redemption_users,
-                'daily_activity': daily_activity,
-                'analysis_period': days
-            }
-            
+            return collect(conn.cursor(), *args)
         except Exception as e:
-            logger.error(f"User analytics error: {e}")
-            conn.close()
+            logger.error(f"{label} analytics error: {e}")
             return {}
+        finally:
+            conn.close()
     
-    def get_content_analytics(self) -> Dict:
+    def get_user_analytics(self, days: int = 30) -> Dict:
+        """Get comprehensive user analytics"""
+        return self._collect("User", self._user_analytics, days)
+    
+    def get_content_analytics(self, days: int = 30) -> Dict:
         """Get content performance analytics"""
+        return self._collect("Content", self._content_analytics, days)
+    
+    def get_financial_analytics(self, days: int = 30) -> Dict:
+        """Get token economy and financial analytics"""
+        return self._collect("Financial", self._financial_analytics, days)
+    
+    def get_referral_analytics(self, days: int = 30) -> Dict:
+        """Get referral program analytics"""
+        return self._collect("Referral", self._referral_analytics, days)
+    
+    def refresh_leaderboards(self) -> List[str]:
+        """Recompute every leaderboard snapshot now (the bot keeps them fresh while it runs)"""
         conn = self.get_database_connection()
         if not conn:
-            return {}
+            return []
         
         try:
-            cursor = conn.cursor()
-            
-            # Basic content stats
-            cursor.execute("SELECT COUNT(*) as total_content FROM content WHERE is_active = TRUE")
-            total_content = cursor.fetchone()['total_content']
-            
-            cursor.execute("SELECT SUM(views) as total_views FROM content WHERE is_active = TRUE")
-            total_views = cursor.fetchone()['total_views'] or 0
-            
-            cursor.execute("SELECT AVG(views) as avg_views FROM content WHERE is_active = TRUE")
-            avg_views = cursor.fetchone()['avg_views'] or 0
-            
-            # Content by type
-            cursor.execute("""
-                SELECT file_type, COUNT(*) as count, SUM(views) as total_views
-                FROM content 
-                WHERE is_active = TRUE
-                GROUP BY file_type
-            """)
-            content_by_type = [dict(row) for row in cursor.fetchall()]
-            
-            # Top performing content
-            cursor.execute("""
-                SELECT id, caption, views, file_type, uploaded_on
-                FROM content 
-                WHERE is_active = TRUE
-                ORDER BY views DESC 
-                LIMIT 10
-            """)
-            top_content = [dict(row) for row in cursor.fetchall()]
-            
-            # Recent uploads
-            cursor.execute("""
-                SELECT id, caption, views, file_type, uploaded_on, uploaded_by
-                FROM content 
-                WHERE is_active = TRUE
-                ORDER BY uploaded_on DESC 
-                LIMIT 10
-            """)
-            recent_uploads = [dict(row) for row in cursor.fetchall()]
-            
-            # Content performance by category
-            cursor.execute("""
-                SELECT category, COUNT(*) as count, SUM(views) as total_views, AVG(views) as avg_views
-                FROM content 
-                WHERE is_active = TRUE
-                GROUP BY category
-                ORDER BY total_views DESC
-            """)
-            category_performance = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            return {
-                'total_content': total_content,
-                'total_views': total_views,
-                'avg_views': round(avg_views, 2),
-                'content_by_type': content_by_type,
-                'top_content': top_content,
-                'recent_uploads': recent_uploads,
-                'category_performance': category_performance
-            }
-            
+            metrics = Leaderboard.refresh_stale(conn, force=True)
+            logger.info(f"Leaderboards refreshed: {metrics}")
+            return metrics
         except Exception as e:
-            logger.error(f"Content analytics error: {e}")
+            logger.error(f"Leaderboard refresh error: {e}")
+            conn.rollback()
+            return []
+        finally:
             conn.close()
-            return {}
     
-    def get_financial_analytics(self) -> Dict:
-        """Get token economy and financial analytics"""
-        conn = self.get_database_connection()
-        if not conn:
-            return {}
+    def _leaderboard(self, cursor, metric: str, score_key: str, detail_key: Optional[str] = None,
+                     limit: int = 10) -> List[Dict]:
+        """Top of a leaderboard snapshot under the metric's own column names"""
+        cursor.execute(self.db.query("leaderboard_top"), (metric, limit))
+        rows = []
+        for row in cursor.fetchall():
+            user = dict(row)
+            user[score_key] = user.pop('score')
+            detail = user.pop('detail')
+            if detail_key:
+                user[detail_key] = detail
+            rows.append(user)
+        return rows
+    
+    @staticmethod
+    def _window(days: int) -> int:
+        # Daily charts never reach past the analytics retention period
+        return max(1, min(days, ANALYTICS_RETENTION_DAYS))
+    
+    def _user_analytics(self, cursor, days: int = 30) -> Dict:
+        days = self._window(days)
+        # Totals, active users and token supply from counters; new users from the daily rollup
+        cursor.execute(self.db.query("user_summary"), (days,))
+        summary = cursor.fetchone()
         
-        try:
-            cursor = conn.cursor()
-            
-            # Token distribution
-            cursor.execute("SELECT SUM(tokens) as total_tokens FROM users")
+        # Top users by tokens and by redemptions
+        top_token_users = self._leaderboard(cursor, 'tokens', 'tokens', 'redemptions')
+        top_redemption_users = self._leaderboard(cursor, 'redemptions', 'redemptions', 'tokens')
+        
+        # Daily active users trend
+        cursor.execute(self.db.query("daily_activity"), (days,))
+        daily_activity = [dict(row) for row in cursor.fetchall()]
+        
+        return {
+            'total_users': summary['total_users'],
+            'active_users': summary['active_users'],
+            'new_users': summary['new_users'],
+            'total_tokens': summary['total_tokens'],
+            'top_token_users': top_token_users,
+            'top_redemption_users': top_redemption_users,
+            'daily_activity': daily_activity,
+            'analysis_period': days
+        }
+    
+    def _content_analytics(self, cursor, days: int = 30) -> Dict:
+        # Totals, per-type and per-category figures from one grouped pass
+        cursor.execute(self.db.query("content_breakdown"))
+        by_type, by_category = {}, {}
+        for row in cursor.fetchall():
+            type_row = by_type.setdefault(row['file_type'], {'file_type': row['file_type'], 'count': 0, 'total_views': 0})
+            category_row = by_category.setdefault(row['category'], {'category': row['category'], 'count': 0, 'total_views': 0})
+            for bucket in (type_row, category_row):
+                bucket['count'] += row['count']
+                bucket['total_views'] += row['total_views']
+        
+        content_by_type = list(by_type.values())
+        category_performance = sorted(by_category.values(), key=lambda row: row['total_views'], reverse=True)
+        for row in category_performance:
+            row['avg_views'] = row['total_views'] / row['count']
+        total_content = sum(row['count'] for row in content_by_type)
+        total_views = sum(row['total_views'] for row in content_by_type)
+        
+        # Top performing content
+        cursor.execute(self.db.query("top_content"))
+        top_content = [dict(row) for row in cursor.fetchall()]
+        
+        # Recent uploads
+        cursor.execute(self.db.query("recent_uploads"))
+        recent_uploads = [dict(row) for row in cursor.fetchall()]
+        
+        # Unlocks per day and most unlocked content in the window
+        cursor.execute(self.db.query("daily_unlocks"), (self._window(days),))
+        daily_unlocks = [dict(row) for row in cursor.fetchall()]
+        cursor.execute(self.db.query("top_unlocked_content"), (self._window(days),))
+        top_unlocked_content = [dict(row) for row in cursor.fetchall()]
+        
+        avg_views = total_views / total_content if total_content else 0
+        
+        return {
+            'total_content': total_content,
+            'total_views': total_views,
+            'avg_views': round(avg_views, 2),
+            'content_by_type': content_by_type,
+            'top_content': top_content,
+            'recent_uploads': recent_uploads,
+            'category_performance': category_performance,
+            'daily_unlocks': daily_unlocks,
+            'top_unlocked_content': top_unlocked_content
+        }
+    
+    def _financial_analytics(self, cursor, days: int = 30, total_tokens_in_system: Optional[int] = None) -> Dict:
+        # Token distribution
+        if total_tokens_in_system is None:
+            cursor.execute(self.db.query("sum_tokens"))
             total_tokens_in_system = cursor.fetchone()['total_tokens'] or 0
-            
-            # Transaction analytics
-            cursor.execute("""
-                SELECT transaction_type, COUNT(*) as count, SUM(amount) as total_amount
-                FROM token_transactions
-                GROUP BY transaction_type
-            """)
-            transaction_summary = [dict(row) for row in cursor.fetchall()]
-            
-            # Daily transaction volume
-            cursor.execute("""
-                SELECT DATE(timestamp) as date, 
-                       COUNT(*) as transaction_count,
-                       SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as tokens_added,
-                       SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as tokens_spent
-                FROM token_transactions
-                WHERE DATE(timestamp) >= DATE('now', '-30 days')
-                GROUP BY DATE(timestamp)
-                ORDER BY date DESC
-            """)
-            daily_transactions = [dict(row) for row in cursor.fetchall()]
-            
-            # Revenue estimation (assuming token prices)
-            cursor.execute("""
-                SELECT SUM(amount) as total_purchased
-                FROM token_transactions
-                WHERE transaction_type IN ('purchase', 'admin_add')
-            """)
-            estimated_revenue_tokens = cursor.fetchone()['total_purchased'] or 0
-            
-            # Top spenders
-            cursor.execute("""
-                SELECT u.id, u.username, u.first_name, 
-                       SUM(CASE WHEN tt.amount < 0 THEN ABS(tt.amount) ELSE 0 END) as tokens_spent
-                FROM users u
-                JOIN token_transactions tt ON u.id = tt.user_id
-                WHERE tt.transaction_type = 'redeem'
-                GROUP BY u.id
-                ORDER BY tokens_spent DESC
-                LIMIT 10
-            """)
-            top_spenders = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            return {
-                'total_tokens_in_system': total_tokens_in_system,
-                'transaction_summary': transaction_summary,
-                'daily_transactions': daily_transactions,
-                'estimated_revenue_tokens': estimated_revenue_tokens,
-                'estimated_revenue_inr': estimated_revenue_tokens * 10,  # Assuming ₹10 per token average
-                'top_spenders': top_spenders
-            }
-            
-        except Exception as e:
-            logger.error(f"Financial analytics error: {e}")
-            conn.close()
-            return {}
+        
+        # Transaction analytics; purchased tokens are read off the same grouping
+        cursor.execute(self.db.query("transaction_summary"))
+        transaction_summary = [dict(row) for row in cursor.fetchall()]
+        estimated_revenue_tokens = sum(
+            row['total_amount'] or 0 for row in transaction_summary
+            if row['transaction_type'] in ('purchase', 'admin_add')
+        )
+        
+        # Daily transaction volume
+        cursor.execute(self.db.query("daily_transactions"), (self._window(days),))
+        daily_transactions = [dict(row) for row in cursor.fetchall()]
+        
+        # Top spenders
+        top_spenders = self._leaderboard(cursor, 'spent', 'tokens_spent')
+        
+        return {
+            'total_tokens_in_system': total_tokens_in_system,
+            'transaction_summary': transaction_summary,
+            'daily_transactions': daily_transactions,
+            'estimated_revenue_tokens': estimated_revenue_tokens,
+            'estimated_revenue_inr': estimated_revenue_tokens * 10,  # Assuming ₹10 per token average
+            'top_spenders': top_spenders
+        }
     
-    def get_referral_analytics(self) -> Dict:
-        """Get referral program analytics"""
-        conn = self.get_database_connection()
-        if not conn:
-            return {}
+    def _referral_analytics(self, cursor, days: int = 30, total_users: Optional[int] = None) -> Dict:
+        # Top referrers and program totals
+        top_referrers = self._leaderboard(cursor, 'referrals', 'referral_count', 'total_earned')
+        cursor.execute(self.db.query("referral_totals"))
+        summary = cursor.fetchone()
         
-        try:
-            cursor = conn.cursor()
-            
-            # Basic referral stats
-            cursor.execute("SELECT COUNT(*) as total_referrals FROM referrals")
-            total_referrals = cursor.fetchone()['total_referrals']
-            
-            cursor.execute("SELECT SUM(bonus_amount) as total_bonuses FROM referrals")
-            total_bonuses = cursor.fetchone()['total_bonuses'] or 0
-            
-            # Top referrers
-            cursor.execute("""
-                SELECT u.id, u.username, u.first_name,
-                       COUNT(r.id) as referral_count,
-                       SUM(r.bonus_amount) as total_earned
-                FROM users u
-                JOIN referrals r ON u.id = r.referrer_id
-                GROUP BY u.id
-                ORDER BY referral_count DESC
-                LIMIT 10
-            """)
-            top_referrers = [dict(row) for row in cursor.fetchall()]
-            
-            # Referral conversion rate
-            cursor.execute("SELECT COUNT(DISTINCT referrer_id) as active_referrers FROM referrals")
-            active_referrers = cursor.fetchone()['active_referrers']
-            
-            cursor.execute("SELECT COUNT(*) as total_users FROM users")
+        # Referral conversion rate
+        if total_users is None:
+            cursor.execute(self.db.query("count_users"))
             total_users = cursor.fetchone()['total_users']
-            
-            referral_participation_rate = (active_referrers / total_users * 100) if total_users > 0 else 0
-            
-            # Daily referral activity
-            cursor.execute("""
-                SELECT DATE(referred_on) as date, COUNT(*) as referrals
-                FROM referrals
-                WHERE DATE(referred_on) >= DATE('now', '-30 days')
-                GROUP BY DATE(referred_on)
-                ORDER BY date DESC
-            """)
-            daily_referrals = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            return {
-                'total_referrals': total_referrals,
-                'total_bonuses': total_bonuses,
-                'top_referrers': top_referrers,
-                'active_referrers': active_referrers,
-                'referral_participation_rate': round(referral_participation_rate, 2),
-                'daily_referrals': daily_referrals
-            }
-            
-        except Exception as e:
-            logger.error(f"Referral analytics error: {e}")
-            conn.close()
-            return {}
+        
+        active_referrers = summary['active_referrers']
+        referral_participation_rate = (active_referrers / total_users * 100) if total_users > 0 else 0
+        
+        # Daily referral activity
+        cursor.execute(self.db.query("daily_referrals"), (self._window(days),))
+        daily_referrals = [dict(row) for row in cursor.fetchall()]
+        
+        return {
+            'total_referrals': summary['total_referrals'],
+            'total_bonuses': summary['total_bonuses'],
+            'top_referrers': top_referrers,
+            'active_referrers': active_referrers,
+            'referral_participation_rate': round(referral_participation_rate, 2),
+            'daily_referrals': daily_referrals
+        }
     
-    def export_user_data(self, output_file: str = None) -> str:
+    def export_user_data(self, output_file: str = None, compress: bool = False, since_last: bool = False) -> str:
         """Export user data to CSV"""
+        return self._export_csv('users', output_file, compress, since_last)
+    
+    def export_content_data(self, output_file: str = None, compress: bool = False, since_last: bool = False) -> str:
+        """Export content data to CSV"""
+        return self._export_csv('content', output_file, compress, since_last)
+    
+    def _export_csv(self, kind: str, output_file: Optional[str], compress: bool, since_last: bool) -> str:
+        """Stream an export to disk; since_last only exports rows added after the previous export"""
         if not output_file:
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = f"users_export_{timestamp}.csv"
+            output_file = f"{kind}_export_{timestamp}.csv" + (".gz" if compress else "")
         
         conn = self.get_database_connection()
         if not conn:
             return ""
         
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, username, first_name, last_name, tokens, redemptions, 
-                       referral_by, joined_on, is_active, total_spent
-                FROM users
-                ORDER BY joined_on DESC
-            """)
-            
-            users = cursor.fetchall()
+            # Plain tuples; sqlite3.Row adds per-row overhead the CSV writer does not need
+            conn.row_factory = None
+            exporter = CsvExporter(self.db)
+            with open(output_file, 'wb') as output:
+                rows, watermark = exporter.write(conn, kind, output, compress, since_last)
+            
+            if watermark is not None:
+                exporter.save_watermark(conn, kind, watermark, rows)
+                conn.commit()
             conn.close()
             
-            with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['id', 'username', 'first_name', 'last_name', 'tokens', 
-                            'redemptions', 'referral_by', 'joined_on', 'is_active', 'total_spent']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for user in users:
-                    writer.writerow(dict(user))
-            
-            logger.info(f"User data exported to {output_file}")
+            logger.info(f"Exported {rows} {kind} rows to {output_file}")
             return output_file
             
         except Exception as e:
-            logger.error(f"User export error: {e}")
+            logger.error(f"{kind.capitalize()} export error: {e}")
             conn.close()
             return ""
     
-    def export_content_data(self, output_file: str = None) -> str:
-        """Export content data to CSV"""
+    def generate_admin_report(self, output_file: str = None) -> str:
+        """Generate comprehensive admin report"""
         if not output_file:
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = f"content_export_{timestamp}.csv"
+            output_file = f"admin_report_{timestamp}.json"
         
         conn = self.get_database_connection()
         if not conn:
             return ""
         
         try:
+            # One connection and one read snapshot, so every section agrees
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, file_id, file_type, caption, category, views, 
-                       uploaded_by, uploaded_on, is_active
-                FROM content
-                ORDER BY uploaded_on DESC
-            """)
-            
-            content = cursor.fetchall()
+            cursor.execute("BEGIN")
+            sections = {}
+            
+            def collect(name: str, section, *args):
+                try:
+                    sections[name] = section(cursor, *args)
+                except Exception as e:
+                    logger.error(f"Report section {name} error: {e}")
+                    sections[name] = {}
+            
+            # Later sections reuse the user totals instead of rescanning users
+            collect('user_analytics', self._user_analytics)
+            users = sections['user_analytics']
+            collect('content_analytics', self._content_analytics)
+            collect('financial_analytics', self._financial_analytics, 30, users.get('total_tokens'))
+            collect('referral_analytics', self._referral_analytics, 30, users.get('total_users'))
+            conn.rollback()
             conn.close()
             
-            with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['id', 'file_id', 'file_type', 'caption', 'category', 
-                            'views', 'uploaded_by', 'uploaded_on', 'is_active']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for item in content:
-                    writer.writerow(dict(item))
+            report = {'generated_at': datetime.datetime.now().isoformat(), **sections}
             
-            logger.info(f"Content data exported to {output_file}")
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, default=str)
+            
+            logger.info(f"Admin report generated: {output_file}")
             return output_file
             
         except Exception as e:
-            logger.error(f"Content export error: {e}")
+            logger.error(f"Report generation error: {e}")
             conn.close()
             return ""
     
-    def generate_admin_report(self, output_file: str = None) -> str:
-        """Generate comprehensive admin report"""
-        if not output_file:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = f"admin_report_{timestamp}.json"
+    def rebuild_rollups(self) -> Dict[str, int]:
+        """Recompute every daily rollup and stats counter from source rows (backfill or repair)"""
+        conn = self.get_database_connection()
+        if not conn:
+            return {}
         
         try:
-            report = {
-                'generated_at': datetime.datetime.now().isoformat(),
-                'user_analytics': self.get_user_analytics(),
-                'content_analytics': self.get_content_analytics(),
-                'financial_analytics': self.get_financial_analytics(),
-                'referral_analytics': self.get_referral_analytics()
-            }
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(report, f, indent=2, default=str)
+            # The write lock keeps triggers from updating a rollup mid-rebuild
+            self.db.begin_immediate(conn)
+            counts = {}
+            for table, source in ROLLUP_SOURCES.items():
+                conn.execute(f"DELETE FROM {table}")
+                counts[table] = conn.execute(f"INSERT INTO {table} {source}").rowcount
+            conn.execute("DELETE FROM stats_counters")
+            counts['stats_counters'] = conn.execute(
+                f"INSERT INTO stats_counters (name, value) {COUNTER_SOURCE}"
+            ).rowcount
+            conn.commit()
+            conn.close()
             
-            logger.info(f"Admin report generated: {output_file}")
-            return output_file
+            logger.info(f"Rebuilt daily rollups: {counts}")
+            return counts
             
         except Exception as e:
-            logger.error(f"Report generation error: {e}")
-            return ""
+            logger.error(f"Rollup rebuild error: {e}")
+            conn.rollback()
+            conn.close()
+            return {}
     
-    def cleanup_inactive_users(self, days: int = 90) -> int:
-        """Remove inactive users after specified days"""
+    def cleanup_inactive_users(self, days: int = 90, dry_run: bool = False,
+                               chunk_size: int = CLEANUP_CHUNK_SIZE, pause: float = CLEANUP_CHUNK_PAUSE) -> int:
+        """Remove inactive users after specified days, in short chunked transactions"""
         conn = self.get_database_connection()
         if not conn:
             return 0
         
         try:
-            cursor = conn.cursor()
-            
-            # Find inactive users
-            cursor.execute("""
-                SELECT id FROM users 
-                WHERE last_activity < datetime('now', '-' || ? || ' days')
+            # Fix the cutoff once so every chunk applies the same rule
+            cutoff = conn.execute("SELECT datetime('now', '-' || ? || ' days')", (days,)).fetchone()[0]
+            
+            # Snapshot candidate ids into a temp table; only reads the main database
+            conn.execute("DROP TABLE IF EXISTS temp.cleanup_ids")
+            conn.execute("CREATE TEMP TABLE cleanup_ids (id INTEGER PRIMARY KEY)")
+            conn.execute("""
+                INSERT INTO temp.cleanup_ids (id)
+                SELECT id FROM users
+                WHERE last_activity < ?
                 AND tokens = 0 
                 AND redemptions = 0
-            """, (days,))
-            
-            inactive_users = cursor.fetchall()
-            inactive_count = len(inactive_users)
-            
-            if inactive_count > 0:
-                # Delete related data first (due to foreign keys)
-                for user in inactive_users:
-                    user_id = user['id']
-                    cursor.execute("DELETE FROM referrals WHERE referrer_id = ? OR referred_id = ?", (user_id, user_id))
-                    cursor.execute("DELETE FROM feedback WHERE user_id = ?", (user_id,))
-                    cursor.execute("DELETE FROM token_transactions WHERE user_id = ?", (user_id,))
-                    cursor.execute("DELETE FROM logs WHERE user_id = ?", (user_id,))
+            """, (cutoff,))
+            conn.commit()
+            candidates = conn.execute("SELECT COUNT(*) FROM temp.cleanup_ids").fetchone()[0]
+            
+            if dry_run:
+                conn.execute("DROP TABLE temp.cleanup_ids")
+                conn.close()
+                logger.info(f"Cleanup dry run: {candidates} inactive users would be removed")
+                return candidates
+            
+            removed_count = 0
+            last_id = 0
+            while True:
+                row = conn.execute("""
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM temp.cleanup_ids WHERE id > ? ORDER BY id LIMIT ?
+                    )
+                """, (last_id, chunk_size)).fetchone()
+                if row[0] is None:
+                    break
+                chunk = (last_id, row[0])
                 
-                # Delete users
-                cursor.execute("""
-                    DELETE FROM users 
-                    WHERE last_activity < datetime('now', '-' || ? || ' days')
+                self.db.begin_immediate(conn)
+                # Re-check the rule: a user may have come back since the snapshot
+                cursor = conn.execute("""
+                    DELETE FROM users
+                    WHERE id IN (SELECT id FROM temp.cleanup_ids WHERE id > ? AND id <= ?)
+                    AND last_activity < ?
                     AND tokens = 0 
                     AND redemptions = 0
-                """, (days,))
+                """, chunk + (cutoff,))
+                removed_count += cursor.rowcount
+                conn.execute("""
+                    DELETE FROM temp.cleanup_ids
+                    WHERE id > ? AND id <= ? AND id IN (SELECT id FROM users WHERE id > ? AND id <= ?)
+                """, chunk + chunk)
+                
+                # Related data of the users actually removed
+                removed_ids = "SELECT id FROM temp.cleanup_ids WHERE id > ? AND id <= ?"
+                conn.execute(f"DELETE FROM referrals WHERE referrer_id IN ({removed_ids})", chunk)
+                conn.execute(f"DELETE FROM referrals WHERE referred_id IN ({removed_ids})", chunk)
+                conn.execute(f"DELETE FROM feedback WHERE user_id IN ({removed_ids})", chunk)
+                conn.execute(f"DELETE FROM token_transactions WHERE user_id IN ({removed_ids})", chunk)
+                conn.execute(f"DELETE FROM logs WHERE user_id IN ({removed_ids})", chunk)
+                # Running bots drop their cached user rows
+                self.db.execute(conn, "bump_cache_generation", ("users",))
+                conn.commit()
+                
+                last_id = chunk[1]
+                # Let the live bot grab the write lock between chunks
+                time.sleep(pause)
             
-            conn.commit()
+            conn.execute("DROP TABLE temp.cleanup_ids")
             conn.close()
             
-            logger.info(f"Cleaned up {inactive_count} inactive users")
-            return inactive_count
+            logger.info(f"Cleaned up {removed_count} of {candidates} inactive users")
+            return removed_count
             
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
+            conn.rollback()
             conn.close()
             return 0
     
-    def bulk_token_operation(self, operation: str, amount: int, user_filter: Dict = None) -> int:
-        """Perform bulk token operations on users"""
+    # New balance per operation; the cap never takes tokens away on 'add'
+    BULK_TOKEN_EXPRESSIONS = {
+        'add': ("MAX(tokens, MIN(?, tokens + ?))", lambda amount: (MAX_TOKENS_PER_USER, amount)),
+        'subtract': ("MAX(0, tokens - ?)", lambda amount: (amount,)),
+        'set': ("MIN(?, ?)", lambda amount: (MAX_TOKENS_PER_USER, amount)),
+    }
+    
+    def bulk_token_operation(self, operation: str, amount: int, user_filter: Dict = None,
+                             chunk_size: int = BULK_TOKEN_CHUNK_SIZE) -> int:
+        """Perform bulk token operations on users with set-based statements per chunk"""
+        if operation not in self.BULK_TOKEN_EXPRESSIONS or amount < 0:
+            logger.error(f"Bulk operation rejected: {operation} {amount}")
+            return 0
+        
         conn = self.get_database_connection()
         if not conn:
             return 0
         
         try:
-            cursor = conn.cursor()
-            
-            # Build query based on filter
-            base_query = "SELECT id FROM users WHERE is_active = TRUE"
+            # Build filter based on user_filter
+            conditions = "is_active = TRUE"
             params = []
             
             if user_filter:
                 if 'min_tokens' in user_filter:
-                    base_query += " AND tokens >= ?"
+                    conditions += " AND tokens >= ?"
                     params.append(user_filter['min_tokens'])
                 
                 if 'max_tokens' in user_filter:
-                    base_query += " AND tokens <= ?"
+                    conditions += " AND tokens <= ?"
                     params.append(user_filter['max_tokens'])
                 
                 if 'min_redemptions' in user_filter:
-                    base_query += " AND redemptions >= ?"
+                    conditions += " AND redemptions >= ?"
                     params.append(user_filter['min_redemptions'])
             
-            cursor.execute(base_query, params)
-            target_users = cursor.fetchall()
+            expression, expression_params = self.BULK_TOKEN_EXPRESSIONS[operation]
+            new_tokens = expression_params(amount)
+            description = {
+                'add': "Bulk token addition by admin",
+                'subtract': "Bulk token subtraction by admin",
+                'set': f"Bulk token set to {amount} by admin",
+            }[operation]
             
-            affected_count = 0
+            # Only users whose balance actually changes are updated and ledgered
+            target = f"id > ? AND id <= ? AND {conditions} AND {expression} != tokens"
             
-            for user in target_users:
-                user_id = user['id']
-                
-                if operation == 'add':
-                    cursor.execute("UPDATE users SET tokens = tokens + ? WHERE id = ?", (amount, user_id))
-                    cursor.execute("""
-                        INSERT INTO token_transactions (user_id, amount, transaction_type, description) 
-                        VALUES (?, ?, ?, ?)
-                    """, (user_id, amount, "bulk_add", f"Bulk token addition by admin"))
-                
-                elif operation == 'subtract':
-                    cursor.execute("UPDATE users SET tokens = MAX(0, tokens - ?) WHERE id = ?", (amount, user_id))
-                    cursor.execute("""
-                        INSERT INTO token_transactions (user_id, amount, transaction_type, description) 
-                        VALUES (?, ?, ?, ?)
-                    """, (user_id, -amount, "bulk_subtract", f"Bulk token subtraction by admin"))
+            affected_count = 0
+            last_id = 0
+            while True:
+                row = conn.execute(f"""
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM users WHERE id > ? AND {conditions} ORDER BY id LIMIT ?
+                    )
+                """, [last_id] + params + [chunk_size]).fetchone()
+                if row[0] is None:
+                    break
+                chunk_params = [last_id, row[0]] + params + list(new_tokens)
                 
-                elif operation == 'set':
-                    cursor.execute("UPDATE users SET tokens = ? WHERE id = ?", (amount, user_id))
-                    cursor.execute("""
-                        INSERT INTO token_transactions (user_id, amount, transaction_type, description) 
-                        VALUES (?, ?, ?, ?)
-                    """, (user_id, amount, "bulk_set", f"Bulk token set to {amount} by admin"))
+                self.db.begin_immediate(conn)
+                # Ledger first, while the old balances are still visible
+                conn.execute(f"""
+                    INSERT INTO token_transactions (user_id, amount, transaction_type, description)
+                    SELECT id, {expression} - tokens, ?, ?
+                    FROM users WHERE {target}
+                """, list(new_tokens) + [f"bulk_{operation}", description] + chunk_params)
+                cursor = conn.execute(f"""
+                    UPDATE users SET tokens = {expression}
+                    WHERE {target}
+                """, list(new_tokens) + chunk_params)
+                affected_count += cursor.rowcount
+                # Running bots drop their cached balances
+                self.db.execute(conn, "bump_cache_generation", ("users",))
+                conn.commit()
                 
-                affected_count += 1
+                last_id = row[0]
             
-            conn.commit()
             conn.close()
             
             logger.info(f"Bulk operation '{operation}' applied to {affected_count} users")
@@ -526,6 +513,7 @@ class AdminToolkit:
             
         except Exception as e:
             logger.error(f"Bulk operation error: {e}")
+            conn.rollback()
             conn.close()
             return 0
     
@@ -545,27 +533,20 @@ class AdminToolkit:
             page_size = cursor.fetchone()[0]
             db_size_mb = round((page_count * page_size) / (1024 * 1024), 2)
             
-            # Table sizes
-            tables = ['users', 'content', 'referrals', 'feedback', 'logs', 'token_transactions']
-            table_sizes = {}
-            
-            for table in tables:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                table_sizes[table] = cursor.fetchone()[0]
+            # Table sizes from the trigger-maintained counters
+            cursor.execute(self.db.query("get_stats_counters"))
+            counters = dict(cursor.fetchall())
+            table_sizes = {table: counters.get(table, 0) for table in COUNTED_TABLES}
             
             # Recent error count
-            cursor.execute("""
-                SELECT COUNT(*) FROM logs 
-                WHERE log_type = 'error' 
-                AND timestamp >= datetime('now', '-24 hours')
-            """)
+            cursor.execute(self.db.query("count_recent_errors"))
             recent_errors = cursor.fetchone()[0]
             
             # System performance indicators
-            cursor.execute("SELECT COUNT(*) FROM users WHERE DATE(last_activity) = DATE('now')")
+            cursor.execute(self.db.query("count_daily_active_users"))
             daily_active_users = cursor.fetchone()[0]
             
-            cursor.execute("SELECT COUNT(*) FROM token_transactions WHERE DATE(timestamp) = DATE('now')")
+            cursor.execute(self.db.query("count_transactions_today"))
             daily_transactions = cursor.fetchone()[0]
             
             conn.close()
@@ -610,11 +591,18 @@ if __name__ == "__main__":
     parser.add_argument('--generate-report', action='store_true', help='Generate comprehensive admin report')
     parser.add_argument('--system-health', action='store_true', help='Check system health')
     parser.add_argument('--cleanup-inactive', type=int, metavar='DAYS', help='Remove inactive users after N days')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Recompute daily analytics rollups and counters')
+    parser.add_argument('--refresh-leaderboards', action='store_true', help='Recompute leaderboard snapshots')
     
     args = parser.parse_args()
     
     admin_tools = AdminToolkit()
     
+    # Before the report, so --refresh-leaderboards --generate-report reads fresh snapshots
+    if args.refresh_leaderboards:
+        metrics = admin_tools.refresh_leaderboards()
+        print(f"Refreshed leaderboards: {metrics}")
+    
     if args.export_users:
         file = admin_tools.export_user_data()
         print(f"User data exported to: {file}")
@@ -634,3 +622,7 @@ if __name__ == "__main__":
     if args.cleanup_inactive:
         count = admin_tools.cleanup_inactive_users(args.cleanup_inactive)
         print(f"Cleaned up {count} inactive users")
+    
+    if args.rebuild_rollups:
+        counts = admin_tools.rebuild_rollups()
+        print(f"Rebuilt rollups: {counts}")
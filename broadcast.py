@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Broadcast Engine for Telegram Bot
+Streams recipients with keyset pagination and fans messages out at the Bot API rate limit
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from telegram.error import BadRequest, Forbidden
+
+from config import BROADCAST_PAGE_SIZE, BROADCAST_CONCURRENCY
+from outbound import BROADCAST
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict], Awaitable[None]]
+
+class BroadcastEngine:
+    """Resumable, rate-limited message fan-out to every active user"""
+
+    def __init__(self, db_pool, bot, outbound, page_size: int = BROADCAST_PAGE_SIZE,
+                 concurrency: int = BROADCAST_CONCURRENCY):
+        self.db_pool = db_pool
+        self.bot = bot
+        # Pacing, flood control and retries are handled by the shared dispatcher
+        self.outbound = outbound
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled = set()
+
+    # Database side (pool threads)
+
+    @staticmethod
+    def _create(conn, admin_id: int, message: str) -> Dict:
+        total = conn.execute("SELECT COUNT(*) FROM users WHERE is_active = TRUE").fetchone()[0]
+        cursor = conn.execute("""
+            INSERT INTO broadcasts (admin_id, message, total)
+            VALUES (?, ?, ?)
+        """, (admin_id, message, total))
+        return {
+            'id': cursor.lastrowid, 'admin_id': admin_id, 'message': message, 'status': 'running',
+            'last_user_id': 0, 'resume_ids': [], 'sent': 0, 'failed': 0, 'blocked': 0, 'total': total
+        }
+
+    @staticmethod
+    def _load_running(conn) -> List[Dict]:
+        rows = conn.execute("""
+            SELECT id, admin_id, message, status, last_user_id, resume_ids, sent, failed, blocked, total
+            FROM broadcasts WHERE status = 'running'
+            ORDER BY id
+        """).fetchall()
+        columns = ('id', 'admin_id', 'message', 'status', 'last_user_id', 'resume_ids',
+                   'sent', 'failed', 'blocked', 'total')
+        states = [dict(zip(columns, row)) for row in rows]
+        for state in states:
+            state['resume_ids'] = json.loads(state['resume_ids'])
+        return states
+
+    @staticmethod
+    def _next_page(conn, after_id: int, limit: int) -> List[int]:
+        """Keyset page over the users primary key"""
+        return [row[0] for row in conn.execute("""
+            SELECT id FROM users
+            WHERE id > ? AND is_active = TRUE
+            ORDER BY id
+            LIMIT ?
+        """, (after_id, limit))]
+
+    @staticmethod
+    def _checkpoint(conn, state: Dict, blocked_ids: List[int]):
+        """Persist progress and deactivate blocked users in one transaction"""
+        conn.executemany("UPDATE users SET is_active = FALSE WHERE id = ?", [(uid,) for uid in blocked_ids])
+        conn.execute("""
+            UPDATE broadcasts
+            SET status = ?, last_user_id = ?, resume_ids = ?, sent = ?, failed = ?, blocked = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (state['status'], state['last_user_id'], json.dumps(state['resume_ids']), state['sent'],
+              state['failed'], state['blocked'], state['id']))
+
+    # Event loop side
+
+    async def start(self, admin_id: int, message: str, on_progress: ProgressCallback = None) -> Dict:
+        """Record a new broadcast and start sending it in the background"""
+        state = await self.db_pool.run(self._create, admin_id, message)
+        self._spawn(state, on_progress)
+        return state
+
+    async def resume(self, on_progress_factory: Callable[[Dict], ProgressCallback] = None) -> List[Dict]:
+        """Restart broadcasts interrupted by a shutdown or crash"""
+        states = await self.db_pool.run(self._load_running)
+        for state in states:
+            if state['id'] not in self.tasks:
+                logger.info(f"Resuming broadcast {state['id']} after user {state['last_user_id']}")
+                self._spawn(state, on_progress_factory(state) if on_progress_factory else None)
+        return states
+
+    def cancel(self, broadcast_id: int) -> bool:
+        """Stop a running broadcast after its current page"""
+        if broadcast_id not in self.tasks:
+            return False
+        self._cancelled.add(broadcast_id)
+        return True
+
+    async def stop(self):
+        """Interrupt every broadcast on shutdown; checkpoints let resume() continue later"""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, state: Dict, on_progress: Optional[ProgressCallback]):
+        task = asyncio.create_task(self._run(state, on_progress))
+        self.tasks[state['id']] = task
+        task.add_done_callback(lambda _: self.tasks.pop(state['id'], None))
+
+    async def _run(self, state: Dict, on_progress: Optional[ProgressCallback]):
+        limit = asyncio.Semaphore(self.concurrency)
+        # Bot API calls currently running in dispatcher workers, and the users
+        # they reached; both outlive a cancelled send
+        on_wire: Set[asyncio.Future] = set()
+        reached: Set[int] = set()
+
+        async def deliver(user_id: int) -> str:
+            async with limit:
+                return await self._deliver(user_id, state['message'], on_wire, reached)
+
+        try:
+            while state['id'] not in self._cancelled:
+                # Recipients left unfinished by an interrupted page go first
+                page = state['resume_ids']
+                if not page:
+                    page = await self.db_pool.run(self._next_page, state['last_user_id'], self.page_size)
+                if not page:
+                    state['status'] = 'completed'
+                    break
+
+                reached.clear()
+                sends = [asyncio.ensure_future(deliver(user_id)) for user_id in page]
+                try:
+                    results = await asyncio.gather(*sends)
+                except asyncio.CancelledError:
+                    # Shutting down mid-page: queued sends are dropped, but calls
+                    # already on the wire finish first, then the checkpoint records
+                    # exactly who was reached so resume() messages nobody twice
+                    await asyncio.gather(*sends, return_exceptions=True)
+                    if on_wire:
+                        await asyncio.wait(set(on_wire))
+                    finished = []
+                    for user_id, send in zip(page, sends):
+                        if send.done() and not send.cancelled():
+                            finished.append((user_id, send.result()))
+                        elif user_id in reached:
+                            finished.append((user_id, 'sent'))
+                    blocked_ids = self._tally(state, finished)
+                    done_ids = {user_id for user_id, _ in finished}
+                    state['last_user_id'] = max(state['last_user_id'], page[-1])
+                    state['resume_ids'] = [user_id for user_id in page if user_id not in done_ids]
+                    await self.db_pool.run(self._checkpoint, state, blocked_ids)
+                    raise
+
+                blocked_ids = self._tally(state, list(zip(page, results)))
+                state['last_user_id'] = max(state['last_user_id'], page[-1])
+                state['resume_ids'] = []
+                await self.db_pool.run(self._checkpoint, state, blocked_ids)
+                await self._report(state, on_progress)
+            else:
+                state['status'] = 'cancelled'
+
+            await self.db_pool.run(self._checkpoint, state, [])
+            await self._report(state, on_progress)
+            logger.info(
+                f"Broadcast {state['id']} {state['status']}: {state['sent']} sent, "
+                f"{state['failed']} failed, {state['blocked']} blocked"
+            )
+        except asyncio.CancelledError:
+            # Left 'running' at the last checkpoint so the next start resumes it
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {state['id']} error: {e}")
+        finally:
+            self._cancelled.discard(state['id'])
+
+    @staticmethod
+    def _tally(state: Dict, outcomes: List[Tuple[int, str]]) -> List[int]:
+        """Fold (user_id, result) pairs into the counters; returns the blocked users"""
+        blocked_ids = [user_id for user_id, result in outcomes if result == 'blocked']
+        state['sent'] += sum(1 for _, result in outcomes if result == 'sent')
+        state['failed'] += sum(1 for _, result in outcomes if result == 'failed')
+        state['blocked'] += len(blocked_ids)
+        return blocked_ids
+
+    async def _deliver(self, chat_id: int, text: str, on_wire: Set[asyncio.Future], reached: Set[int]) -> str:
+        """Send one message at broadcast priority: 'sent', 'blocked' or 'failed'"""
+        def attempt() -> asyncio.Future:
+            # Tracked so a shutdown can wait for it and still count its outcome
+            call = asyncio.ensure_future(self.bot.send_message(chat_id, text))
+            on_wire.add(call)
+
+            def settle(_):
+                on_wire.discard(call)
+                if not call.cancelled() and call.exception() is None:
+                    reached.add(chat_id)
+            call.add_done_callback(settle)
+            return call
+
+        try:
+            await self.outbound.send(BROADCAST, chat_id, attempt)
+            return 'sent'
+        except Forbidden:
+            return 'blocked'
+        except BadRequest as e:
+            return 'blocked' if 'chat not found' in str(e).lower() else 'failed'
+        except Exception as e:
+            logger.error(f"Broadcast send to {chat_id} failed: {e}")
+            return 'failed'
+
+    @staticmethod
+    async def _report(state: Dict, on_progress: Optional[ProgressCallback]):
+        if not on_progress:
+            return
+        try:
+            await on_progress(dict(state))
+        except Exception as e:
+            logger.error(f"Broadcast progress report error: {e}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+In-Process Caching for Telegram Bot
+Bounded LRU cache with per-entry TTL and hit/miss accounting
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from config import CACHE_TIMEOUT, MAX_CACHE_SIZE
+
+class LRUCache:
+    """Thread-safe LRU cache capped at max_size entries, each living ttl seconds"""
+
+    def __init__(self, max_size: int = MAX_CACHE_SIZE, ttl: float = CACHE_TIMEOUT, enabled: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; fills that started before an
+        # invalidation are discarded so a stale row can never be re-cached
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def epoch(self) -> int:
+        """Capture before reading the database, pass back to set()"""
+        return self._epoch
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None on miss or expiry"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, epoch: Optional[int] = None):
+        """Store a value; skipped if an invalidation happened since epoch"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: Hashable):
+        """Drop entries after the underlying rows changed"""
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry (after bulk operations)"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0
+            }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Channel Auto-Posting for Telegram Bot
+Persistent queue of channel posts, spaced by CHANNEL_POST_DELAY and retried on failure
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from telegram import InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
+
+from config import (
+    CHANNEL_POST_DELAY, CHANNEL_POST_MAX_ATTEMPTS, CHANNEL_POST_RETRY_DELAY,
+    CHANNEL_POST_LEASE, CHANNEL_POST_POLL_INTERVAL
+)
+from outbound import CHANNEL
+
+logger = logging.getLogger(__name__)
+
+INPUT_MEDIA = {'video': InputMediaVideo, 'photo': InputMediaPhoto, 'document': InputMediaDocument}
+
+class ChannelPoster:
+    """Background worker draining the channel_posts table"""
+
+    # Telegram albums hold 2-10 items and cannot mix documents with photos/videos
+    ALBUM_LIMIT = 10
+
+    def __init__(self, db_pool, bot, outbound, delay: float = CHANNEL_POST_DELAY,
+                 max_attempts: int = CHANNEL_POST_MAX_ATTEMPTS):
+        self.db_pool = db_pool
+        self.bot = bot
+        self.outbound = outbound
+        self.delay = delay
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+
+    # Database side (pool threads)
+
+    @staticmethod
+    def enqueue(conn, content_id: int, chat_id: str, file_id: str, file_type: str, caption: str):
+        """Queue a post inside the caller's transaction (e.g. the upload insert)"""
+        conn.execute("""
+            INSERT INTO channel_posts (content_id, chat_id, file_id, file_type, caption, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (content_id, chat_id, file_id, file_type, caption, time.time()))
+        conn.execute("UPDATE content SET channel_status = 'pending' WHERE id = ?", (content_id,))
+
+    @classmethod
+    def enqueue_album(cls, conn, chat_id: str, items: List[Dict], caption: str):
+        """Queue an album as as few media-group posts as Telegram allows"""
+        documents = [item for item in items if item['file_type'] == 'document']
+        visual = [item for item in items if item['file_type'] != 'document']
+
+        now = time.time()
+        for kind in (visual, documents):
+            for start in range(0, len(kind), cls.ALBUM_LIMIT):
+                chunk = kind[start:start + cls.ALBUM_LIMIT]
+                # A lone leftover item goes out as a regular post
+                file_type = 'album' if len(chunk) > 1 else chunk[0]['file_type']
+                conn.execute("""
+                    INSERT INTO channel_posts
+                        (content_id, chat_id, file_id, file_type, caption, items, next_attempt_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (chunk[0]['content_id'], chat_id, chunk[0]['file_id'], file_type, caption,
+                      json.dumps(chunk) if len(chunk) > 1 else None, now))
+
+        conn.executemany(
+            "UPDATE content SET channel_status = 'pending' WHERE id = ?",
+            [(item['content_id'],) for item in items]
+        )
+
+    @staticmethod
+    def _content_ids(post: Dict) -> List[tuple]:
+        if post['items']:
+            return [(item['content_id'],) for item in post['items']]
+        return [(post['content_id'],)]
+
+    @staticmethod
+    def _claim(conn) -> Optional[Dict]:
+        """Lease the oldest due post; a worker that dies lets the lease expire"""
+        now = time.time()
+        row = conn.execute("""
+            UPDATE channel_posts
+            SET attempts = attempts + 1, next_attempt_at = ?
+            WHERE id = (
+                SELECT id FROM channel_posts
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id
+                LIMIT 1
+            )
+            RETURNING id, content_id, chat_id, file_id, file_type, caption, items, attempts
+        """, (now + CHANNEL_POST_LEASE, now)).fetchone()
+        if not row:
+            return None
+        columns = ('id', 'content_id', 'chat_id', 'file_id', 'file_type', 'caption', 'items', 'attempts')
+        post = dict(zip(columns, row))
+        post['items'] = json.loads(post['items']) if post['items'] else None
+        return post
+
+    @classmethod
+    def _mark_posted(cls, conn, post: Dict, message_id: int):
+        conn.execute("""
+            UPDATE channel_posts SET status = 'posted', last_error = NULL, posted_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (post['id'],))
+        conn.executemany("""
+            UPDATE content
+            SET channel_status = 'posted', channel_message_id = ?, channel_posted_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(message_id, content_id) for content_id, in cls._content_ids(post)])
+
+    @classmethod
+    def _mark_failed(cls, conn, post: Dict, error: str, retry_at: Optional[float]):
+        """Schedule a retry, or give up when retry_at is None"""
+        if retry_at is not None:
+            conn.execute("""
+                UPDATE channel_posts SET next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            """, (retry_at, error, post['id']))
+            return
+
+        conn.execute("UPDATE channel_posts SET status = 'failed', last_error = ? WHERE id = ?", (error, post['id']))
+        conn.executemany("UPDATE content SET channel_status = 'failed' WHERE id = ?", cls._content_ids(post))
+
+    # Event loop side
+
+    def wake(self):
+        """Post newly queued uploads without waiting for the next poll"""
+        self._wakeup.set()
+
+    async def run(self):
+        """Worker loop; start as a background task"""
+        while True:
+            try:
+                post = await self.db_pool.run(self._claim)
+            except Exception as e:
+                logger.error(f"Channel post claim error: {e}")
+                post = None
+
+            if post:
+                await self._post(post)
+                # Spacing between channel posts, even when many are queued
+                await asyncio.sleep(self.delay)
+                continue
+
+            timer = asyncio.get_running_loop().call_later(CHANNEL_POST_POLL_INTERVAL, self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+            self._wakeup.clear()
+
+    async def _post(self, post: Dict):
+        try:
+            if post['items']:
+                media = [
+                    INPUT_MEDIA[item['file_type']](
+                        item['file_id'],
+                        caption=post['caption'] if index == 0 else None,
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                    for index, item in enumerate(post['items'])
+                ]
+                messages = await self.outbound.send(
+                    CHANNEL, post['chat_id'], lambda: self.bot.send_media_group(post['chat_id'], media)
+                )
+                message = messages[0]
+            else:
+                message = await self.outbound.send_media(
+                    CHANNEL, post['chat_id'], self.bot, post['file_type'], post['file_id'],
+                    caption=post['caption'], parse_mode=ParseMode.MARKDOWN
+                )
+        except Exception as e:
+            # Bad file ids or a bot removed from the channel will not fix themselves
+            permanent = isinstance(e, (BadRequest, Forbidden))
+            retry_at = None
+            if not permanent and post['attempts'] < self.max_attempts:
+                retry_at = time.time() + CHANNEL_POST_RETRY_DELAY * 2 ** (post['attempts'] - 1)
+            logger.error(f"Channel post for content {post['content_id']} failed (attempt {post['attempts']}): {e}")
+            await self.db_pool.run(self._mark_failed, post, str(e)[:500], retry_at)
+            return
+
+        await self.db_pool.run(self._mark_posted, post, message.message_id)
+        logger.info(f"Posted content {post['content_id']} to {post['chat_id']}")
@@ -4,6 +4,7 @@ Complete settings for token-based video system with enhanced features
 """
 
 import os
+import re
 from pathlib import Path
 
 # ================================
@@ -39,7 +40,11 @@ CHANNEL_ID = os.getenv("CHANNEL_ID", "@eighteenplusdrops")
 
 # Channel posting settings
 AUTO_POST_TO_CHANNEL = True
-CHANNEL_POST_DELAY = 5  # seconds
+CHANNEL_POST_DELAY = 5  # seconds between consecutive channel posts
+CHANNEL_POST_MAX_ATTEMPTS = 5
+CHANNEL_POST_RETRY_DELAY = 30  # seconds, doubled per failed attempt
+CHANNEL_POST_LEASE = 300  # seconds before a post claimed by a dead worker is retried
+CHANNEL_POST_POLL_INTERVAL = 30  # seconds between queue checks when idle
 
 # ================================
 # PAYMENT CONFIGURATION
@@ -80,6 +85,7 @@ WELCOME_BONUS = 1  # Free tokens for new users
 TOKEN_TO_VIDEO_RATIO = 1  # 1 token = 1 video unlock
 MIN_TOKENS_FOR_REDEMPTION = 1
 MAX_TOKENS_PER_USER = 1000  # Anti-abuse measure
+BULK_TOKEN_CHUNK_SIZE = 5000  # Users updated per bulk token transaction
 
 # ================================
 # DATABASE CONFIGURATION
@@ -98,6 +104,15 @@ BACKUP_DIRECTORY = "backups"
 AUTO_VACUUM = True
 WAL_MODE = True  # Write-Ahead Logging for better performance
 
+# Connection tuning (applied to every connection)
+DB_CACHE_SIZE_KB = 64 * 1024  # Page cache per connection (64MB)
+DB_MMAP_SIZE = 256 * 1024 * 1024  # Memory-mapped I/O window (256MB)
+DB_BUSY_TIMEOUT_MS = 5000  # Wait this long for a lock before failing
+
+# Schema migrations (large tables are backfilled in short chunks)
+MIGRATION_CHUNK_SIZE = 5000  # Rows per backfill transaction
+MIGRATION_CHUNK_PAUSE = 0.05  # Seconds to yield the write lock between chunks
+
 # ================================
 # SECURITY CONFIGURATION
 # ================================
@@ -108,6 +123,10 @@ MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB in bytes
 ALLOWED_VIDEO_FORMATS = ['.mp4', '.avi', '.mkv', '.mov', '.wmv']
 ALLOWED_IMAGE_FORMATS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
 
+# Album uploads: parts arrive as separate updates; the album is ingested once
+# no new part has arrived for this long
+MEDIA_GROUP_WAIT = 1.5  # seconds
+
 # Content moderation
 ENABLE_CONTENT_MODERATION = True
 AUTO_DELETE_INAPPROPRIATE_CONTENT = False
@@ -130,6 +149,14 @@ MAX_REFERRALS_PER_DAY = 20
 COMMAND_COOLDOWN = 2  # seconds between commands
 REDEMPTION_COOLDOWN = 5  # seconds between redemptions
 
+# Limiter state for users idle this long is dropped
+RATE_LIMIT_IDLE_TTL = 3600  # seconds
+
+# Quota storage: "memory" (this process only) or "sqlite" (shared by all
+# bot processes on the same database and kept across restarts)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_FLUSH_INTERVAL = 1.0  # seconds between batched counter writes
+
 # Anti-spam measures
 MAX_IDENTICAL_MESSAGES = 3
 SPAM_DETECTION_WINDOW = 60  # seconds
@@ -153,6 +180,11 @@ LOG_TRANSACTIONS = True
 LOG_ERRORS = True
 LOG_PERFORMANCE = False
 
+# Database audit rows (logs, admin_actions) are written behind in batches
+LOG_FLUSH_INTERVAL = 0.5  # seconds
+LOG_BATCH_SIZE = 500  # rows per transaction
+LOG_QUEUE_SIZE = 10000  # pending rows before callers wait for the writer
+
 # ================================
 # FEATURE FLAGS
 # ================================
@@ -182,14 +214,28 @@ ENABLE_SUBSCRIPTION_TIERS = False
 ENABLE_USER_CACHE = True
 CACHE_TIMEOUT = 300  # 5 minutes
 MAX_CACHE_SIZE = 1000
+CACHE_GENERATION_POLL_INTERVAL = 2  # Seconds between checks for out-of-process invalidations
 
 # Database connection pooling
 DB_POOL_SIZE = 5
 DB_POOL_TIMEOUT = 30
 
 # Async settings
-MAX_CONCURRENT_REQUESTS = 100
-REQUEST_TIMEOUT = 30
+MAX_CONCURRENT_REQUESTS = 100  # updates processed in parallel
+REQUEST_TIMEOUT = 30  # seconds before a handler is cancelled
+USER_LANE_MAX_PENDING = 5  # queued updates per user; extras are dropped
+
+# Outbound sends (Telegram allows ~30 msg/s per bot, ~1/s per private chat,
+# ~20/min per group or channel)
+OUTBOUND_RATE = 30  # messages per second, all chats
+OUTBOUND_WORKERS = 8  # concurrent Bot API calls
+OUTBOUND_MAX_RETRIES = 5  # for flood control and network errors
+OUTBOUND_BACKOFF_BASE = 1.0  # seconds, doubled per attempt with jitter
+OUTBOUND_BACKOFF_MAX = 30.0  # seconds
+OUTBOUND_PRIVATE_CHAT_INTERVAL = 1.0  # seconds between messages to one user
+OUTBOUND_GROUP_CHAT_INTERVAL = 3.0  # seconds between messages to one group/channel
+OUTBOUND_DELIVERY_TIMEOUT = 20  # seconds an unlock waits for delivery before refunding
+UNLOCK_COMPLETION_RETRY_INTERVAL = 10  # seconds between retries of delivered unlocks not yet recorded
 
 # ================================
 # NOTIFICATION CONFIGURATION
@@ -206,6 +252,11 @@ WELCOME_MESSAGE_ENABLED = True
 LOYALTY_BONUS_NOTIFICATION = True
 REFERRAL_SUCCESS_NOTIFICATION = True
 
+# Broadcasts (paced by the outbound dispatcher below)
+BROADCAST_PAGE_SIZE = 200  # recipients per keyset page / checkpoint
+BROADCAST_CONCURRENCY = 10  # sends queued at once
+BROADCAST_PROGRESS_INTERVAL = 5  # seconds between progress updates to the admin
+
 # ================================
 # CONTENT MANAGEMENT
 # ================================
@@ -216,6 +267,9 @@ ENABLE_CONTENT_PREVIEW = True
 CONTENT_DESCRIPTION_MAX_LENGTH = 500
 
 # Content discovery
+CONTENT_PAGE_SIZE = 10  # Items per browse/category page
+CONTENT_CATALOG_REFRESH_INTERVAL = 60  # Seconds between catalog refreshes
+VIEW_FLUSH_INTERVAL = 5  # Seconds between batched view count writes
 ENABLE_SEARCH = False  # Future feature
 ENABLE_RECOMMENDATIONS = False  # Future feature
 TRENDING_CONTENT_DAYS = 7
@@ -239,6 +293,14 @@ ANALYTICS_RETENTION_DAYS = 365
 LOG_RETENTION_DAYS = 90
 SESSION_RETENTION_DAYS = 30
 
+# CSV exports are streamed from the cursor in batches
+EXPORT_BATCH_SIZE = 1000  # Rows fetched per cursor.fetchmany()
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024  # /export keeps files up to this size in memory
+
+# Leaderboards
+LEADERBOARD_SIZE = 100  # Top users kept per metric snapshot
+LEADERBOARD_REFRESH_INTERVAL = 300  # Seconds between snapshot refreshes
+
 # ================================
 # API CONFIGURATION
 # ================================
@@ -248,10 +310,16 @@ ENABLE_EXTERNAL_APIS = False
 API_RATE_LIMIT = 100  # requests per hour
 API_TIMEOUT = 10  # seconds
 
-# Webhook configuration
-WEBHOOK_ENABLED = False
-WEBHOOK_URL = ""
-WEBHOOK_SECRET = ""
+# Webhook configuration (replaces polling when enabled)
+WEBHOOK_ENABLED = os.getenv("WEBHOOK_ENABLED", "false").lower() == "true"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public HTTPS base URL Telegram posts to
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # 1-256 chars: A-Z, a-z, 0-9, _ and -
+
+# Local listener behind the TLS-terminating proxy / load balancer
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_MAX_CONNECTIONS = 40  # Parallel deliveries Telegram may open
 
 # ================================
 # MAINTENANCE CONFIGURATION
@@ -262,6 +330,8 @@ AUTO_CLEANUP_ENABLED = True
 CLEANUP_SCHEDULE = "daily"  # daily, weekly, monthly
 CLEANUP_OLD_LOGS = True
 CLEANUP_INACTIVE_SESSIONS = True
+CLEANUP_CHUNK_SIZE = 1000  # Inactive users deleted per write transaction
+CLEANUP_CHUNK_PAUSE = 0.05  # Seconds to yield the write lock between chunks
 
 # Maintenance mode
 MAINTENANCE_MODE = False
@@ -303,6 +373,17 @@ MOCK_PAYMENTS = DEBUG_MODE
 # ENVIRONMENT VALIDATION
 # ================================
 
+def validate_webhook_config():
+    """Errors that make webhook mode unsafe to start"""
+    errors = []
+    
+    if not WEBHOOK_URL.startswith("https://"):
+        errors.append("WEBHOOK_URL must be a public https:// URL when webhooks are enabled")
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+        errors.append("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ or -")
+    
+    return errors
+
 def validate_config():
     """Validate critical configuration values"""
     errors = []
@@ -316,6 +397,9 @@ def validate_config():
     if UPI_ID == "yourupi@upi":
         errors.append("UPI_ID should be configured with actual UPI ID")
     
+    if WEBHOOK_ENABLED:
+        errors.extend(validate_webhook_config())
+    
     if not Path(BACKUP_DIRECTORY).exists() and AUTO_BACKUP:
         Path(BACKUP_DIRECTORY).mkdir(exist_ok=True)
     
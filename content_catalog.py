@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+In-Memory Content Catalog for Telegram Bot
+Active content indexed by id and category, newest first, refreshed incrementally
+"""
+
+import bisect
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATALOG_COLUMNS = ('id', 'file_id', 'file_type', 'caption', 'category', 'views', 'uploaded_on')
+CHANGE_BATCH = 1000  # content_changes rows read per query
+
+class ContentCatalog:
+    """Process-local view of active content so browsing never touches the database"""
+
+    def __init__(self):
+        self.items: Dict[int, Dict] = {}
+        # (uploaded_on, id) ascending; newest items live at the end
+        self._order: List[tuple] = []
+        self._categories: Dict[str, List[tuple]] = {}
+        self.max_id = 0
+        # Last content_changes row applied
+        self.change_seq = 0
+
+    @staticmethod
+    def fetch(conn, since_id: int = 0) -> List[tuple]:
+        """Read active rows with id > since_id (runs on a pool thread)"""
+        return conn.execute("""
+            SELECT id, file_id, file_type, caption, category, views, uploaded_on
+            FROM content
+            WHERE id > ? AND is_active = TRUE
+            ORDER BY id
+        """, (since_id,)).fetchall()
+
+    @staticmethod
+    def fetch_change_seq(conn) -> int:
+        """Latest content_changes sequence number (runs on a pool thread)"""
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM content_changes").fetchone()[0]
+
+    @staticmethod
+    def fetch_changes(conn, since_seq: int, limit: int = CHANGE_BATCH) -> List[tuple]:
+        """Content activated, deactivated or deleted after since_seq, with its
+        current row (runs on a pool thread; a range scan of content_changes)"""
+        return conn.execute("""
+            SELECT changes.seq, content.is_active, content.id, content.file_id, content.file_type,
+                   content.caption, content.category, content.views, content.uploaded_on,
+                   changes.content_id
+            FROM content_changes AS changes
+            LEFT JOIN content ON content.id = changes.content_id
+            WHERE changes.seq > ?
+            ORDER BY changes.seq
+            LIMIT ?
+        """, (since_seq, limit)).fetchall()
+
+    def load(self, rows: List[tuple], change_seq: int = 0):
+        """Replace the catalog with a full fetch() taken after fetch_change_seq()"""
+        self.items.clear()
+        self._order.clear()
+        self._categories.clear()
+        self.max_id = 0
+        self.change_seq = change_seq
+        self.merge(rows)
+        logger.info(f"Content catalog loaded: {len(self.items)} items")
+
+    def merge(self, rows: List[tuple]) -> int:
+        """Add rows from an incremental fetch(conn, catalog.max_id)"""
+        for row in rows:
+            self.add(dict(zip(CATALOG_COLUMNS, row)))
+        return len(rows)
+
+    def apply_changes(self, changes: List[tuple]) -> Tuple[int, int]:
+        """Apply a fetch_changes() batch; returns (reactivated, deactivated)"""
+        added = removed = 0
+        for seq, is_active, *row, content_id in changes:
+            self.change_seq = max(self.change_seq, seq)
+            if is_active:
+                # Ids above max_id are still due from the next incremental fetch()
+                if content_id <= self.max_id and content_id not in self.items:
+                    self.add(dict(zip(CATALOG_COLUMNS, row)))
+                    added += 1
+            elif content_id in self.items:
+                self.remove(content_id)
+                removed += 1
+        return added, removed
+
+    def add(self, item: Dict):
+        """Insert or replace one active item"""
+        if item['id'] in self.items:
+            self.remove(item['id'])
+
+        item['category'] = item.get('category') or "General"
+        key = (item['uploaded_on'], item['id'])
+
+        self.items[item['id']] = item
+        bisect.insort(self._order, key)
+        bisect.insort(self._categories.setdefault(item['category'], []), key)
+        self.max_id = max(self.max_id, item['id'])
+
+    def remove(self, content_id: int):
+        """Drop a deactivated item"""
+        item = self.items.pop(content_id, None)
+        if not item:
+            return
+
+        key = (item['uploaded_on'], item['id'])
+        self._discard(self._order, key)
+
+        bucket = self._categories.get(item['category'], [])
+        self._discard(bucket, key)
+        if not bucket:
+            self._categories.pop(item['category'], None)
+
+    @staticmethod
+    def _discard(keys: List[tuple], key: tuple):
+        index = bisect.bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+
+    def get(self, content_id: int) -> Optional[Dict]:
+        return self.items.get(content_id)
+
+    def latest(self, limit: int = 20, category: str = None) -> List[Dict]:
+        """Newest items first, optionally restricted to one category"""
+        keys = self._order if category is None else self._categories.get(category, [])
+        return [self.items[content_id] for _, content_id in reversed(keys[-limit:])]
+
+    def category_counts(self) -> Dict[str, int]:
+        return {category: len(keys) for category, keys in self._categories.items()}
+
+    def record_view(self, content_id: int):
+        item = self.items.get(content_id)
+        if item:
+            item['views'] += 1
+
+    def __len__(self) -> int:
+        return len(self.items)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Streaming CSV Export for Telegram Bot
+Writes query results in fetchmany batches, optionally gzipped, with incremental watermarks
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from config import EXPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# kind -> (full query, incremental query, CSV header, watermark column positions)
+EXPORTS: Dict[str, Tuple[str, str, list, tuple]] = {
+    'users': (
+        "export_users", "export_users_since",
+        ['id', 'username', 'first_name', 'last_name', 'tokens',
+         'redemptions', 'referral_by', 'joined_on', 'is_active', 'total_spent'],
+        (7, 0),  # (joined_on, id)
+    ),
+    'content': (
+        "export_content", "export_content_since",
+        ['id', 'file_id', 'file_type', 'caption', 'category',
+         'views', 'uploaded_by', 'uploaded_on', 'is_active'],
+        (0,),  # id
+    ),
+}
+
+class CsvExporter:
+    """Streams an export query into a binary file object with constant memory"""
+
+    def __init__(self, db, batch_size: int = EXPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+
+    def load_watermark(self, conn, kind: str) -> Optional[list]:
+        row = self.db.execute(conn, "get_export_watermark", (kind,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_watermark(self, conn, kind: str, watermark: list, rows: int):
+        """Advance the watermark; call only once the export was delivered"""
+        self.db.execute(conn, "save_export_watermark", (kind, json.dumps(watermark), rows))
+
+    def write(self, conn, kind: str, output: BinaryIO, compress: bool = False,
+              since_last: bool = False) -> Tuple[int, Optional[list]]:
+        """Write the CSV to output; returns (rows written, watermark of the last row)"""
+        full_query, since_query, fieldnames, watermark_columns = EXPORTS[kind]
+
+        watermark = self.load_watermark(conn, kind) if since_last else None
+        if watermark is not None:
+            cursor = self.db.execute(conn, since_query, watermark)
+        else:
+            cursor = self.db.execute(conn, full_query)
+
+        # Close the wrappers but leave the caller's file object open
+        raw = gzip.GzipFile(fileobj=output, mode='wb') if compress else output
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='', write_through=True)
+        try:
+            writer = csv.writer(text)
+            writer.writerow(fieldnames)
+
+            rows = 0
+            last_row = None
+            while True:
+                batch = cursor.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                writer.writerows(batch)
+                rows += len(batch)
+                last_row = batch[-1]
+        finally:
+            text.detach()
+            if compress:
+                raw.close()
+            cursor.close()
+
+        if last_row is not None:
+            watermark = [last_row[column] for column in watermark_columns]
+        return rows, watermark
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Database Setup and Storage Engine for Telegram Bot
+Owns connection tuning (WAL, pragmas), schema migration on startup and the named query registry
+"""
+
+import sqlite3
+import logging
+from typing import Dict, List, Sequence
+
+from config import (
+    DATABASE_FILE, WAL_MODE, AUTO_VACUUM, DB_POOL_TIMEOUT,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS
+)
+from migrations import MigrationRunner
+
+logger = logging.getLogger(__name__)
+
+# ================================
+# NAMED QUERY REGISTRY
+# ================================
+
+# Every hot statement lives here under a stable name. Callers always pass the
+# exact same SQL text, so each pooled connection compiles it once and reuses
+# the prepared statement from its statement cache afterwards.
+#
+# Date filters are written as half-open ranges on the raw column
+# (col >= start AND col < end) rather than DATE(col) = ..., so SQLite can
+# seek the matching index instead of evaluating DATE() on every row.
+QUERIES: Dict[str, str] = {
+    # Users
+    "insert_user": """
+        INSERT INTO users (id, username, first_name, last_name, referral_by)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "add_tokens": "UPDATE users SET tokens = tokens + ? WHERE id = ?",
+    # A returning user has unblocked the bot, so broadcasts reach them again
+    "touch_user": "UPDATE users SET last_activity = CURRENT_TIMESTAMP, is_active = TRUE WHERE id = ?",
+    "get_tokens": "SELECT tokens FROM users WHERE id = ?",
+    "get_balance": "SELECT tokens, redemptions FROM users WHERE id = ?",
+    "get_wallet": """
+        SELECT tokens, redemptions, joined_on, total_spent, loyalty_points
+        FROM users WHERE id = ?
+    """,
+    # Conditional deduction: no row comes back when the balance is empty.
+    # The loyalty bonus for the milestone redemption is folded into the same write.
+    "redeem_token": """
+        UPDATE users
+        SET tokens = tokens - 1 + CASE WHEN (redemptions + 1) % ? = 0 THEN ? ELSE 0 END,
+            redemptions = redemptions + 1
+        WHERE id = ? AND tokens >= 1
+        RETURNING tokens, redemptions
+    """,
+    # Token returned minus the loyalty bonus of a milestone the refund drops below
+    "refund_token": "UPDATE users SET tokens = tokens + 1 - ?, redemptions = redemptions - 1 WHERE id = ?",
+
+    # Token ledger
+    "insert_transaction": """
+        INSERT INTO token_transactions (user_id, amount, transaction_type, description, content_id)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "recent_transactions": """
+        SELECT transaction_type, amount, description, timestamp
+        FROM token_transactions
+        WHERE user_id = ?
+        ORDER BY timestamp DESC
+        LIMIT 5
+    """,
+
+    # Unlock reservations (idempotency key: callback query id)
+    "get_reservation": """
+        SELECT state, tokens_after, redemptions_after, loyalty_awarded
+        FROM unlock_reservations WHERE query_id = ?
+    """,
+    "insert_reservation": """
+        INSERT INTO unlock_reservations
+            (query_id, user_id, content_id, tokens_after, redemptions_after, loyalty_awarded)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "transition_reservation": """
+        UPDATE unlock_reservations SET state = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE query_id = ? AND state = 'reserved'
+    """,
+
+    # Referrals
+    "insert_referral": """
+        INSERT INTO referrals (referrer_id, referred_id, bonus_amount)
+        VALUES (?, ?, ?)
+    """,
+    # Per-referrer totals live on the user row (migration 15)
+    "count_referrals": "SELECT referral_count FROM users WHERE id = ?",
+    "referral_stats": """
+        SELECT referral_count as total_referrals, referral_earned as total_earned
+        FROM users WHERE id = ?
+    """,
+    "get_referral_counters": """
+        SELECT referral_earned,
+               CASE WHEN referral_day = DATE('now') THEN referrals_today ELSE 0 END as referrals_today
+        FROM users WHERE id = ?
+    """,
+    "credit_referral": """
+        UPDATE users
+        SET tokens = tokens + ?,
+            referral_earned = referral_earned + ?,
+            referral_count = referral_count + 1,
+            referrals_today = ?,
+            referral_day = DATE('now')
+        WHERE id = ?
+    """,
+    "recent_referrals": """
+        SELECT u.first_name, u.username, r.referred_on, r.bonus_amount
+        FROM referrals r
+        JOIN users u ON r.referred_id = u.id
+        WHERE r.referrer_id = ?
+        ORDER BY r.referred_on DESC
+        LIMIT 5
+    """,
+
+    # Content
+    "is_content_active": "SELECT is_active FROM content WHERE id = ?",
+    "insert_content": """
+        INSERT INTO content (file_id, file_type, caption, uploaded_by, file_size, category, uploaded_on)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+
+    # Logging
+    "insert_log": """
+        INSERT INTO logs (log_type, message, user_id, content_id, severity)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "insert_admin_action": """
+        INSERT INTO admin_actions (admin_id, action_type, details)
+        VALUES (?, ?, ?)
+    """,
+
+    # Cross-process cache invalidation (migration 16)
+    "get_cache_generation": "SELECT generation FROM cache_generations WHERE name = ?",
+    "bump_cache_generation": "UPDATE cache_generations SET generation = generation + 1 WHERE name = ?",
+
+    # Dashboard: trigger-maintained counters (migration 13) and today's
+    # rollup rows, so none of these depends on table size
+    "get_stats_counters": "SELECT name, value FROM stats_counters",
+    "count_users": "SELECT value as total_users FROM stats_counters WHERE name = 'users'",
+    "count_active_content": "SELECT value as total_content FROM stats_counters WHERE name = 'active_content'",
+    "count_transactions_today": """
+        SELECT COALESCE(SUM(transactions), 0) FROM daily_transaction_stats
+        WHERE day = DATE('now')
+    """,
+    "sum_tokens": "SELECT value as total_tokens FROM stats_counters WHERE name = 'tokens'",
+    "count_daily_active_users": """
+        SELECT COALESCE(SUM(active_users), 0) FROM daily_user_stats
+        WHERE day = DATE('now')
+    """,
+    "count_recent_errors": """
+        SELECT COUNT(*) FROM logs
+        WHERE log_type = 'error'
+        AND timestamp >= datetime('now', '-24 hours')
+    """,
+
+    # Analytics: users (every headline number from counters and rollups)
+    "user_summary": """
+        SELECT (SELECT value FROM stats_counters WHERE name = 'users') as total_users,
+               (SELECT value FROM stats_counters WHERE name = 'active_users') as active_users,
+               (SELECT value FROM stats_counters WHERE name = 'tokens') as total_tokens,
+               (SELECT COALESCE(SUM(new_users), 0) FROM daily_user_stats
+                WHERE day >= DATE('now', '-' || ? || ' days')) as new_users
+    """,
+    # Top lists read the leaderboard snapshots (migration 14), with current names
+    "leaderboard_top": """
+        SELECT l.rank, u.id, u.username, u.first_name, l.score, l.detail
+        FROM leaderboard_entries l
+        JOIN users u ON u.id = l.user_id
+        WHERE l.metric = ?
+        ORDER BY l.position
+        LIMIT ?
+    """,
+    # Daily charts read the trigger-maintained rollups (migration 12)
+    "daily_activity": """
+        SELECT day as date, active_users
+        FROM daily_user_stats
+        WHERE day >= DATE('now', '-' || ? || ' days') AND active_users > 0
+        ORDER BY day DESC
+    """,
+
+    # Analytics: content (totals, per-type and per-category figures are
+    # folded from this single grouped pass)
+    "content_breakdown": """
+        SELECT category, file_type, COUNT(*) as count, COALESCE(SUM(views), 0) as total_views
+        FROM content
+        WHERE is_active = TRUE
+        GROUP BY category, file_type
+    """,
+    "top_content": """
+        SELECT id, caption, views, file_type, uploaded_on
+        FROM content
+        WHERE is_active = TRUE
+        ORDER BY views DESC
+        LIMIT 10
+    """,
+    "daily_unlocks": """
+        SELECT day as date, SUM(unlocks) as unlocks
+        FROM daily_content_unlocks
+        WHERE day >= DATE('now', '-' || ? || ' days')
+        GROUP BY day
+        HAVING SUM(unlocks) > 0
+        ORDER BY day DESC
+    """,
+    "top_unlocked_content": """
+        SELECT u.content_id as id, c.caption, c.file_type, SUM(u.unlocks) as unlocks
+        FROM daily_content_unlocks u
+        JOIN content c ON c.id = u.content_id
+        WHERE u.day >= DATE('now', '-' || ? || ' days')
+        GROUP BY u.content_id
+        HAVING SUM(u.unlocks) > 0
+        ORDER BY unlocks DESC
+        LIMIT 10
+    """,
+    "recent_uploads": """
+        SELECT id, caption, views, file_type, uploaded_on, uploaded_by
+        FROM content
+        WHERE is_active = TRUE
+        ORDER BY uploaded_on DESC
+        LIMIT 10
+    """,
+
+    # Analytics: finance
+    "transaction_summary": """
+        SELECT transaction_type, SUM(transactions) as count, SUM(total_amount) as total_amount
+        FROM daily_transaction_stats
+        GROUP BY transaction_type
+        HAVING SUM(transactions) > 0
+    """,
+    "daily_transactions": """
+        SELECT day as date,
+               SUM(transactions) as transaction_count,
+               SUM(tokens_added) as tokens_added,
+               SUM(tokens_spent) as tokens_spent
+        FROM daily_transaction_stats
+        WHERE day >= DATE('now', '-' || ? || ' days')
+        GROUP BY day
+        HAVING SUM(transactions) > 0
+        ORDER BY day DESC
+    """,
+
+    # Analytics: referrals
+    # Program totals from counters, rollups and the referrals leaderboard
+    "referral_totals": """
+        SELECT (SELECT value FROM stats_counters WHERE name = 'referrals') as total_referrals,
+               (SELECT COALESCE(SUM(bonuses), 0) FROM daily_referral_stats) as total_bonuses,
+               (SELECT COALESCE(MAX(population), 0) FROM leaderboard_meta
+                WHERE metric = 'referrals') as active_referrers
+    """,
+    "daily_referrals": """
+        SELECT day as date, referrals
+        FROM daily_referral_stats
+        WHERE day >= DATE('now', '-' || ? || ' days') AND referrals > 0
+        ORDER BY day DESC
+    """,
+
+    # Exports
+    # Exports walk an index in ascending order so they stream without a sort
+    # and the last row written is the watermark for the next incremental run
+    "export_users": """
+        SELECT id, username, first_name, last_name, tokens, redemptions,
+               referral_by, joined_on, is_active, total_spent
+        FROM users
+        ORDER BY joined_on, id
+    """,
+    "export_users_since": """
+        SELECT id, username, first_name, last_name, tokens, redemptions,
+               referral_by, joined_on, is_active, total_spent
+        FROM users
+        WHERE (joined_on, id) > (?, ?)
+        ORDER BY joined_on, id
+    """,
+    "export_content": """
+        SELECT id, file_id, file_type, caption, category, views,
+               uploaded_by, uploaded_on, is_active
+        FROM content
+        ORDER BY id
+    """,
+    "export_content_since": """
+        SELECT id, file_id, file_type, caption, category, views,
+               uploaded_by, uploaded_on, is_active
+        FROM content
+        WHERE id > ?
+        ORDER BY id
+    """,
+    "get_export_watermark": "SELECT watermark FROM export_watermarks WHERE name = ?",
+    "save_export_watermark": """
+        INSERT INTO export_watermarks (name, watermark, rows, exported_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(name) DO UPDATE SET
+            watermark = excluded.watermark, rows = excluded.rows, exported_at = excluded.exported_at
+    """,
+}
+
+class DatabaseManager:
+    """Schema owner and connection factory for the bot database"""
+
+    def __init__(self, db_file: str = DATABASE_FILE, migrate: bool = True):
+        self.db_file = db_file
+        self.queries = QUERIES
+        if migrate:
+            self.create_tables()
+
+    def connect(self, check_same_thread: bool = False) -> sqlite3.Connection:
+        """Open a tuned connection with a statement cache sized for the registry"""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=DB_POOL_TIMEOUT,
+            check_same_thread=check_same_thread,
+            cached_statements=max(128, len(self.queries) * 2)
+        )
+        self.apply_pragmas(conn)
+        return conn
+
+    def apply_pragmas(self, conn: sqlite3.Connection):
+        """Apply per-connection performance pragmas"""
+        cursor = conn.cursor()
+        if WAL_MODE:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode and skips
+        # the fsync on every commit
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    def create_tables(self):
+        """Bring the schema up to date by applying pending migrations"""
+        if AUTO_VACUUM:
+            # Only takes effect on a fresh database, so it must run before
+            # journal_mode=WAL writes the first page
+            conn = sqlite3.connect(self.db_file, timeout=DB_POOL_TIMEOUT)
+            try:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            finally:
+                conn.close()
+
+        MigrationRunner(self.connect).migrate()
+        logger.info(f"Database schema ready: {self.db_file}")
+
+    @staticmethod
+    def begin_immediate(conn: sqlite3.Connection):
+        """Take the write lock up front so a read-then-write transaction cannot interleave"""
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+    def query(self, name: str) -> str:
+        """Look up a registered query by name"""
+        return self.queries[name]
+
+    def execute(self, conn: sqlite3.Connection, name: str, params: Sequence = ()) -> sqlite3.Cursor:
+        """Execute a registered query on the given connection"""
+        return conn.execute(self.queries[name], params)
+
+    def executemany(self, conn: sqlite3.Connection, name: str, rows: List[Sequence]) -> sqlite3.Cursor:
+        """Execute a registered query for many parameter rows"""
+        return conn.executemany(self.queries[name], rows)
+
+    def incremental_vacuum(self, pages: int = 1000):
+        """Return free pages to the OS when auto_vacuum is INCREMENTAL"""
+        if not AUTO_VACUUM:
+            return
+        conn = self.connect(check_same_thread=True)
+        try:
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    DatabaseManager(DATABASE_FILE)
+    print(f"Database initialized: {DATABASE_FILE}")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Async Database Connection Pool for Telegram Bot
+Runs SQLite work on dedicated worker threads with long-lived connections
+"""
+
+import sqlite3
+import asyncio
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional, Sequence
+
+from config import DATABASE_FILE, DB_POOL_SIZE, DB_POOL_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT"""
+
+class AsyncConnectionPool:
+    """Fixed-size pool of SQLite connections served from off-loop worker threads"""
+
+    def __init__(self, db_file: str = DATABASE_FILE, pool_size: int = DB_POOL_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT, connect: Optional[Callable] = None):
+        self.db_file = db_file
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self._connect = connect or self._default_connect
+        self._connections = queue.Queue(maxsize=self.pool_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.pool_size,
+            thread_name_prefix="db-pool"
+        )
+        self._closed = False
+
+        for _ in range(self.pool_size):
+            self._connections.put(self._connect())
+
+        logger.info(f"Database pool ready: {self.pool_size} connections to {db_file}")
+
+    def _default_connect(self) -> sqlite3.Connection:
+        """Open a connection usable from any pool worker thread"""
+        return sqlite3.connect(
+            self.db_file,
+            timeout=self.timeout,
+            check_same_thread=False
+        )
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error"""
+        if self._closed:
+            raise RuntimeError("Database pool is closed")
+
+        try:
+            conn = self._connections.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._connections.put(conn)
+
+    def _call(self, func: Callable, args: Sequence) -> Any:
+        with self.connection() as conn:
+            return func(conn, *args)
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run func(conn, *args) on a pool thread inside a single transaction"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """Execute a write statement and return the affected row count"""
+        def _execute(conn):
+            return conn.execute(sql, params).rowcount
+        return await self.run(_execute)
+
+    async def executemany(self, sql: str, rows: List[Sequence]) -> int:
+        """Execute a statement for many parameter rows in one transaction"""
+        def _executemany(conn):
+            return conn.executemany(sql, rows).rowcount
+        return await self.run(_executemany)
+
+    async def fetchone(self, sql: str, params: Sequence = ()) -> Optional[tuple]:
+        """Fetch a single row"""
+        def _fetchone(conn):
+            return conn.execute(sql, params).fetchone()
+        return await self.run(_fetchone)
+
+    async def fetchall(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        """Fetch all rows"""
+        def _fetchall(conn):
+            return conn.execute(sql, params).fetchall()
+        return await self.run(_fetchall)
+
+    def close(self):
+        """Shut down worker threads and close every pooled connection"""
+        if self._closed:
+            return
+
+        self._closed = True
+        self._executor.shutdown(wait=True)
+
+        while True:
+            try:
+                conn = self._connections.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error closing pooled connection: {e}")
+
+        logger.info("Database pool closed")
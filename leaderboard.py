@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Leaderboards for Telegram Bot
+Periodically refreshed top-K snapshots and score histograms, served from memory
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import LEADERBOARD_SIZE, LEADERBOARD_REFRESH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# metric -> (per-user source yielding user_id, score, detail; whether it aggregates).
+# detail is a secondary figure shown next to the score.
+METRICS: Dict[str, Tuple[str, bool]] = {
+    'tokens': (
+        "SELECT id as user_id, tokens as score, redemptions as detail FROM users WHERE tokens > 0",
+        False,
+    ),
+    'redemptions': (
+        "SELECT id as user_id, redemptions as score, tokens as detail FROM users WHERE redemptions > 0",
+        False,
+    ),
+    'referrals': (
+        """
+        SELECT id as user_id, referral_count as score, referral_earned as detail
+        FROM users WHERE referral_count > 0
+        """,
+        False,
+    ),
+    'spent': (
+        """
+        SELECT user_id, SUM(-amount) as score, COUNT(*) as detail
+        FROM token_transactions NOT INDEXED
+        WHERE transaction_type = 'redeem' AND amount < 0
+        GROUP BY user_id
+        """,
+        True,
+    ),
+}
+
+ENTRY_COLUMNS = ('rank', 'user_id', 'username', 'first_name', 'score', 'detail')
+
+class Leaderboard:
+    """Top-K boards shared through snapshot tables; views and rank lookups never scan"""
+
+    def __init__(self, db_pool, size: int = LEADERBOARD_SIZE,
+                 interval: float = LEADERBOARD_REFRESH_INTERVAL):
+        self.db_pool = db_pool
+        self.size = size
+        self.interval = interval
+        self.boards: Dict[str, List[Dict]] = {metric: [] for metric in METRICS}
+        # metric -> ascending distinct scores, and how many users score at least each
+        self._scores: Dict[str, List[int]] = {metric: [] for metric in METRICS}
+        self._beaten_by: Dict[str, List[int]] = {metric: [] for metric in METRICS}
+        self.population: Dict[str, int] = {metric: 0 for metric in METRICS}
+        self.refreshed_at = 0.0
+
+    # Database side (pool threads)
+
+    @staticmethod
+    def claim(conn, interval: float, force: bool = False) -> List[str]:
+        """Lease the metrics due for a refresh so only one bot process recomputes them"""
+        now = time.time()
+        conn.executemany(
+            "INSERT OR IGNORE INTO leaderboard_meta (metric) VALUES (?)",
+            [(metric,) for metric in METRICS]
+        )
+        rows = conn.execute("""
+            UPDATE leaderboard_meta SET refreshed_at = ?
+            WHERE refreshed_at <= ?
+            RETURNING metric
+        """, (now, now if force else now - interval)).fetchall()
+        return [metric for metric, in rows if metric in METRICS]
+
+    @staticmethod
+    def compute(conn, metric: str, size: int) -> Tuple[List[tuple], List[tuple]]:
+        """Top `size` (user_id, score, detail) rows and the (score, users) histogram"""
+        source, aggregates = METRICS[metric]
+        # Aggregated sources are computed once for both result sets; plain
+        # column sources stay inlined so they can walk the score index
+        materialized = "MATERIALIZED" if aggregates else "NOT MATERIALIZED"
+        rows = conn.execute(f"""
+            WITH scores AS {materialized} ({source})
+            SELECT * FROM (
+                SELECT user_id, score, detail FROM scores
+                ORDER BY score DESC, user_id DESC
+                LIMIT ?
+            )
+            UNION ALL
+            SELECT NULL, score, COUNT(*) FROM scores GROUP BY score
+        """, (size,)).fetchall()
+        top = [row for row in rows if row[0] is not None]
+        histogram = [(score, users) for user_id, score, users in rows if user_id is None]
+        return top, histogram
+
+    @staticmethod
+    def store(conn, metric: str, top: List[tuple], histogram: List[tuple]):
+        """Replace one metric's snapshot; competition ranks come from the histogram"""
+        histogram = sorted(histogram, reverse=True)
+        above, higher = {}, 0
+        for score, users in histogram:
+            above[score] = higher
+            higher += users
+
+        conn.execute("DELETE FROM leaderboard_entries WHERE metric = ?", (metric,))
+        conn.executemany("""
+            INSERT INTO leaderboard_entries (metric, position, rank, user_id, score, detail)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(metric, position, above[score] + 1, user_id, score, detail)
+              for position, (user_id, score, detail) in enumerate(top, 1)])
+
+        conn.execute("DELETE FROM leaderboard_histogram WHERE metric = ?", (metric,))
+        conn.executemany("""
+            INSERT INTO leaderboard_histogram (metric, score, users, above)
+            VALUES (?, ?, ?, ?)
+        """, [(metric, score, users, above[score]) for score, users in histogram])
+        conn.execute("""
+            INSERT INTO leaderboard_meta (metric, population, refreshed_at) VALUES (?, ?, ?)
+            ON CONFLICT (metric) DO UPDATE SET
+                population = excluded.population,
+                refreshed_at = excluded.refreshed_at
+        """, (metric, higher, time.time()))
+
+    @classmethod
+    def refresh_stale(cls, conn, size: int = LEADERBOARD_SIZE,
+                      interval: float = LEADERBOARD_REFRESH_INTERVAL, force: bool = False) -> List[str]:
+        """Synchronous refresh on one connection (admin tools); commits after each step"""
+        metrics = cls.claim(conn, interval, force)
+        conn.commit()
+        for metric in metrics:
+            top, histogram = cls.compute(conn, metric, size)
+            conn.commit()
+            cls.store(conn, metric, top, histogram)
+            conn.commit()
+        return metrics
+
+    @staticmethod
+    def fetch(conn) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+        """Read every snapshot with current names for the listed users"""
+        entries = conn.execute("""
+            SELECT l.metric, l.rank, l.user_id, u.username, u.first_name, l.score, l.detail
+            FROM leaderboard_entries l
+            LEFT JOIN users u ON u.id = l.user_id
+            ORDER BY l.metric, l.position
+        """).fetchall()
+        histogram = conn.execute("""
+            SELECT metric, score, above + users FROM leaderboard_histogram
+            ORDER BY metric, score
+        """).fetchall()
+        meta = conn.execute("SELECT metric, population, refreshed_at FROM leaderboard_meta").fetchall()
+        return entries, histogram, meta
+
+    @staticmethod
+    def fetch_user_scores(conn, user_id: int) -> Optional[Dict[str, int]]:
+        """One user's live score on every metric, bounded by that user's index ranges"""
+        row = conn.execute("""
+            SELECT u.tokens, u.redemptions, u.referral_count,
+                   (SELECT COALESCE(SUM(-amount), 0) FROM token_transactions
+                    WHERE user_id = u.id AND transaction_type = 'redeem' AND amount < 0)
+            FROM users u
+            WHERE u.id = ?
+        """, (user_id,)).fetchone()
+        return dict(zip(METRICS, row)) if row else None
+
+    # Event loop side
+
+    def load(self, snapshot: Tuple[List[tuple], List[tuple], List[tuple]]):
+        """Swap in a fetch() result"""
+        entries, histogram, meta = snapshot
+
+        boards = {metric: [] for metric in METRICS}
+        for metric, *entry in entries:
+            if metric in boards:
+                boards[metric].append(dict(zip(ENTRY_COLUMNS, entry)))
+
+        scores = {metric: [] for metric in METRICS}
+        beaten_by = {metric: [] for metric in METRICS}
+        for metric, score, at_or_above in histogram:
+            if metric in scores:
+                scores[metric].append(score)
+                beaten_by[metric].append(at_or_above)
+
+        self.boards, self._scores, self._beaten_by = boards, scores, beaten_by
+        for metric, population, refreshed_at in meta:
+            if metric in METRICS:
+                self.population[metric] = population
+                self.refreshed_at = max(self.refreshed_at, refreshed_at or 0)
+
+    def top(self, metric: str, limit: int = 10) -> List[Dict]:
+        return self.boards.get(metric, [])[:limit]
+
+    def rank_of(self, metric: str, score: Optional[int]) -> Optional[int]:
+        """Competition rank a score would hold in the last snapshot; None when unranked"""
+        if not score or score <= 0:
+            return None
+        scores = self._scores.get(metric, [])
+        # Everyone at or above the lowest snapshot score that beats `score`
+        index = bisect.bisect_right(scores, score)
+        if index == len(scores):
+            return 1
+        return self._beaten_by[metric][index] + 1
+
+    async def refresh(self, force: bool = False):
+        """Recompute due metrics (if this process wins the lease), then reload the snapshot"""
+        metrics = await self.db_pool.run(self.claim, self.interval, force)
+        for metric in metrics:
+            top, histogram = await self.db_pool.run(self.compute, metric, self.size)
+            await self.db_pool.run(self.store, metric, top, histogram)
+        if metrics:
+            logger.info(f"Leaderboards refreshed: {', '.join(metrics)}")
+        self.load(await self.db_pool.run(self.fetch))
+
+    async def run(self):
+        """Refresh loop; start as a background task"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Leaderboard refresh error: {e}")
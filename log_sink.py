@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Write-Behind Log Sink for Telegram Bot
+Buffers logs and admin_actions rows and writes them in batched transactions
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from config import LOG_FLUSH_INTERVAL, LOG_BATCH_SIZE, LOG_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+class LogSink:
+    """Collects audit rows in memory and flushes them every flush_interval or batch_size rows"""
+
+    def __init__(self, db_pool, db, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 batch_size: int = LOG_BATCH_SIZE, queue_size: int = LOG_QUEUE_SIZE):
+        self.db_pool = db_pool
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Bounded: producers wait for the writer once this many rows are pending
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._batch_ready = asyncio.Event()
+        # Row taken off the queue by run() while it waits for the rest of its batch
+        self._held: Optional[Tuple[str, tuple]] = None
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    async def log(self, log_type: str, message: str, user_id: int = None,
+                  content_id: int = None, severity: str = "INFO"):
+        """Queue a row for the logs table"""
+        await self._put(("insert_log", (log_type, message, user_id, content_id, severity)))
+
+    async def admin_action(self, admin_id: int, action_type: str, details: str):
+        """Queue a row for the admin_actions table"""
+        await self._put(("insert_admin_action", (admin_id, action_type, details)))
+
+    async def _put(self, row: Tuple[str, tuple]):
+        await self.queue.put(row)
+        if self.queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    async def run(self):
+        """Writer loop; start as a background task"""
+        while True:
+            self._held = await self.queue.get()
+
+            # Wait for a full batch or the flush interval, whichever is first
+            timer = asyncio.get_running_loop().call_later(self.flush_interval, self._batch_ready.set)
+            try:
+                await self._batch_ready.wait()
+            finally:
+                timer.cancel()
+            self._batch_ready.clear()
+
+            await self._write(self._take(self.batch_size))
+
+    async def flush(self):
+        """Write everything still queued (on shutdown), including a row held by a cancelled run()"""
+        while self._held is not None or not self.queue.empty():
+            await self._write(self._take(self.batch_size))
+
+    def _take(self, limit: int) -> List[Tuple[str, tuple]]:
+        rows = [] if self._held is None else [self._held]
+        self._held = None
+        return rows + self._drain(limit - len(rows))
+
+    def _drain(self, limit: int) -> List[Tuple[str, tuple]]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return rows
+
+    async def _write(self, rows: List[Tuple[str, tuple]]):
+        grouped: Dict[str, List[tuple]] = {}
+        for name, params in rows:
+            grouped.setdefault(name, []).append(params)
+
+        try:
+            await self.db_pool.run(self._write_grouped, grouped)
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.dropped += len(rows)
+            logger.error(f"Log sink flush error, {len(rows)} rows dropped: {e}")
+
+    def _write_grouped(self, conn, grouped: Dict[str, List[tuple]]):
+        """One transaction per batch (runs on a pool thread)"""
+        for name, params in grouped.items():
+            self.db.executemany(conn, name, params)
+
+    def stats(self) -> Dict:
+        """Write-behind counters for monitoring"""
+        return {
+            'pending': self.queue.qsize() + (self._held is not None),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped
+        }
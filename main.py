@@ -13,6 +13,7 @@ import os
 import hashlib
 import json
 import re
+import tempfile
 from typing import Optional, Dict, Any, List, Tuple
 from urllib.parse import quote
 
@@ -23,16 +24,38 @@ from telegram.ext import (
     MessageHandler, filters, ContextTypes, ConversationHandler
 )
 from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
 
 # Import configuration
 from config import *
 from database_setup import DatabaseManager
+from db_pool import AsyncConnectionPool
+from cache import LRUCache
+from content_catalog import CHANGE_BATCH, ContentCatalog
+from rate_limiter import RateLimiter, MemoryRateLimitBackend, SQLiteRateLimitBackend
+from update_processor import UserLaneUpdateProcessor
+from log_sink import LogSink
+from view_counter import ViewCounter
+from broadcast import BroadcastEngine
+from outbound import OutboundDispatcher, DELIVERY, REPLY
+from channel_poster import ChannelPoster
+from media_ingest import MediaGroupCollector, media_info
+from data_export import CsvExporter, EXPORTS
+from leaderboard import Leaderboard
 
 # Conversation states
 WAITING_BROADCAST = 1
 WAITING_TOKEN_AMOUNT = 2
 WAITING_USER_ID = 3
 
+# Leaderboard boards: metric -> (title, unit)
+LEADERBOARD_BOARDS = {
+    'redemptions': ("🎬 Top Collectors", "videos"),
+    'referrals': ("🤝 Top Referrers", "referrals"),
+    'tokens': ("💰 Richest Wallets", "tokens"),
+    'spent': ("💸 Top Spenders", "tokens spent"),
+}
+
 # Enhanced logging setup
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -44,60 +67,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class RateLimiter:
-    """Rate limiting for bot actions"""
-    def __init__(self):
-        self.user_requests = {}
-        self.user_redemptions = {}
-    
-    def check_rate_limit(self, user_id: int, action: str = 'request') -> bool:
-        now = datetime.datetime.now()
-        
-        if action == 'request':
-            if user_id not in self.user_requests:
-                self.user_requests[user_id] = []
-            
-            # Clean old requests
-            self.user_requests[user_id] = [
-                req_time for req_time in self.user_requests[user_id]
-                if (now - req_time).seconds < 60
-            ]
-            
-            if len(self.user_requests[user_id]) >= MAX_REQUESTS_PER_MINUTE:
-                return False
-            
-            self.user_requests[user_id].append(now)
-            return True
-        
-        elif action == 'redemption':
-            today = now.date()
-            if user_id not in self.user_redemptions:
-                self.user_redemptions[user_id] = {}
-            
-            if today not in self.user_redemptions[user_id]:
-                self.user_redemptions[user_id][today] = 0
-            
-            if self.user_redemptions[user_id][today] >= MAX_REDEMPTIONS_PER_DAY:
-                return False
-            
-            self.user_redemptions[user_id][today] += 1
-            return True
-        
-        return True
-
 class TelegramBotAdvanced:
     """Advanced Telegram Bot with comprehensive features"""
     
     def __init__(self):
         self.db = DatabaseManager(DATABASE_FILE)
-        self.rate_limiter = RateLimiter()
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        self.db_pool = AsyncConnectionPool(DATABASE_FILE, connect=self.db.connect)
+        self.log_sink = LogSink(self.db_pool, self.db)
+        self.rate_limiter = RateLimiter(
+            SQLiteRateLimitBackend() if RATE_LIMIT_BACKEND == "sqlite" else MemoryRateLimitBackend()
+        )
+        self.application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(UserLaneUpdateProcessor())
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         self.bot_username = BOT_USERNAME
         self.setup_handlers()
         
         # Cache for frequently accessed data
-        self.user_cache = {}
-        self.content_cache = {}
+        self.user_cache = LRUCache(MAX_CACHE_SIZE, CACHE_TIMEOUT, enabled=ENABLE_USER_CACHE)
+        self.user_cache_generation = None
+        self.content_catalog = ContentCatalog()
+        self.view_counter = ViewCounter()
+        self.outbound = OutboundDispatcher()
+        self.broadcaster = BroadcastEngine(self.db_pool, self.application.bot, self.outbound)
+        self.channel_poster = ChannelPoster(self.db_pool, self.application.bot, self.outbound)
+        self.media_groups = MediaGroupCollector(self.ingest_album)
+        self.exporter = CsvExporter(self.db)
+        self.leaderboard = Leaderboard(self.db_pool)
+        self.background_tasks = []
+        self.unlock_tasks = set()
+        # Delivered unlocks whose completion write failed: query_id -> (user_id, content_id)
+        self.unfinished_unlocks: Dict[str, Tuple[int, int]] = {}
         
         logger.info("🚀 Advanced Telegram Bot initialized successfully")
     
@@ -138,6 +143,153 @@ class TelegramBotAdvanced:
         bar = "█" * filled + "░" * (width - filled)
         return f"{bar} {current}/{total}"
     
+    def _insert_log(self, conn, log_type: str, message: str, user_id: int = None,
+                    content_id: int = None, severity: str = "INFO"):
+        """Insert a row into the logs table (runs on a pool thread)"""
+        self.db.execute(conn, "insert_log", (log_type, message, user_id, content_id, severity))
+    
+    async def post_init(self, application: Application):
+        """Warm in-memory state and start background workers"""
+        # Read the change watermark first: a change racing the snapshot is
+        # then replayed, and replaying the current state is harmless
+        change_seq = await self.db_pool.run(self.content_catalog.fetch_change_seq)
+        rows = await self.db_pool.run(self.content_catalog.fetch)
+        self.content_catalog.load(rows, change_seq)
+        
+        self.outbound.start()
+        self.background_tasks.append(asyncio.create_task(self.log_sink.run()))
+        self.background_tasks.append(asyncio.create_task(self.refresh_catalog_loop()))
+        self.background_tasks.append(asyncio.create_task(self.flush_views_loop()))
+        self.background_tasks.append(asyncio.create_task(self.complete_unlocks_loop()))
+        if ENABLE_USER_CACHE:
+            self.background_tasks.append(asyncio.create_task(self.watch_cache_generation_loop()))
+        self.background_tasks.append(asyncio.create_task(self.channel_poster.run()))
+        
+        if ENABLE_LEADERBOARD:
+            try:
+                await self.leaderboard.refresh()
+            except Exception as e:
+                logger.error(f"Leaderboard load error: {e}")
+            self.background_tasks.append(asyncio.create_task(self.leaderboard.run()))
+        
+        await self.broadcaster.resume(self.resumed_broadcast_reporter)
+        if isinstance(self.rate_limiter.backend, SQLiteRateLimitBackend):
+            self.background_tasks.append(asyncio.create_task(self.flush_rate_limits_loop()))
+    
+    async def post_shutdown(self, application: Application):
+        """Stop background workers and release pooled database connections"""
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        await self.broadcaster.stop()
+        await self.media_groups.flush()
+        # In-flight unlocks finish (delivered or refunded) while sends still work
+        await asyncio.gather(*self.unlock_tasks, return_exceptions=True)
+        await self.complete_unfinished_unlocks()
+        await self.outbound.stop()
+        
+        await self.log_sink.flush()
+        await self.flush_views()
+        if isinstance(self.rate_limiter.backend, SQLiteRateLimitBackend):
+            await self.flush_rate_limits()
+        
+        self.db_pool.close()
+    
+    async def flush_rate_limits(self):
+        """Write batched limiter hits to the shared table and adopt merged counts"""
+        backend = self.rate_limiter.backend
+        batch = backend.take_pending()
+        
+        try:
+            totals, synced_at = await self.db_pool.run(
+                backend.write_batch, batch, RateLimiter.WINDOW_SECONDS, backend.synced_at
+            )
+            backend.apply_totals(totals, synced_at)
+        except Exception as e:
+            backend.restore(batch)
+            logger.error(f"Rate limit flush error: {e}")
+    
+    async def flush_rate_limits_loop(self):
+        """Periodically share limiter counters with other bot processes"""
+        while True:
+            await asyncio.sleep(RATE_LIMIT_FLUSH_INTERVAL)
+            await self.flush_rate_limits()
+    
+    async def flush_views(self):
+        """Write coalesced view counts in one transaction"""
+        batch = self.view_counter.take_pending()
+        if not batch:
+            return
+        
+        try:
+            await self.db_pool.run(self.view_counter.write_batch, batch)
+        except Exception as e:
+            self.view_counter.restore(batch)
+            logger.error(f"View count flush error: {e}")
+    
+    async def complete_unfinished_unlocks(self):
+        """Retry recording delivered unlocks whose completion write failed"""
+        for query_id, (user_id, content_id) in list(self.unfinished_unlocks.items()):
+            try:
+                await self.db_pool.run(self._complete_unlock, query_id, user_id, content_id)
+                del self.unfinished_unlocks[query_id]
+            except Exception as e:
+                logger.error(f"Unlock completion retry error for {query_id}: {e}")
+    
+    async def complete_unlocks_loop(self):
+        """Periodically record delivered unlocks left unfinished"""
+        while True:
+            await asyncio.sleep(UNLOCK_COMPLETION_RETRY_INTERVAL)
+            await self.complete_unfinished_unlocks()
+    
+    async def flush_views_loop(self):
+        """Periodically persist content views"""
+        while True:
+            await asyncio.sleep(VIEW_FLUSH_INTERVAL)
+            await self.flush_views()
+    
+    async def watch_cache_generation_loop(self):
+        """Clear cached user rows after admin tools changed them from another process"""
+        while True:
+            try:
+                generation = await self.db_pool.run(self._load_cache_generation)
+                if self.user_cache_generation is not None and generation != self.user_cache_generation:
+                    self.user_cache.clear()
+                    logger.info("User cache cleared after an out-of-process update")
+                self.user_cache_generation = generation
+            except Exception as e:
+                logger.error(f"Cache generation check error: {e}")
+            await asyncio.sleep(CACHE_GENERATION_POLL_INTERVAL)
+    
+    def _load_cache_generation(self, conn) -> Optional[int]:
+        row = self.db.execute(conn, "get_cache_generation", ("users",)).fetchone()
+        return row[0] if row else None
+    
+    async def refresh_catalog_loop(self):
+        """Pick up content inserted outside this process"""
+        while True:
+            await asyncio.sleep(CONTENT_CATALOG_REFRESH_INTERVAL)
+            try:
+                rows = await self.db_pool.run(self.content_catalog.fetch, self.content_catalog.max_id)
+                if self.content_catalog.merge(rows):
+                    logger.info(f"Content catalog refreshed: {len(rows)} new items")
+                await self.apply_catalog_changes()
+            except Exception as e:
+                logger.error(f"Content catalog refresh error: {e}")
+    
+    async def apply_catalog_changes(self):
+        """Drop deactivated content and restore reactivated content"""
+        added = removed = 0
+        while True:
+            changes = await self.db_pool.run(self.content_catalog.fetch_changes, self.content_catalog.change_seq)
+            batch_added, batch_removed = self.content_catalog.apply_changes(changes)
+            added += batch_added
+            removed += batch_removed
+            if len(changes) < CHANGE_BATCH:
+                break
+        if added or removed:
+            logger.info(f"Content catalog refreshed: {added} items reactivated, {removed} deactivated")
+    
     def setup_handlers(self):
         """Setup all bot handlers"""
         # Command handlers
@@ -215,78 +367,19 @@ class TelegramBotAdvanced:
         
         # Get or create user
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            # Check if user exists
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user.id,))
-            existing_user = cursor.fetchone()
-            
-            if not existing_user:
-                # Create new user
-                cursor.execute("""
-                    INSERT INTO users (id, username, first_name, last_name, referral_by) 
-                    VALUES (?, ?, ?, ?, ?)
-                """, (user.id, user.username, user.first_name, user.last_name, referral_by))
-                
-                # Process referral bonus
-                if referral_by:
-                    cursor.execute("""
-                        INSERT INTO referrals (referrer_id, referred_id, bonus_amount) 
-                        VALUES (?, ?, ?)
-                    """, (referral_by, user.id, REFERRAL_BONUS))
-                    
-                    cursor.execute("""
-                        UPDATE users SET tokens = tokens + ? WHERE id = ?
-                    """, (REFERRAL_BONUS, referral_by))
-                    
-                    cursor.execute("""
-                        INSERT INTO token_transactions 
-                        (user_id, amount, transaction_type, description) 
-                        VALUES (?, ?, ?, ?)
-                    """, (referral_by, REFERRAL_BONUS, "referral_bonus", f"Referred user @{user.username or user.first_name}"))
-                    
-                    referral_bonus_msg = f"\n\n🎉 Welcome bonus! Your referrer earned {REFERRAL_BONUS} tokens!"
-                    
-                    # Log referral
-                    cursor.execute("""
-                        INSERT INTO logs (log_type, message, user_id) 
-                        VALUES (?, ?, ?)
-                    """, ("referral", f"User {user.id} referred by {referral_by}", user.id))
-                
-                # Welcome bonus for new users
-                cursor.execute("""
-                    UPDATE users SET tokens = tokens + 1 WHERE id = ?
-                """, (user.id,))
-                
-                cursor.execute("""
-                    INSERT INTO token_transactions 
-                    (user_id, amount, transaction_type, description) 
-                    VALUES (?, ?, ?, ?)
-                """, (user.id, 1, "welcome_bonus", "Welcome to the platform"))
-                
-                user_status = "new"
-            else:
-                user_status = "returning"
-                # Update last activity
-                cursor.execute("""
-                    UPDATE users SET last_activity = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                """, (user.id,))
-            
-            # Get current user data
-            cursor.execute("SELECT tokens, redemptions FROM users WHERE id = ?", (user.id,))
-            user_data = cursor.fetchone()
-            tokens, redemptions = user_data if user_data else (0, 0)
-            
-            conn.commit()
-            conn.close()
-            
+            user_status, tokens, redemptions, referral_bonus = await self.db_pool.run(
+                self._register_user, user, referral_by
+            )
         except Exception as e:
             logger.error(f"Database error in start_command: {e}")
             await update.message.reply_text("❌ Database error. Please try again later.")
             return
         
+        if referral_bonus is not None:
+            self.user_cache.invalidate(referral_by)
+        if referral_bonus:
+            referral_bonus_msg = f"\n\n🎉 Welcome bonus! Your referrer earned {referral_bonus} tokens!"
+        
         # Create welcome message
         if user_status == "new":
             welcome_text = f"""
@@ -359,17 +452,71 @@ Great to see you again, {user.first_name}! 👋
         )
         
         # Log user activity
-        try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO logs (log_type, message, user_id) 
-                VALUES (?, ?, ?)
-            """, ("user_activity", f"User started bot - Status: {user_status}", user.id))
-            conn.commit()
-            conn.close()
-        except:
-            pass
+        await self.log_sink.log("user_activity", f"User started bot - Status: {user_status}", user.id)
+    
+    def _register_user(self, conn, user, referral_by: Optional[int]) -> Tuple[str, int, int, Optional[int]]:
+        """Get or create a user row, applying welcome and referral bonuses"""
+        db = self.db
+        # Tokens paid to the referrer; None when no referral was recorded
+        referral_bonus = None
+        
+        # Check if user exists
+        existing_user = self._get_profile(conn, user.id)
+        
+        if not existing_user:
+            # The referrer's counters are read, checked and bumped under one write lock
+            db.begin_immediate(conn)
+            referrer = db.execute(conn, "get_referral_counters", (referral_by,)).fetchone() if referral_by else None
+            if referrer and referrer[1] >= MAX_REFERRALS_PER_DAY:
+                logger.info(f"Referral of {user.id} by {referral_by} skipped: daily limit reached")
+                referrer = None
+            
+            # Create new user
+            db.execute(conn, "insert_user", (
+                user.id, user.username, user.first_name, user.last_name, referral_by if referrer else None
+            ))
+            
+            # Process referral bonus, capped at MAX_REFERRAL_BONUS_PER_USER in total
+            if referrer:
+                referral_earned, referrals_today = referrer
+                referral_bonus = max(0, min(REFERRAL_BONUS, MAX_REFERRAL_BONUS_PER_USER - referral_earned))
+                db.execute(conn, "insert_referral", (referral_by, user.id, referral_bonus))
+                db.execute(conn, "credit_referral", (referral_bonus, referral_bonus, referrals_today + 1, referral_by))
+                if referral_bonus:
+                    db.execute(conn, "insert_transaction", (
+                        referral_by, referral_bonus, "referral_bonus",
+                        f"Referred user @{user.username or user.first_name}", None
+                    ))
+                
+                # Log referral
+                self._insert_log(conn, "referral", f"User {user.id} referred by {referral_by}", user.id)
+            
+            # Welcome bonus for new users
+            db.execute(conn, "add_tokens", (1, user.id))
+            db.execute(conn, "insert_transaction", (user.id, 1, "welcome_bonus", "Welcome to the platform", None))
+            
+            user_status = "new"
+            
+            # Get current user data
+            user_data = db.execute(conn, "get_balance", (user.id,)).fetchone()
+            tokens, redemptions = user_data if user_data else (0, 0)
+        else:
+            user_status = "returning"
+            # Update last activity
+            db.execute(conn, "touch_user", (user.id,))
+            tokens, redemptions = existing_user[0], existing_user[1]
+        
+        return user_status, tokens, redemptions, referral_bonus
+    
+    def _get_profile(self, conn, user_id: int) -> Optional[tuple]:
+        """Read a user's wallet row through the profile cache"""
+        profile = self.user_cache.get(user_id)
+        if profile is None:
+            epoch = self.user_cache.epoch
+            profile = self.db.execute(conn, "get_wallet", (user_id,)).fetchone()
+            if profile:
+                self.user_cache.set(user_id, profile, epoch)
+        return profile
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comprehensive help command"""
@@ -440,46 +587,18 @@ Contact our admin team or use /feedback for specific questions!
         user = update.effective_user
         
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            # Get comprehensive user data
-            cursor.execute("""
-                SELECT tokens, redemptions, joined_on, total_spent, loyalty_points 
-                FROM users WHERE id = ?
-            """, (user.id,))
-            user_data = cursor.fetchone()
-            
-            if not user_data:
-                conn.close()
-                await update.message.reply_text("❌ Please use /start first to register!")
-                return
-            
-            tokens, redemptions, joined_on, total_spent, loyalty_points = user_data
-            
-            # Get recent transactions
-            cursor.execute("""
-                SELECT transaction_type, amount, description, timestamp 
-                FROM token_transactions 
-                WHERE user_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT 5
-            """, (user.id,))
-            recent_transactions = cursor.fetchall()
-            
-            # Get referral count
-            cursor.execute("""
-                SELECT COUNT(*) FROM referrals WHERE referrer_id = ?
-            """, (user.id,))
-            referral_count = cursor.fetchone()[0]
-            
-            conn.close()
-            
+            wallet = await self.db_pool.run(self._load_wallet, user.id)
         except Exception as e:
             logger.error(f"Database error in mytokens_command: {e}")
             await update.message.reply_text("❌ Database error. Please try again.")
             return
         
+        if not wallet:
+            await update.message.reply_text("❌ Please use /start first to register!")
+            return
+        
+        (tokens, redemptions, joined_on, total_spent, loyalty_points), recent_transactions, referral_count = wallet
+        
         # Calculate loyalty progress
         loyalty_progress = redemptions % LOYALTY_THRESHOLD
         progress_bar = self.create_progress_bar(loyalty_progress, LOYALTY_THRESHOLD)
@@ -555,35 +674,52 @@ Contact our admin team or use /feedback for specific questions!
             parse_mode=ParseMode.MARKDOWN
         )
     
+    def _load_wallet(self, conn, user_id: int) -> Optional[Tuple[tuple, List[tuple], int]]:
+        """Load balance, recent transactions and referral count for /mytokens"""
+        # Get comprehensive user data
+        user_data = self._get_profile(conn, user_id)
+        
+        if not user_data:
+            return None
+        
+        # Get recent transactions
+        recent_transactions = self.db.execute(conn, "recent_transactions", (user_id,)).fetchall()
+        
+        # Get referral count
+        referral_count = self.db.execute(conn, "count_referrals", (user_id,)).fetchone()[0]
+        
+        return user_data, recent_transactions, referral_count
+    
     async def redeem_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Enhanced content redemption with categories"""
         user = update.effective_user
         
         # Check rate limit
-        if not self.rate_limiter.check_rate_limit(user.id, 'redemption'):
+        blocked = self.rate_limiter.check_redemption(user.id)
+        if blocked == 'cooldown':
+            await update.message.reply_text(
+                f"⚠️ Please wait {REDEMPTION_COOLDOWN} seconds between redemptions."
+            )
+            return
+        if blocked == 'daily_limit':
             await update.message.reply_text(
                 "⚠️ Daily redemption limit reached. Try again tomorrow!"
             )
             return
         
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            # Get user data
-            cursor.execute("SELECT tokens FROM users WHERE id = ?", (user.id,))
-            user_data = cursor.fetchone()
-            
-            if not user_data:
-                conn.close()
-                await update.message.reply_text("❌ Please use /start first!")
-                return
-            
-            tokens = user_data[0]
-            
-            if tokens <= 0:
-                conn.close()
-                no_tokens_msg = """
+            tokens = await self.db_pool.run(self._load_tokens, user.id)
+        except Exception as e:
+            logger.error(f"Database error in redeem_command: {e}")
+            await update.message.reply_text("❌ Database error. Please try again.")
+            return
+        
+        if tokens is None:
+            await update.message.reply_text("❌ Please use /start first!")
+            return
+        
+        if tokens <= 0:
+            no_tokens_msg = """
 😔 **Insufficient Tokens** 😔
 
 You need tokens to unlock premium content!
@@ -595,43 +731,29 @@ You need tokens to unlock premium content!
 
 💡 **Special Offer:** Get 10 tokens for just ₹90 (₹10 discount!)
 """.format(REFERRAL_BONUS, LOYALTY_THRESHOLD)
-                
-                keyboard = [
-                    [
-                        InlineKeyboardButton("🛒 Buy Tokens", callback_data="buy_tokens"),
-                        InlineKeyboardButton("🤝 Refer Friends", callback_data="refer_friends")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(
-                    no_tokens_msg, 
-                    reply_markup=reply_markup, 
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                return
-            
-            # Get available content with categories
-            cursor.execute("""
-                SELECT id, file_id, file_type, caption, category, views, uploaded_on 
-                FROM content 
-                WHERE is_active = TRUE 
-                ORDER BY uploaded_on DESC 
-                LIMIT 20
-            """)
-            content_list = cursor.fetchall()
-            
-            conn.close()
             
-            if not content_list:
-                await update.message.reply_text(
-                    "📭 No content available at the moment. Check back later!"
-                )
-                return
+            keyboard = [
+                [
+                    InlineKeyboardButton("🛒 Buy Tokens", callback_data="buy_tokens"),
+                    InlineKeyboardButton("🤝 Refer Friends", callback_data="refer_friends")
+                ]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
             
-        except Exception as e:
-            logger.error(f"Database error in redeem_command: {e}")
-            await update.message.reply_text("❌ Database error. Please try again.")
+            await update.message.reply_text(
+                no_tokens_msg, 
+                reply_markup=reply_markup, 
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        # Get available content with categories
+        content_list = self.content_catalog.latest(20)
+        
+        if not content_list:
+            await update.message.reply_text(
+                "📭 No content available at the moment. Check back later!"
+            )
             return
         
         # Create content selection interface
@@ -641,24 +763,16 @@ You need tokens to unlock premium content!
 💰 **Your Balance:** {tokens} tokens
 🎯 **Unlock Cost:** 1 token per video
 
-📚 **Available Content ({len(content_list)} videos):**
+📚 **Available Content ({len(self.content_catalog)} videos):**
 """
         
-        # Group content by category
-        categories = {}
-        for content in content_list:
-            category = content[4] or "General"
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(content)
-        
         # Create category buttons
         keyboard = []
-        for category, items in categories.items():
+        for category, count in self.content_catalog.category_counts().items():
             emoji = {"General": "🎬", "Premium": "⭐", "Latest": "🆕", "Popular": "🔥"}.get(category, "📁")
             keyboard.append([
                 InlineKeyboardButton(
-                    f"{emoji} {category} ({len(items)})", 
+                    f"{emoji} {category} ({count})", 
                     callback_data=f"category_{category}"
                 )
             ])
@@ -666,18 +780,7 @@ You need tokens to unlock premium content!
         # Add individual content buttons (first 8 items)
         keyboard.append([InlineKeyboardButton("➡️ Browse All Content", callback_data="browse_all")])
         
-        for i, content in enumerate(content_list[:6]):  # Show first 6 items
-            content_id, file_id, file_type, caption, category, views, uploaded_on = content
-            
-            # Truncate caption
-            short_caption = caption[:35] + "..." if len(caption) > 35 else caption
-            
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"🎬 {short_caption} ({views} views)", 
-                    callback_data=f"unlock_{content_id}"
-                )
-            ])
+        keyboard.extend(self.content_buttons(content_list[:6]))  # Show first 6 items
         
         keyboard.append([
             InlineKeyboardButton("🔙 Back to Menu", callback_data="main_menu"),
@@ -692,6 +795,46 @@ You need tokens to unlock premium content!
             parse_mode=ParseMode.MARKDOWN
         )
     
+    def _load_tokens(self, conn, user_id: int) -> Optional[int]:
+        """Load the user's balance for /redeem"""
+        user_data = self._get_profile(conn, user_id)
+        return user_data[0] if user_data else None
+    
+    def content_buttons(self, content_list: List[Dict]) -> List[List[InlineKeyboardButton]]:
+        """One unlock button per catalog item"""
+        keyboard = []
+        for content in content_list:
+            caption = content['caption'] or ""
+            
+            # Truncate caption
+            short_caption = caption[:35] + "..." if len(caption) > 35 else caption
+            
+            keyboard.append([
+                InlineKeyboardButton(
+                    f"🎬 {short_caption} ({content['views']} views)", 
+                    callback_data=f"unlock_{content['id']}"
+                )
+            ])
+        return keyboard
+    
+    async def show_content_list(self, query, category: str = None):
+        """Browse all content or a single category, served from the catalog"""
+        content_list = self.content_catalog.latest(CONTENT_PAGE_SIZE, category)
+        
+        if not content_list:
+            await query.edit_message_text("📭 No content available in this section yet.")
+            return
+        
+        title = f"📁 **{category}**" if category else "🎬 **All Content**"
+        keyboard = self.content_buttons(content_list)
+        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="browse_content")])
+        
+        await query.edit_message_text(
+            f"{title}\n\nTap a title to unlock it for 1 token:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
     async def buy_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Enhanced purchase interface with packages"""
         purchase_text = f"""
@@ -766,32 +909,9 @@ You need tokens to unlock premium content!
         referral_link = self.generate_referral_link(user.id)
         
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            # Get referral statistics
-            cursor.execute("""
-                SELECT COUNT(*) as total_referrals,
-                       SUM(bonus_amount) as total_earned
-                FROM referrals 
-                WHERE referrer_id = ?
-            """, (user.id,))
-            stats = cursor.fetchone()
-            total_referrals, total_earned = stats if stats else (0, 0)
-            
-            # Get recent referrals
-            cursor.execute("""
-                SELECT u.first_name, u.username, r.referred_on, r.bonus_amount
-                FROM referrals r
-                JOIN users u ON r.referred_id = u.id
-                WHERE r.referrer_id = ?
-                ORDER BY r.referred_on DESC
-                LIMIT 5
-            """, (user.id,))
-            recent_referrals = cursor.fetchall()
-            
-            conn.close()
-            
+            total_referrals, total_earned, recent_referrals = await self.db_pool.run(
+                self._load_referral_stats, user.id
+            )
         except Exception as e:
             logger.error(f"Database error in refer_command: {e}")
             total_referrals, total_earned = 0, 0
@@ -812,7 +932,7 @@ You need tokens to unlock premium content!
 1️⃣ Share your unique link
 2️⃣ Friends join and use /start
 3️⃣ You earn {REFERRAL_BONUS} tokens instantly
-4️⃣ No limit on referrals!
+4️⃣ Earn up to {MAX_REFERRAL_BONUS_PER_USER} tokens in total ({MAX_REFERRALS_PER_DAY} referrals per day)
 
 🚀 **Boost Your Earnings:**
 • Share in WhatsApp groups
@@ -859,6 +979,74 @@ You need tokens to unlock premium content!
             parse_mode=ParseMode.MARKDOWN
         )
     
+    def _load_referral_stats(self, conn, user_id: int) -> Tuple[int, int, List[tuple]]:
+        """Load referral totals and the most recent referrals for /refer"""
+        # Get referral statistics
+        stats = self.db.execute(conn, "referral_stats", (user_id,)).fetchone()
+        total_referrals, total_earned = stats if stats else (0, 0)
+        
+        # Get recent referrals
+        recent_referrals = self.db.execute(conn, "recent_referrals", (user_id,)).fetchall()
+        
+        return total_referrals, total_earned, recent_referrals
+    
+    async def leaderboard_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Top users per metric plus the caller's own rank"""
+        metric = context.args[0].lower() if context.args else ''
+        text, reply_markup = await self._leaderboard_view(update.effective_user.id, metric)
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    
+    async def show_leaderboard(self, query, context: ContextTypes.DEFAULT_TYPE, metric: str = ''):
+        """Leaderboard screen for the inline buttons"""
+        text, reply_markup = await self._leaderboard_view(query.from_user.id, metric)
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    
+    async def _leaderboard_view(self, user_id: int, metric: str) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Render a board from the in-memory snapshot; only the caller's own scores hit the database"""
+        if not ENABLE_LEADERBOARD:
+            return "🏆 The leaderboard is currently disabled.", None
+        
+        if metric not in LEADERBOARD_BOARDS:
+            metric = 'redemptions'
+        title, unit = LEADERBOARD_BOARDS[metric]
+        
+        try:
+            scores = await self.db_pool.run(Leaderboard.fetch_user_scores, user_id)
+        except Exception as e:
+            logger.error(f"Database error in leaderboard: {e}")
+            scores = None
+        
+        medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+        text = f"🏆 **{title}** 🏆\n\n"
+        
+        entries = self.leaderboard.top(metric, 10)
+        if not entries:
+            text += "_No rankings yet. Check back soon!_\n"
+        for entry in entries:
+            name = entry['first_name'] or entry['username'] or f"User {entry['user_id']}"
+            marker = medals.get(entry['rank'], f"{entry['rank']}.")
+            text += f"{marker} {escape_markdown(name)} - `{entry['score']} {unit}`\n"
+        
+        if scores is not None:
+            score = scores[metric]
+            rank = self.leaderboard.rank_of(metric, score)
+            if rank:
+                population = max(self.leaderboard.population[metric], rank)
+                text += f"\n📍 **Your Rank:** #{rank} of {population} (`{score} {unit}`)\n"
+            else:
+                text += "\n📍 **Your Rank:** not ranked yet\n"
+        
+        if self.leaderboard.refreshed_at:
+            updated = datetime.datetime.fromtimestamp(self.leaderboard.refreshed_at).strftime("%H:%M")
+            text += f"\n🕒 _Updated at {updated}_"
+        
+        boards = [
+            InlineKeyboardButton(board_title, callback_data=f"leaderboard_{board}")
+            for board, (board_title, _) in LEADERBOARD_BOARDS.items() if board != metric
+        ]
+        keyboard = [boards[:2], boards[2:] + [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
+        return text, InlineKeyboardMarkup(keyboard)
+    
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comprehensive admin panel"""
         user = update.effective_user
@@ -871,27 +1059,18 @@ You need tokens to unlock premium content!
         
         try:
             # Get quick stats for admin dashboard
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM users")
-            total_users = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM content WHERE is_active = TRUE")
-            total_content = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM token_transactions WHERE DATE(timestamp) = DATE('now')")
-            today_transactions = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT SUM(tokens) FROM users")
-            total_tokens_in_system = cursor.fetchone()[0] or 0
-            
-            conn.close()
-            
+            total_users, total_content, today_transactions, total_tokens_in_system = await self.db_pool.run(
+                self._load_admin_stats
+            )
         except Exception as e:
             logger.error(f"Admin stats error: {e}")
             total_users = total_content = today_transactions = total_tokens_in_system = 0
         
+        cache_stats = self.user_cache.stats()
+        lane_stats = self.application.update_processor.stats()
+        sink_stats = self.log_sink.stats()
+        outbound_stats = self.outbound.stats()
+        
         admin_text = f"""
 🛠️ **Admin Control Panel** 🛠️
 
@@ -901,6 +1080,10 @@ You need tokens to unlock premium content!
 • 🎬 Active Content: {total_content}
 • 💰 Tokens in System: {total_tokens_in_system}
 • 📈 Today's Transactions: {today_transactions}
+• ⚡ User Cache Hit Rate: {cache_stats['hit_rate']}% ({cache_stats['size']}/{cache_stats['max_size']})
+• 🚦 Active User Lanes: {lane_stats['active_lanes']} (timed out: {lane_stats['timed_out']}, dropped: {lane_stats['dropped']})
+• 📝 Log Sink: {sink_stats['written']} rows in {sink_stats['batches']} batches ({sink_stats['pending']} pending)
+• 📤 Outbound Queue: {outbound_stats['queued']} (flood waits: {outbound_stats['flood_waits']})
 
 ⚡ **Quick Actions:**
 """
@@ -948,6 +1131,187 @@ You need tokens to unlock premium content!
             parse_mode=ParseMode.MARKDOWN
         )
     
+    def _load_admin_stats(self, conn) -> Tuple[int, int, int, int]:
+        """Load quick stats for the admin dashboard"""
+        db = self.db
+        total_users = db.execute(conn, "count_users").fetchone()[0]
+        total_content = db.execute(conn, "count_active_content").fetchone()[0]
+        today_transactions = db.execute(conn, "count_transactions_today").fetchone()[0]
+        total_tokens_in_system = db.execute(conn, "sum_tokens").fetchone()[0] or 0
+        
+        return total_users, total_content, today_transactions, total_tokens_in_system
+    
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/export <users|content> [new] [plain] sends a streamed CSV export as a document"""
+        user = update.effective_user
+        
+        if not self.is_admin(user.id, user.username):
+            await update.message.reply_text("❌ Access denied. Admin only command.")
+            return
+        
+        args = [arg.lower() for arg in context.args or []]
+        if not args or args[0] not in EXPORTS:
+            await update.message.reply_text(
+                "📦 **Export**\n\n"
+                "• `/export users` - all users as gzipped CSV\n"
+                "• `/export content` - all content as gzipped CSV\n"
+                "• add `new` for rows added since the last export\n"
+                "• add `plain` for an uncompressed CSV",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        kind = args[0]
+        since_last = "new" in args[1:]
+        compress = "plain" not in args[1:]
+        
+        # Small exports never touch the disk; large ones spill to a temp file
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as spool:
+            try:
+                rows, watermark = await self.db_pool.run(self.exporter.write, kind, spool, compress, since_last)
+            except Exception as e:
+                logger.error(f"Export error: {e}")
+                await update.message.reply_text("❌ Export failed. Please try again.")
+                return
+            
+            if since_last and rows == 0:
+                await update.message.reply_text(f"✅ No new {kind} since the last export.")
+                return
+            
+            spool.seek(0)
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            try:
+                await update.message.reply_document(
+                    document=spool,
+                    filename=f"{kind}_export_{timestamp}.csv" + (".gz" if compress else ""),
+                    caption=f"📦 {rows} {kind} rows" + (" (new since last export)" if since_last else "")
+                )
+            except Exception as e:
+                logger.error(f"Export upload error: {e}")
+                await update.message.reply_text("❌ Could not send the export file.")
+                return
+        
+        # Only a delivered export moves the watermark forward
+        if watermark is not None:
+            await self.db_pool.run(self.exporter.save_watermark, kind, watermark, rows)
+        await self.log_sink.admin_action(user.id, "export", f"Exported {rows} {kind} rows")
+    
+    async def broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/broadcast <text> starts a broadcast, /broadcast stop <id> cancels one"""
+        user = update.effective_user
+        
+        if not self.is_admin(user.id, user.username):
+            await update.message.reply_text("❌ Access denied. Admin only command.")
+            return
+        
+        args = context.args or []
+        if len(args) == 2 and args[0] == "stop" and args[1].isdigit():
+            if self.broadcaster.cancel(int(args[1])):
+                await update.message.reply_text(f"🛑 Broadcast #{args[1]} will stop after the current batch.")
+            else:
+                await update.message.reply_text(f"❌ Broadcast #{args[1]} is not running.")
+            return
+        
+        if args:
+            await self.launch_broadcast(update, " ".join(args))
+            return
+        
+        running = ", ".join(f"#{broadcast_id}" for broadcast_id in self.broadcaster.tasks) or "none"
+        await update.message.reply_text(
+            f"📢 **Broadcast**\n\n"
+            f"Running: {running}\n\n"
+            f"• `/broadcast <message>` - send to all active users\n"
+            f"• `/broadcast stop <id>` - cancel a running broadcast",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    async def start_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin panel entry point: ask for the broadcast text"""
+        query = update.callback_query
+        await query.answer()
+        
+        if not self.is_admin(query.from_user.id, query.from_user.username):
+            await query.edit_message_text("❌ Access denied.")
+            return ConversationHandler.END
+        
+        await query.edit_message_text(
+            "📢 **New Broadcast**\n\nSend the message to deliver to all active users, or /cancel to abort.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return WAITING_BROADCAST
+    
+    async def send_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Conversation step: start the broadcast with the received text"""
+        await self.launch_broadcast(update, update.message.text)
+        return ConversationHandler.END
+    
+    async def cancel_conversation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Leave any admin conversation"""
+        await update.message.reply_text("❌ Cancelled.")
+        return ConversationHandler.END
+    
+    async def launch_broadcast(self, update: Update, text: str):
+        """Start a broadcast and keep the admin's status message up to date"""
+        user = update.effective_user
+        status_message = await update.message.reply_text("📢 Starting broadcast...")
+        
+        try:
+            state = await self.broadcaster.start(
+                user.id, text, self.broadcast_reporter(status_message.chat_id, status_message.message_id)
+            )
+        except Exception as e:
+            logger.error(f"Broadcast start error: {e}")
+            await status_message.edit_text("❌ Failed to start broadcast.")
+            return
+        
+        await self.log_sink.admin_action(user.id, "broadcast", f"Broadcast #{state['id']} to {state['total']} users")
+        await status_message.edit_text(self.format_broadcast_progress(state), parse_mode=ParseMode.MARKDOWN)
+    
+    def broadcast_reporter(self, chat_id: int, message_id: int):
+        """Progress callback that edits one status message, throttled"""
+        last_edit = 0.0
+        
+        async def report(state: Dict):
+            nonlocal last_edit
+            now = asyncio.get_running_loop().time()
+            if state['status'] == 'running' and now - last_edit < BROADCAST_PROGRESS_INTERVAL:
+                return
+            last_edit = now
+            await self.outbound.send(REPLY, chat_id, lambda: self.application.bot.edit_message_text(
+                self.format_broadcast_progress(state), chat_id, message_id, parse_mode=ParseMode.MARKDOWN
+            ))
+        
+        return report
+    
+    def resumed_broadcast_reporter(self, state: Dict):
+        """Progress callback for a broadcast resumed at startup"""
+        status_message = None
+        report_to_message = None
+        
+        async def report(progress: Dict):
+            nonlocal status_message, report_to_message
+            if status_message is None:
+                status_message = await self.outbound.send(REPLY, state['admin_id'], lambda: self.application.bot.send_message(
+                    state['admin_id'], f"🔄 Resuming broadcast #{state['id']} after restart..."
+                ))
+                report_to_message = self.broadcast_reporter(status_message.chat_id, status_message.message_id)
+            await report_to_message(progress)
+        
+        return report
+    
+    def format_broadcast_progress(self, state: Dict) -> str:
+        done = state['sent'] + state['failed'] + state['blocked']
+        icon = {'running': '📤', 'completed': '✅', 'cancelled': '🛑'}[state['status']]
+        return f"""
+{icon} **Broadcast #{state['id']}: {state['status'].title()}**
+
+{self.create_progress_bar(min(done, state['total']), max(state['total'], 1))}
+
+• ✅ Sent: {state['sent']}
+• 🚫 Blocked: {state['blocked']}
+• ❌ Failed: {state['failed']}
+"""
+    
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Enhanced callback handler with comprehensive actions"""
         query = update.callback_query
@@ -976,6 +1340,12 @@ You need tokens to unlock premium content!
             elif data == "help":
                 await self.help_command(update, context)
             
+            elif data == "browse_all":
+                await self.show_content_list(query)
+            
+            elif data.startswith("category_"):
+                await self.show_content_list(query, data[len("category_"):])
+            
             # Content unlocking
             elif data.startswith("unlock_"):
                 await self.handle_unlock(query, context, data)
@@ -1006,8 +1376,11 @@ You need tokens to unlock premium content!
             elif data == "user_profile":
                 await self.show_user_profile(query, context)
             
-            elif data == "leaderboard":
-                await self.show_leaderboard(query, context)
+            elif data == "leaderboard" or data.startswith("leaderboard_"):
+                await self.show_leaderboard(query, context, data[len("leaderboard_"):])
+            
+            elif data == "top_referrers":
+                await self.show_leaderboard(query, context, 'referrals')
             
             # Feedback system
             elif data == "feedback":
@@ -1029,74 +1402,59 @@ You need tokens to unlock premium content!
     
     async def handle_unlock(self, query, context: ContextTypes.DEFAULT_TYPE, data: str):
         """Handle content unlock with enhanced experience"""
-        user = query.from_user
         content_id = int(data.split('_')[1])
         
+        # Resolve content from the in-memory catalog
+        content = self.content_catalog.get(content_id)
+        if not content:
+            await query.edit_message_text("❌ Content not found or no longer available.")
+            return
+        
+        # Once a token is reserved the unlock must end delivered or refunded,
+        # so a REQUEST_TIMEOUT cancelling this handler must not cancel it
+        task = asyncio.ensure_future(self._unlock(query, context, content_id, content))
+        self.unlock_tasks.add(task)
+        task.add_done_callback(self.unlock_tasks.discard)
+        await asyncio.shield(task)
+    
+    async def _unlock(self, query, context: ContextTypes.DEFAULT_TYPE, content_id: int, content: Dict):
+        """Reserve, deliver, then complete or refund one unlock"""
+        user = query.from_user
+        file_id, file_type = content['file_id'], content['file_type']
+        caption, views, category = content['caption'] or "", content['views'], content['category']
+        
         try:
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
+            # The callback query id is the idempotency key: a redelivered or
+            # retried update finds its reservation and is never charged twice
+            result = await self.db_pool.run(self._reserve_unlock, query.id, user.id, content_id, caption)
+            self.user_cache.invalidate(user.id)
             
-            # Get user data
-            cursor.execute("SELECT tokens, redemptions FROM users WHERE id = ?", (user.id,))
-            user_data = cursor.fetchone()
-            
-            if not user_data or user_data[0] <= 0:
-                conn.close()
+            if result == "insufficient_tokens":
                 await query.edit_message_text("❌ Insufficient tokens! Use /buy to purchase more.")
                 return
-            
-            tokens, redemptions = user_data
-            
-            # Get content details
-            cursor.execute("""
-                SELECT file_id, file_type, caption, views, category 
-                FROM content 
-                WHERE id = ? AND is_active = TRUE
-            """, (content_id,))
-            content = cursor.fetchone()
-            
-            if not content:
-                conn.close()
+            if result == "unavailable":
+                # Deactivated since the catalog was last refreshed
+                self.content_catalog.remove(content_id)
                 await query.edit_message_text("❌ Content not found or no longer available.")
                 return
             
-            file_id, file_type, caption, views, category = content
-            
-            # Process unlock transaction
-            cursor.execute("BEGIN TRANSACTION")
-            
-            # Deduct token
-            cursor.execute("UPDATE users SET tokens = tokens - 1, redemptions = redemptions + 1 WHERE id = ?", (user.id,))
-            
-            # Update content views
-            cursor.execute("UPDATE content SET views = views + 1 WHERE id = ?", (content_id,))
+            replay, state, updated_tokens, new_redemptions, loyalty_awarded = result
+            if state == "delivered":
+                await query.edit_message_text("✅ Content already sent to your private messages! 📱")
+                return
+            if state == "refunded":
+                await query.edit_message_text("❌ Failed to send content. Token refunded to your account.")
+                return
             
-            # Log transaction
-            cursor.execute("""
-                INSERT INTO token_transactions (user_id, amount, transaction_type, description, content_id) 
-                VALUES (?, ?, ?, ?, ?)
-            """, (user.id, -1, "redeem", f"Unlocked: {caption[:50]}", content_id))
+            if not replay:
+                # Views are coalesced in memory; the catalog shows the merged value
+                self.content_catalog.record_view(content_id)
+                self.view_counter.record(content_id)
             
-            # Check for loyalty bonus
-            new_redemptions = redemptions + 1
             loyalty_bonus_msg = ""
-            
-            if new_redemptions % LOYALTY_THRESHOLD == 0:
-                cursor.execute("UPDATE users SET tokens = tokens + ? WHERE id = ?", (LOYALTY_BONUS, user.id))
-                cursor.execute("""
-                    INSERT INTO token_transactions (user_id, amount, transaction_type, description) 
-                    VALUES (?, ?, ?, ?)
-                """, (user.id, LOYALTY_BONUS, "loyalty_bonus", f"Milestone reward for {new_redemptions} redemptions"))
+            if loyalty_awarded:
                 loyalty_bonus_msg = f"\n\n🎉 **LOYALTY BONUS!** 🎉\nYou earned {LOYALTY_BONUS} tokens for reaching {new_redemptions} redemptions!"
             
-            cursor.execute("COMMIT")
-            
-            # Get updated balance
-            cursor.execute("SELECT tokens FROM users WHERE id = ?", (user.id,))
-            updated_tokens = cursor.fetchone()[0]
-            
-            conn.close()
-            
             # Send the content
             success_msg = f"""
 ✅ **Content Unlocked Successfully!** ✅
@@ -1114,63 +1472,105 @@ You need tokens to unlock premium content!
 """
             
             try:
-                if file_type == 'video':
-                    await context.bot.send_video(
-                        user.id,
-                        file_id,
-                        caption=success_msg,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                elif file_type == 'photo':
-                    await context.bot.send_photo(
-                        user.id,
-                        file_id,
-                        caption=success_msg,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    await context.bot.send_document(
-                        user.id,
-                        file_id,
-                        caption=success_msg,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                
-                # Success message in group/channel
-                await query.edit_message_text(
-                    "✅ Content unlocked and sent to your private messages! 📱",
+                # Paid delivery goes out first and is retried through flood
+                # control; only a permanent failure or timeout is refunded
+                await self.outbound.send_media(
+                    DELIVERY, user.id, context.bot, file_type, file_id,
+                    timeout=OUTBOUND_DELIVERY_TIMEOUT,
+                    caption=success_msg,
                     parse_mode=ParseMode.MARKDOWN
                 )
-                
-                # Log successful unlock
-                conn = sqlite3.connect(DATABASE_FILE)
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO logs (log_type, message, user_id, content_id) 
-                    VALUES (?, ?, ?, ?)
-                """, ("content_unlock", f"Successfully unlocked content {content_id}", user.id, content_id))
-                conn.commit()
-                conn.close()
-                
             except Exception as send_error:
                 # Refund token if sending fails
-                conn = sqlite3.connect(DATABASE_FILE)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE users SET tokens = tokens + 1, redemptions = redemptions - 1 WHERE id = ?", (user.id,))
-                cursor.execute("""
-                    INSERT INTO token_transactions (user_id, amount, transaction_type, description) 
-                    VALUES (?, ?, ?, ?)
-                """, (user.id, 1, "refund", f"Failed to send content {content_id}"))
-                conn.commit()
-                conn.close()
+                await self.db_pool.run(self._refund_unlock, query.id, user.id, content_id)
+                self.user_cache.invalidate(user.id)
+                logger.error(f"Failed to send content to user {user.id}: {send_error}")
                 
                 await query.edit_message_text("❌ Failed to send content. Token refunded to your account.")
-                logger.error(f"Failed to send content to user {user.id}: {send_error}")
+                return
+            
+            # Delivered: commit the reservation and log the unlock before
+            # anything else can fail, so nothing past this point refunds
+            try:
+                await self.db_pool.run(self._complete_unlock, query.id, user.id, content_id)
+            except Exception as e:
+                # The user has the content; record it later instead of reporting a failure
+                self.unfinished_unlocks[query.id] = (user.id, content_id)
+                logger.error(f"Failed to record unlock {query.id} for user {user.id}, will retry: {e}")
+            
+            try:
+                # Success message in group/channel
+                await query.edit_message_text(
+                    "✅ Content unlocked and sent to your private messages! 📱",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            except Exception as e:
+                logger.error(f"Failed to confirm unlock for user {user.id}: {e}")
         
         except Exception as e:
             logger.error(f"Unlock error: {e}")
             await query.edit_message_text("❌ Transaction failed. Please try again.")
     
+    def _reserve_unlock(self, conn, query_id: str, user_id: int, content_id: int, caption: str):
+        """Charge one token and reserve the unlock under query_id in one write transaction"""
+        db = self.db
+        db.begin_immediate(conn)
+        
+        existing = db.execute(conn, "get_reservation", (query_id,)).fetchone()
+        if existing:
+            return (True, *existing)
+        
+        # The catalog can lag a deactivation by one refresh; the row is authoritative
+        active = db.execute(conn, "is_content_active", (content_id,)).fetchone()
+        if not active or not active[0]:
+            return "unavailable"
+        
+        # Conditional deduction; the balance can never go negative
+        row = db.execute(conn, "redeem_token", (LOYALTY_THRESHOLD, LOYALTY_BONUS, user_id)).fetchone()
+        if not row:
+            return "insufficient_tokens"
+        
+        updated_tokens, new_redemptions = row
+        loyalty_awarded = new_redemptions % LOYALTY_THRESHOLD == 0
+        
+        ledger = [(user_id, -1, "redeem", f"Unlocked: {caption[:50]}", content_id)]
+        if loyalty_awarded:
+            ledger.append((
+                user_id, LOYALTY_BONUS, "loyalty_bonus", f"Milestone reward for {new_redemptions} redemptions", None
+            ))
+        db.executemany(conn, "insert_transaction", ledger)
+        db.execute(conn, "insert_reservation", (
+            query_id, user_id, content_id, updated_tokens, new_redemptions, loyalty_awarded
+        ))
+        
+        return False, "reserved", updated_tokens, new_redemptions, loyalty_awarded
+    
+    def _complete_unlock(self, conn, query_id: str, user_id: int, content_id: int):
+        """Mark a reservation delivered"""
+        if self.db.execute(conn, "transition_reservation", ("delivered", query_id)).rowcount:
+            self._insert_log(conn, "content_unlock", f"Successfully unlocked content {content_id}", user_id, content_id)
+    
+    def _refund_unlock(self, conn, query_id: str, user_id: int, content_id: int):
+        """Give back the token of a reservation whose delivery failed; runs at most once per query_id"""
+        db = self.db
+        db.begin_immediate(conn)
+        if not db.execute(conn, "transition_reservation", ("refunded", query_id)).rowcount:
+            return
+        
+        # Dropping back below a milestone takes its loyalty bonus back, whichever
+        # reservation crossed it, so bonuses always match redemptions // threshold
+        # (never below a zero balance, if already spent)
+        clawback = 0
+        tokens, redemptions = db.execute(conn, "get_balance", (user_id,)).fetchone()
+        if redemptions % LOYALTY_THRESHOLD == 0:
+            clawback = min(LOYALTY_BONUS, tokens + 1)
+        
+        db.execute(conn, "refund_token", (clawback, user_id))
+        ledger = [(user_id, 1, "refund", f"Failed to send content {content_id}", content_id)]
+        if clawback:
+            ledger.append((user_id, -clawback, "loyalty_bonus", "Milestone reward reversed by refund", None))
+        db.executemany(conn, "insert_transaction", ledger)
+    
     async def handle_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Enhanced media upload handler for admins"""
         user = update.effective_user
@@ -1179,23 +1579,14 @@ You need tokens to unlock premium content!
             return
         
         message = update.message
-        file_info = None
-        file_type = None
-        file_size = 0
+        
+        # Album parts are buffered and ingested together once the group is complete
+        if message.media_group_id:
+            self.media_groups.add(message)
+            return
         
         # Determine file type and get info
-        if message.video:
-            file_info = message.video
-            file_type = 'video'
-            file_size = file_info.file_size
-        elif message.photo:
-            file_info = message.photo[-1]
-            file_type = 'photo'
-            file_size = file_info.file_size
-        elif message.document:
-            file_info = message.document
-            file_type = 'document'
-            file_size = file_info.file_size
+        file_info, file_type, file_size = media_info(message)
         
         if not file_info:
             return
@@ -1214,43 +1605,22 @@ You need tokens to unlock premium content!
             file_id = file_info.file_id
             caption = message.caption or "No caption provided"
             
-            # Enhanced content metadata
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO content (file_id, file_type, caption, uploaded_by, file_size, category) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (file_id, file_type, caption, user.id, file_size, "General"))
-            
-            content_id = cursor.lastrowid
-            
-            # Log admin action
-            cursor.execute("""
-                INSERT INTO admin_actions (admin_id, action_type, details) 
-                VALUES (?, ?, ?)
-            """, (user.id, "content_upload", f"Uploaded {file_type}: {caption[:50]}"))
-            
-            conn.commit()
-            conn.close()
+            # Queue the channel post with the upload; the poster sends it in the background
+            channel_caption = None
+            if AUTO_POST_TO_CHANNEL and CHANNEL_ID:
+                channel_caption = f"🎬 **New Content Available!**\n\n{caption}\n\n🤖 Use our bot to unlock premium content!"
             
-            # Auto-post to channel if configured
-            channel_posted = False
-            if CHANNEL_ID and CHANNEL_ID.startswith('@'):
-                try:
-                    channel_caption = f"🎬 **New Content Available!**\n\n{caption}\n\n🤖 Use our bot to unlock premium content!"
-                    
-                    if file_type == 'video':
-                        await context.bot.send_video(CHANNEL_ID, file_id, caption=channel_caption, parse_mode=ParseMode.MARKDOWN)
-                    elif file_type == 'photo':
-                        await context.bot.send_photo(CHANNEL_ID, file_id, caption=channel_caption, parse_mode=ParseMode.MARKDOWN)
-                    else:
-                        await context.bot.send_document(CHANNEL_ID, file_id, caption=channel_caption, parse_mode=ParseMode.MARKDOWN)
-                    
-                    channel_posted = True
-                    
-                except Exception as channel_error:
-                    logger.error(f"Failed to post to channel: {channel_error}")
+            # Enhanced content metadata
+            uploaded_on = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            content_id = await self.db_pool.run(
+                self._store_upload, user.id, file_id, file_type, caption, file_size, uploaded_on, channel_caption
+            )
+            if channel_caption:
+                self.channel_poster.wake()
+            self.content_catalog.add({
+                'id': content_id, 'file_id': file_id, 'file_type': file_type, 'caption': caption,
+                'category': "General", 'views': 0, 'uploaded_on': uploaded_on
+            })
             
             # Success response
             success_text = f"""
@@ -1260,7 +1630,7 @@ You need tokens to unlock premium content!
 📝 **Caption:** {caption}
 📁 **Type:** {file_type.title()}
 📏 **Size:** {file_size/1024:.1f} KB
-📺 **Channel Posted:** {'✅ Yes' if channel_posted else '❌ Failed'}
+📺 **Channel Post:** {'⏳ Queued' if channel_caption else '➖ Disabled'}
 
 🎯 **Quick Actions:**
 """
@@ -1287,6 +1657,109 @@ You need tokens to unlock premium content!
             logger.error(f"Media upload error: {e}")
             await message.reply_text("❌ Upload failed. Please try again.")
     
+    async def ingest_album(self, messages: List):
+        """Store a whole album in one transaction, reply once and queue one channel post"""
+        first = messages[0]
+        admin_id = first.from_user.id
+        # Telegram carries an album caption on whichever part the admin captioned
+        album_caption = next((message.caption for message in messages if message.caption), "No caption provided")
+        
+        items, rejected = [], []
+        for message in messages:
+            file_info, file_type, file_size = media_info(message)
+            if not file_info:
+                continue
+            if file_size > MAX_FILE_SIZE or file_type not in ALLOWED_FILE_TYPES:
+                rejected.append(f"{file_type} ({file_size/1024/1024:.1f}MB)")
+                continue
+            items.append({
+                'file_id': file_info.file_id, 'file_type': file_type, 'file_size': file_size,
+                'caption': message.caption or album_caption
+            })
+        
+        if not items:
+            await first.reply_text(f"❌ No files from this album could be uploaded. Rejected: {', '.join(rejected)}")
+            return
+        
+        channel_caption = None
+        if AUTO_POST_TO_CHANNEL and CHANNEL_ID:
+            channel_caption = f"🎬 **New Content Available!**\n\n{album_caption}\n\n🤖 Use our bot to unlock premium content!"
+        
+        uploaded_on = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            content_ids = await self.db_pool.run(self._store_album, admin_id, items, uploaded_on, channel_caption)
+        except Exception as e:
+            logger.error(f"Album upload error: {e}")
+            await first.reply_text("❌ Album upload failed. Please try again.")
+            return
+        
+        for content_id, item in zip(content_ids, items):
+            self.content_catalog.add({
+                'id': content_id, 'file_id': item['file_id'], 'file_type': item['file_type'],
+                'caption': item['caption'], 'category': "General", 'views': 0, 'uploaded_on': uploaded_on
+            })
+        if channel_caption:
+            self.channel_poster.wake()
+        
+        total_size = sum(item['file_size'] for item in items)
+        summary_text = f"""
+✅ **Album Uploaded Successfully!**
+
+📦 **Files:** {len(items)}
+🆔 **Content IDs:** {content_ids[0]}-{content_ids[-1]}
+📏 **Total Size:** {total_size/1024/1024:.1f} MB
+📺 **Channel Post:** {'⏳ Queued' if channel_caption else '➖ Disabled'}
+"""
+        if rejected:
+            summary_text += f"⚠️ **Skipped:** {', '.join(rejected)}\n"
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("🗂️ View All Content", callback_data="admin_content"),
+                InlineKeyboardButton("📤 Upload More", callback_data="admin_upload")
+            ]
+        ]
+        await first.reply_text(summary_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.MARKDOWN)
+    
+    def _store_album(self, conn, admin_id: int, items: List[Dict], uploaded_on: str,
+                     channel_caption: Optional[str] = None) -> List[int]:
+        """Insert every album file, queue the channel post and log one admin action"""
+        content_ids = []
+        for item in items:
+            cursor = self.db.execute(conn, "insert_content", (
+                item['file_id'], item['file_type'], item['caption'], admin_id, item['file_size'], "General", uploaded_on
+            ))
+            content_ids.append(cursor.lastrowid)
+            item['content_id'] = cursor.lastrowid
+        
+        if channel_caption:
+            ChannelPoster.enqueue_album(conn, str(CHANNEL_ID), [
+                {'content_id': item['content_id'], 'file_id': item['file_id'], 'file_type': item['file_type']}
+                for item in items
+            ], channel_caption)
+        
+        self.db.execute(conn, "insert_admin_action", (
+            admin_id, "content_upload", f"Uploaded album of {len(items)} files"
+        ))
+        return content_ids
+    
+    def _store_upload(self, conn, admin_id: int, file_id: str, file_type: str,
+                      caption: str, file_size: int, uploaded_on: str,
+                      channel_caption: Optional[str] = None) -> int:
+        """Insert an uploaded file, queue its channel post and log the admin action"""
+        cursor = self.db.execute(conn, "insert_content", (
+            file_id, file_type, caption, admin_id, file_size, "General", uploaded_on
+        ))
+        content_id = cursor.lastrowid
+        
+        if channel_caption:
+            ChannelPoster.enqueue(conn, content_id, str(CHANNEL_ID), file_id, file_type, channel_caption)
+        
+        # Log admin action
+        self.db.execute(conn, "insert_admin_action", (admin_id, "content_upload", f"Uploaded {file_type}: {caption[:50]}"))
+        
+        return content_id
+    
     def run(self):
         """Start the bot with enhanced error handling"""
         logger.info("🚀 Starting Advanced Telegram Bot...")
@@ -1297,24 +1770,34 @@ You need tokens to unlock premium content!
             
             # Log error to database
             try:
-                conn = sqlite3.connect(DATABASE_FILE)
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO logs (log_type, message, user_id, severity) 
-                    VALUES (?, ?, ?, ?)
-                """, ("error", str(context.error), update.effective_user.id if update.effective_user else None, "ERROR"))
-                conn.commit()
-                conn.close()
+                user_id = update.effective_user.id if update and update.effective_user else None
+                await self.log_sink.log("error", str(context.error), user_id, None, "ERROR")
             except:
                 pass
         
         self.application.add_error_handler(error_handler)
         
         # Run the bot
-        self.application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
+        if WEBHOOK_ENABLED:
+            # Telegram POSTs each update to the local listener, which checks the
+            # secret token header, queues the update and acks with 200 at once;
+            # handlers run from the queue, not inside the HTTP request
+            logger.info(f"🌐 Webhook mode: listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+            self.application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            self.application.run_polling(
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES
+            )
 
 def main():
     """Main function with enhanced startup"""
@@ -1328,6 +1811,14 @@ def main():
             logger.error("❌ Please configure ADMIN_ID in config.py")
             return
         
+        if WEBHOOK_ENABLED:
+            # Only warnings elsewhere, but a bad URL or secret breaks or exposes the listener
+            webhook_errors = validate_webhook_config()
+            if webhook_errors:
+                for error in webhook_errors:
+                    logger.error(f"❌ {error}")
+                return
+        
         # Initialize and run bot
         bot = TelegramBotAdvanced()
         logger.info("✅ Configuration validated successfully")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Album Ingestion for Telegram Bot
+Collects the messages of a media group so a whole album is stored and announced at once
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Message
+
+from config import MEDIA_GROUP_WAIT
+
+logger = logging.getLogger(__name__)
+
+AlbumCallback = Callable[[List[Message]], Awaitable[None]]
+
+def media_info(message: Message) -> Tuple[Optional[object], Optional[str], int]:
+    """(file, file_type, file_size) of an uploaded video, photo or document"""
+    if message.video:
+        return message.video, 'video', message.video.file_size or 0
+    if message.photo:
+        return message.photo[-1], 'photo', message.photo[-1].file_size or 0
+    if message.document:
+        return message.document, 'document', message.document.file_size or 0
+    return None, None, 0
+
+class MediaGroupCollector:
+    """Buffers album messages until no new part arrived for `wait` seconds"""
+
+    def __init__(self, on_album: AlbumCallback, wait: float = MEDIA_GROUP_WAIT):
+        self.on_album = on_album
+        self.wait = wait
+        # media_group_id -> messages in arrival order
+        self.groups: Dict[str, List[Message]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    def add(self, message: Message):
+        """Buffer one part of an album; Telegram delivers each part as its own update"""
+        group_id = message.media_group_id
+        self.groups.setdefault(group_id, []).append(message)
+
+        timer = self._timers.pop(group_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[group_id] = asyncio.get_running_loop().call_later(self.wait, self._complete, group_id)
+
+    def _complete(self, group_id: str):
+        self._timers.pop(group_id, None)
+        messages = self.groups.pop(group_id, [])
+        if not messages:
+            return
+        messages.sort(key=lambda message: message.message_id)
+
+        task = asyncio.create_task(self._deliver(group_id, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, group_id: str, messages: List[Message]):
+        try:
+            await self.on_album(messages)
+        except Exception as e:
+            logger.error(f"Album {group_id} ingestion error: {e}")
+
+    async def flush(self):
+        """Ingest buffered albums immediately (on shutdown)"""
+        for group_id in list(self._timers):
+            self._timers.pop(group_id).cancel()
+            self._complete(group_id)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
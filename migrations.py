@@ -0,0 +1,758 @@
+#!/usr/bin/env python3
+"""
+Versioned Schema Migrations for Telegram Bot
+Ordered, checksummed migration scripts applied online in short transactions
+"""
+
+import sqlite3
+import hashlib
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from config import DATABASE_FILE, MIGRATION_CHUNK_SIZE, MIGRATION_CHUNK_PAUSE
+
+logger = logging.getLogger(__name__)
+
+class MigrationError(Exception):
+    """Raised when the recorded schema history does not match the scripts"""
+
+class AddColumn:
+    """Add a column unless it already exists (metadata-only in SQLite)"""
+
+    def __init__(self, table: str, column: str, definition: str):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def describe(self) -> str:
+        return f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}"
+
+    def apply(self, conn: sqlite3.Connection, runner: "MigrationRunner"):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({self.table})")]
+        if self.column in columns:
+            return
+        conn.execute(self.describe())
+        conn.commit()
+
+class Backfill:
+    """Populate a column in rowid chunks so no single write transaction is long"""
+
+    def __init__(self, table: str, assignment: str, where: str = "1"):
+        self.table = table
+        self.assignment = assignment
+        self.where = where
+
+    def describe(self) -> str:
+        return f"UPDATE {self.table} SET {self.assignment} WHERE {self.where} (chunked by rowid)"
+
+    def apply(self, conn: sqlite3.Connection, runner: "MigrationRunner"):
+        # Keyset pages over rowids that exist: ids such as Telegram user ids
+        # are sparse, so stepping through the integer range would mean
+        # millions of empty chunks
+        page = f"SELECT rowid FROM {self.table} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        sql = f"""
+            UPDATE {self.table} SET {self.assignment}
+            WHERE rowid BETWEEN ? AND ? AND ({self.where})
+        """
+        rowids = conn.execute(
+            f"SELECT rowid FROM {self.table} ORDER BY rowid LIMIT ?", (runner.chunk_size,)
+        ).fetchall()
+        while rowids:
+            conn.execute(sql, (rowids[0][0], rowids[-1][0]))
+            conn.commit()
+            if len(rowids) < runner.chunk_size:
+                break
+            # Let the live bot grab the write lock between chunks
+            time.sleep(runner.pause)
+            rowids = conn.execute(page, (rowids[-1][0], runner.chunk_size)).fetchall()
+
+class Migration:
+    """One ordered schema change made of idempotent steps"""
+
+    def __init__(self, version: int, name: str, steps: List):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+    @staticmethod
+    def describe_step(step) -> str:
+        if isinstance(step, str):
+            return " ".join(step.split())
+        return step.describe()
+
+    @property
+    def checksum(self) -> str:
+        digest = hashlib.sha256()
+        for step in self.steps:
+            digest.update(self.describe_step(step).encode("utf-8"))
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+# ================================
+# MIGRATION SCRIPTS
+# ================================
+
+# Baseline tables (version 1)
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        redemptions INTEGER NOT NULL DEFAULT 0,
+        referral_by INTEGER,
+        joined_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT TRUE,
+        total_spent REAL DEFAULT 0,
+        loyalty_points INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS content (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        caption TEXT,
+        category TEXT DEFAULT 'General',
+        views INTEGER NOT NULL DEFAULT 0,
+        uploaded_by INTEGER,
+        uploaded_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT TRUE,
+        file_size INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS referrals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        referrer_id INTEGER NOT NULL,
+        referred_id INTEGER NOT NULL UNIQUE,
+        bonus_amount INTEGER DEFAULT 0,
+        referred_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        rating INTEGER,
+        comment TEXT,
+        submitted_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_type TEXT NOT NULL,
+        message TEXT,
+        user_id INTEGER,
+        content_id INTEGER,
+        severity TEXT DEFAULT 'INFO',
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        description TEXT,
+        content_id INTEGER,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admin_actions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        action_type TEXT NOT NULL,
+        details TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# Secondary indexes backing every hot lookup, range filter and ORDER BY ... LIMIT (version 3)
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_time ON token_transactions(user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_type_time ON token_transactions(transaction_type, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_time ON token_transactions(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)",
+    "CREATE INDEX IF NOT EXISTS idx_users_joined_on ON users(joined_on)",
+    "CREATE INDEX IF NOT EXISTS idx_users_tokens ON users(tokens)",
+    "CREATE INDEX IF NOT EXISTS idx_users_redemptions ON users(redemptions)",
+    "CREATE INDEX IF NOT EXISTS idx_content_active_uploaded ON content(is_active, uploaded_on)",
+    "CREATE INDEX IF NOT EXISTS idx_referrals_referrer_time ON referrals(referrer_id, referred_on)",
+    "CREATE INDEX IF NOT EXISTS idx_referrals_time ON referrals(referred_on)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_type_time ON logs(log_type, timestamp)",
+]
+
+# Per-day analytics rollups (version 12). Triggers keep each table equal to
+# the GROUP BY of its source rows, so dashboards read one row per day.
+ROLLUP_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS daily_user_stats (
+        day TEXT PRIMARY KEY,
+        new_users INTEGER NOT NULL DEFAULT 0,
+        active_users INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_transaction_stats (
+        day TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        transactions INTEGER NOT NULL DEFAULT 0,
+        total_amount INTEGER NOT NULL DEFAULT 0,
+        tokens_added INTEGER NOT NULL DEFAULT 0,
+        tokens_spent INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, transaction_type)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_referral_stats (
+        day TEXT PRIMARY KEY,
+        referrals INTEGER NOT NULL DEFAULT 0,
+        bonuses INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_content_unlocks (
+        day TEXT NOT NULL,
+        content_id INTEGER NOT NULL,
+        unlocks INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, content_id)
+    ) WITHOUT ROWID
+    """,
+]
+
+# Signed ledger rows that count as a content unlock (refunds undo one)
+UNLOCK_DELTA = "CASE {row}.transaction_type WHEN 'redeem' THEN 1 WHEN 'refund' THEN -1 ELSE 0 END"
+
+def _user_day(row: str, column: str, sign: str) -> str:
+    counter = 'new_users' if column == 'joined_on' else 'active_users'
+    return f"""
+        INSERT INTO daily_user_stats (day, {counter})
+        SELECT DATE({row}.{column}), {sign}1 WHERE {row}.{column} IS NOT NULL
+        ON CONFLICT(day) DO UPDATE SET {counter} = {counter} {sign} 1;"""
+
+def _transaction_day(row: str, sign: str) -> str:
+    return f"""
+        INSERT INTO daily_transaction_stats (day, transaction_type, transactions, total_amount, tokens_added, tokens_spent)
+        SELECT DATE({row}.timestamp), {row}.transaction_type, {sign}1, {sign}{row}.amount,
+               {sign}MAX({row}.amount, 0), {sign}MAX(-{row}.amount, 0)
+        WHERE {row}.timestamp IS NOT NULL
+        ON CONFLICT(day, transaction_type) DO UPDATE SET
+            transactions = transactions + excluded.transactions,
+            total_amount = total_amount + excluded.total_amount,
+            tokens_added = tokens_added + excluded.tokens_added,
+            tokens_spent = tokens_spent + excluded.tokens_spent;
+        INSERT INTO daily_content_unlocks (day, content_id, unlocks)
+        SELECT DATE({row}.timestamp), {row}.content_id, {sign}({UNLOCK_DELTA.format(row=row)})
+        WHERE {row}.timestamp IS NOT NULL AND {row}.content_id IS NOT NULL
+        AND {row}.transaction_type IN ('redeem', 'refund')
+        ON CONFLICT(day, content_id) DO UPDATE SET unlocks = unlocks + excluded.unlocks;"""
+
+def _referral_day(row: str, sign: str) -> str:
+    return f"""
+        INSERT INTO daily_referral_stats (day, referrals, bonuses)
+        SELECT DATE({row}.referred_on), {sign}1, {sign}COALESCE({row}.bonus_amount, 0)
+        WHERE {row}.referred_on IS NOT NULL
+        ON CONFLICT(day) DO UPDATE SET
+            referrals = referrals + excluded.referrals,
+            bonuses = bonuses + excluded.bonuses;"""
+
+ROLLUP_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_users_insert AFTER INSERT ON users
+    BEGIN{_user_day('NEW', 'joined_on', '+')}{_user_day('NEW', 'last_activity', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_users_delete AFTER DELETE ON users
+    BEGIN{_user_day('OLD', 'joined_on', '-')}{_user_day('OLD', 'last_activity', '-')}
+    END
+    """,
+    # Fires at most once per user per day: only when the activity date moves
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_users_activity AFTER UPDATE OF last_activity ON users
+    WHEN DATE(OLD.last_activity) IS NOT DATE(NEW.last_activity)
+    BEGIN{_user_day('OLD', 'last_activity', '-')}{_user_day('NEW', 'last_activity', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_transactions_insert AFTER INSERT ON token_transactions
+    BEGIN{_transaction_day('NEW', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_transactions_delete AFTER DELETE ON token_transactions
+    BEGIN{_transaction_day('OLD', '-')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_referrals_insert AFTER INSERT ON referrals
+    BEGIN{_referral_day('NEW', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS rollup_referrals_delete AFTER DELETE ON referrals
+    BEGIN{_referral_day('OLD', '-')}
+    END
+    """,
+]
+
+# Full recomputation of each rollup from its source rows (backfill / repair)
+ROLLUP_SOURCES = {
+    'daily_user_stats': """
+        SELECT day, SUM(new_users), SUM(active_users) FROM (
+            SELECT DATE(joined_on) as day, 1 as new_users, 0 as active_users FROM users WHERE joined_on IS NOT NULL
+            UNION ALL
+            SELECT DATE(last_activity), 0, 1 FROM users WHERE last_activity IS NOT NULL
+        )
+        GROUP BY day
+    """,
+    'daily_transaction_stats': """
+        SELECT DATE(timestamp), transaction_type, COUNT(*), SUM(amount),
+               SUM(MAX(amount, 0)), SUM(MAX(-amount, 0))
+        FROM token_transactions NOT INDEXED
+        WHERE timestamp IS NOT NULL
+        GROUP BY DATE(timestamp), transaction_type
+    """,
+    'daily_referral_stats': """
+        SELECT DATE(referred_on), COUNT(*), COALESCE(SUM(bonus_amount), 0)
+        FROM referrals
+        WHERE referred_on IS NOT NULL
+        GROUP BY DATE(referred_on)
+    """,
+    'daily_content_unlocks': f"""
+        SELECT DATE(timestamp), content_id, SUM({UNLOCK_DELTA.format(row='token_transactions')})
+        FROM token_transactions
+        WHERE timestamp IS NOT NULL AND content_id IS NOT NULL
+        AND transaction_type IN ('redeem', 'refund')
+        GROUP BY DATE(timestamp), content_id
+    """,
+}
+
+# Exact O(1) dashboard figures (version 13): row counts per table plus a few
+# derived totals, adjusted by triggers on every insert, delete and update
+COUNTED_TABLES = ['users', 'content', 'referrals', 'feedback', 'logs', 'token_transactions']
+
+def _bump(deltas: Dict[str, str]) -> str:
+    cases = " ".join(f"WHEN '{name}' THEN {delta}" for name, delta in deltas.items())
+    names = ", ".join(f"'{name}'" for name in deltas)
+    return f"""
+        UPDATE stats_counters SET value = value + CASE name {cases} END
+        WHERE name IN ({names});"""
+
+def _user_counters(row: str, sign: str) -> Dict[str, str]:
+    return {
+        'users': f"{sign}1",
+        'active_users': f"{sign}COALESCE({row}.is_active = TRUE, 0)",
+        'tokens': f"{sign}{row}.tokens",
+    }
+
+def _content_counters(row: str, sign: str) -> Dict[str, str]:
+    return {'content': f"{sign}1", 'active_content': f"{sign}COALESCE({row}.is_active = TRUE, 0)"}
+
+COUNTER_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_users_insert AFTER INSERT ON users
+    BEGIN{_bump(_user_counters('NEW', '+'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_users_delete AFTER DELETE ON users
+    BEGIN{_bump(_user_counters('OLD', '-'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_users_update AFTER UPDATE OF tokens, is_active ON users
+    WHEN OLD.tokens IS NOT NEW.tokens OR OLD.is_active IS NOT NEW.is_active
+    BEGIN{_bump({
+        'active_users': "COALESCE(NEW.is_active = TRUE, 0) - COALESCE(OLD.is_active = TRUE, 0)",
+        'tokens': "NEW.tokens - OLD.tokens",
+    })}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_content_insert AFTER INSERT ON content
+    BEGIN{_bump(_content_counters('NEW', '+'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_content_delete AFTER DELETE ON content
+    BEGIN{_bump(_content_counters('OLD', '-'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_content_update AFTER UPDATE OF is_active ON content
+    WHEN OLD.is_active IS NOT NEW.is_active
+    BEGIN{_bump({'active_content': "COALESCE(NEW.is_active = TRUE, 0) - COALESCE(OLD.is_active = TRUE, 0)"})}
+    END
+    """,
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counters_{table}_{event.lower()} AFTER {event} ON {table}
+    BEGIN{_bump({table: delta})}
+    END
+    """
+    for table in COUNTED_TABLES if table not in ('users', 'content')
+    for event, delta in (('INSERT', '+1'), ('DELETE', '-1'))
+]
+
+# Full recomputation of every counter (backfill / repair)
+COUNTER_SOURCE = """
+    SELECT 'users', COUNT(*) FROM users
+    UNION ALL SELECT 'active_users', COUNT(*) FROM users WHERE is_active = TRUE
+    UNION ALL SELECT 'tokens', COALESCE(SUM(tokens), 0) FROM users
+    UNION ALL SELECT 'content', COUNT(*) FROM content
+    UNION ALL SELECT 'active_content', COUNT(*) FROM content WHERE is_active = TRUE
+    UNION ALL SELECT 'referrals', COUNT(*) FROM referrals
+    UNION ALL SELECT 'feedback', COUNT(*) FROM feedback
+    UNION ALL SELECT 'logs', COUNT(*) FROM logs
+    UNION ALL SELECT 'token_transactions', COUNT(*) FROM token_transactions
+"""
+
+
+# Ordered history. Never edit an applied migration; append a new one instead.
+# Every step must be safe to re-run, because a migration interrupted half way
+# is retried from its first step on the next start.
+MIGRATIONS = [
+    Migration(1, "baseline_schema", SCHEMA),
+    Migration(2, "assumed_columns", [
+        AddColumn("users", "total_spent", "REAL DEFAULT 0"),
+        AddColumn("users", "loyalty_points", "INTEGER DEFAULT 0"),
+        AddColumn("content", "file_size", "INTEGER DEFAULT 0"),
+        AddColumn("logs", "severity", "TEXT DEFAULT 'INFO'"),
+        AddColumn("logs", "content_id", "INTEGER"),
+        AddColumn("token_transactions", "content_id", "INTEGER"),
+    ]),
+    Migration(3, "hot_query_indexes", INDEXES),
+    Migration(4, "shared_rate_limits", [
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_counters (
+            scope TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            window INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (scope, user_id, window)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_rate_limit_updated ON rate_limit_counters(updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_rate_limit_expires ON rate_limit_counters(expires_at)",
+    ]),
+    Migration(5, "unlock_reservations", [
+        """
+        CREATE TABLE IF NOT EXISTS unlock_reservations (
+            query_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            content_id INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'reserved'
+                CHECK (state IN ('reserved', 'delivered', 'refunded')),
+            tokens_after INTEGER NOT NULL,
+            redemptions_after INTEGER NOT NULL,
+            loyalty_awarded BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        """,
+    ]),
+    Migration(6, "broadcasts", [
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running'
+                CHECK (status IN ('running', 'completed', 'cancelled')),
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            resume_ids TEXT NOT NULL DEFAULT '[]',
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)",
+    ]),
+    Migration(7, "channel_post_queue", [
+        """
+        CREATE TABLE IF NOT EXISTS channel_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_id INTEGER NOT NULL,
+            chat_id TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            caption TEXT,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'posted', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            posted_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_channel_posts_due ON channel_posts(status, next_attempt_at)",
+        AddColumn("content", "channel_status", "TEXT"),
+        AddColumn("content", "channel_message_id", "INTEGER"),
+        AddColumn("content", "channel_posted_at", "TIMESTAMP"),
+    ]),
+    Migration(8, "channel_album_posts", [
+        AddColumn("channel_posts", "items", "TEXT"),
+    ]),
+    Migration(9, "user_cleanup_indexes", [
+        # Set-based user cleanup deletes dependent rows by user_id
+        "CREATE INDEX IF NOT EXISTS idx_feedback_user ON feedback(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_user ON logs(user_id)",
+    ]),
+    Migration(10, "export_watermarks", [
+        """
+        CREATE TABLE IF NOT EXISTS export_watermarks (
+            name TEXT PRIMARY KEY,
+            watermark TEXT NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0,
+            exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    Migration(11, "analytics_indexes", [
+        # Top content by views without sorting the whole table
+        "CREATE INDEX IF NOT EXISTS idx_content_active_views ON content(is_active, views)",
+    ]),
+    # Triggers go in before the backfill; REPLACE then overwrites any day
+    # they touched with the exact recomputed totals
+    Migration(12, "daily_rollups", ROLLUP_TABLES + ROLLUP_TRIGGERS + [
+        f"INSERT OR REPLACE INTO {table} {source}" for table, source in ROLLUP_SOURCES.items()
+    ]),
+    Migration(13, "stats_counters", [
+        """
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+    ] + COUNTER_TRIGGERS + [
+        f"INSERT OR REPLACE INTO stats_counters (name, value) {COUNTER_SOURCE}",
+    ]),
+    # Filled by leaderboard.Leaderboard on its first refresh
+    Migration(14, "leaderboard_snapshots", [
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_meta (
+            metric TEXT PRIMARY KEY,
+            population INTEGER NOT NULL DEFAULT 0,
+            refreshed_at REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_entries (
+            metric TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            detail INTEGER,
+            PRIMARY KEY (metric, position)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_histogram (
+            metric TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            users INTEGER NOT NULL,
+            above INTEGER NOT NULL,
+            PRIMARY KEY (metric, score)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    # Per-referrer totals kept on the user row; the bot updates them in the
+    # same transaction that records a referral
+    Migration(15, "referral_counters", [
+        AddColumn("users", "referral_count", "INTEGER NOT NULL DEFAULT 0"),
+        AddColumn("users", "referral_earned", "INTEGER NOT NULL DEFAULT 0"),
+        AddColumn("users", "referrals_today", "INTEGER NOT NULL DEFAULT 0"),
+        AddColumn("users", "referral_day", "TEXT"),
+        Backfill(
+            "users",
+            """
+            referral_count = (SELECT COUNT(*) FROM referrals WHERE referrer_id = users.id),
+            referral_earned = (SELECT COALESCE(SUM(bonus_amount), 0) FROM referrals
+                               WHERE referrer_id = users.id),
+            referrals_today = (SELECT COUNT(*) FROM referrals
+                               WHERE referrer_id = users.id AND referred_on >= DATE('now')),
+            referral_day = DATE('now')
+            """,
+            "EXISTS (SELECT 1 FROM referrals WHERE referrer_id = users.id)"
+        ),
+        "CREATE INDEX IF NOT EXISTS idx_users_referral_count ON users(referral_count)",
+    ]),
+    # Bumped by writers outside the bot (admin tools) so every bot process
+    # drops its cached user rows
+    Migration(16, "cache_generations", [
+        """
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        "INSERT OR IGNORE INTO cache_generations (name) VALUES ('users')",
+    ]),
+    # Every is_active flip or delete gets a sequence number, so the content
+    # catalog reads only what changed since its last refresh
+    Migration(17, "content_change_log", [
+        """
+        CREATE TABLE IF NOT EXISTS content_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_id INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS content_changes_update AFTER UPDATE OF is_active ON content
+        WHEN OLD.is_active IS NOT NEW.is_active
+        BEGIN
+            INSERT INTO content_changes (content_id) VALUES (NEW.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS content_changes_delete AFTER DELETE ON content
+        BEGIN
+            INSERT INTO content_changes (content_id) VALUES (OLD.id);
+        END
+        """,
+    ]),
+]
+
+class MigrationRunner:
+    """Applies pending migrations and records them in schema_migrations"""
+
+    def __init__(self, connect: Optional[Callable] = None, migrations: List[Migration] = None,
+                 chunk_size: int = MIGRATION_CHUNK_SIZE, pause: float = MIGRATION_CHUNK_PAUSE):
+        self.connect = connect or (lambda: sqlite3.connect(DATABASE_FILE))
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+        self.chunk_size = chunk_size
+        self.pause = pause
+
+    def _ensure_version_table(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duration_ms INTEGER
+            )
+        """)
+        conn.commit()
+
+    def applied(self, conn: sqlite3.Connection) -> Dict[int, str]:
+        """Map of applied version -> recorded checksum"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+        ).fetchone()
+        if not exists:
+            return {}
+        return dict(conn.execute("SELECT version, checksum FROM schema_migrations"))
+
+    def verify(self, applied: Dict[int, str]) -> List[str]:
+        """List applied migrations whose script changed after they ran"""
+        errors = []
+        for migration in self.migrations:
+            recorded = applied.get(migration.version)
+            if recorded and recorded != migration.checksum:
+                errors.append(f"Migration {migration.version} ({migration.name}) checksum mismatch")
+        return errors
+
+    def status(self) -> List[Dict]:
+        """Per-migration state for display"""
+        conn = self.connect()
+        try:
+            applied = self.applied(conn)
+        finally:
+            conn.close()
+
+        return [{
+            'version': m.version,
+            'name': m.name,
+            'applied': m.version in applied,
+            'checksum_ok': applied.get(m.version, m.checksum) == m.checksum
+        } for m in self.migrations]
+
+    def migrate(self, dry_run: bool = False) -> List[str]:
+        """Apply pending migrations in order; with dry_run only return the plan"""
+        conn = self.connect()
+        plan = []
+
+        try:
+            applied = self.applied(conn)
+            errors = self.verify(applied)
+            if errors:
+                raise MigrationError("; ".join(errors))
+
+            pending = [m for m in self.migrations if m.version not in applied]
+            if not pending:
+                return plan
+
+            if not dry_run:
+                self._ensure_version_table(conn)
+
+            for migration in pending:
+                plan.append(f"{migration.version:04d} {migration.name}")
+                for step in migration.steps:
+                    plan.append(f"    {Migration.describe_step(step)}")
+
+                if dry_run:
+                    continue
+
+                started = time.monotonic()
+                # Each step commits on its own so the write lock is released
+                # between steps (one index build, one backfill chunk at a time)
+                for step in migration.steps:
+                    if isinstance(step, str):
+                        conn.execute(step)
+                        conn.commit()
+                    else:
+                        step.apply(conn, self)
+
+                duration_ms = int((time.monotonic() - started) * 1000)
+                conn.execute("""
+                    INSERT INTO schema_migrations (version, name, checksum, duration_ms)
+                    VALUES (?, ?, ?, ?)
+                """, (migration.version, migration.name, migration.checksum, duration_ms))
+                conn.commit()
+                logger.info(f"Applied migration {migration.version} ({migration.name}) in {duration_ms}ms")
+
+            return plan
+
+        finally:
+            conn.close()
+
+# CLI interface for migrations
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Telegram Bot Schema Migrations')
+    parser.add_argument('--dry-run', action='store_true', help='Show pending migrations without applying them')
+    parser.add_argument('--status', action='store_true', help='Show applied and pending migrations')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from database_setup import DatabaseManager
+    runner = MigrationRunner(DatabaseManager(DATABASE_FILE, migrate=False).connect)
+
+    if args.status:
+        for entry in runner.status():
+            state = "applied" if entry['applied'] else "pending"
+            checksum = "" if entry['checksum_ok'] else " (CHECKSUM MISMATCH)"
+            print(f"{entry['version']:04d} {entry['name']}: {state}{checksum}")
+    else:
+        plan = runner.migrate(dry_run=args.dry_run)
+        print("\n".join(plan) if plan else "Schema is up to date")
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Outbound Message Dispatcher for Telegram Bot
+One paced, prioritized queue for every proactive Bot API send, with flood-control aware retries
+"""
+
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from config import (
+    OUTBOUND_RATE, OUTBOUND_WORKERS, OUTBOUND_MAX_RETRIES, OUTBOUND_BACKOFF_BASE,
+    OUTBOUND_BACKOFF_MAX, OUTBOUND_PRIVATE_CHAT_INTERVAL, OUTBOUND_GROUP_CHAT_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+# Priority classes; lower values are sent first
+DELIVERY = 0
+REPLY = 1
+CHANNEL = 2
+BROADCAST = 3
+
+PRIORITY_NAMES = {DELIVERY: 'delivery', REPLY: 'reply', CHANNEL: 'channel', BROADCAST: 'broadcast'}
+
+ChatId = Union[int, str]
+
+class TokenBucket:
+    """Async token bucket; a RetryAfter pause blocks every caller"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        # A small capacity keeps sends evenly spaced instead of allowing a
+        # burst of a whole second's quota on top of the steady rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class _Job:
+    __slots__ = ('priority', 'chat_id', 'send', 'future', 'attempts', 'deadline', 'queued_at', 'sending')
+
+    def __init__(self, priority: int, chat_id: ChatId, send: Callable[[], Awaitable],
+                 future: asyncio.Future, deadline: Optional[float]):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.send = send
+        self.future = future
+        self.attempts = 0
+        self.deadline = deadline
+        self.queued_at = time.monotonic()
+        # True while an attempt is on the wire
+        self.sending = False
+
+class OutboundDispatcher:
+    """Prioritized send queue with global and per-chat pacing"""
+
+    def __init__(self, rate: float = OUTBOUND_RATE, workers: int = OUTBOUND_WORKERS,
+                 max_retries: int = OUTBOUND_MAX_RETRIES,
+                 backoff_base: float = OUTBOUND_BACKOFF_BASE,
+                 backoff_max: float = OUTBOUND_BACKOFF_MAX,
+                 private_chat_interval: float = OUTBOUND_PRIVATE_CHAT_INTERVAL,
+                 group_chat_interval: float = OUTBOUND_GROUP_CHAT_INTERVAL):
+        self.bucket = TokenBucket(rate)
+        self.worker_count = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.private_chat_interval = private_chat_interval
+        self.group_chat_interval = group_chat_interval
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # Tie-breaker keeps FIFO order within a priority class
+        self._sequence = itertools.count()
+        # chat_id -> earliest time the next message may go out
+        self._chat_ready: Dict[ChatId, float] = {}
+        self._workers = []
+        self.metrics = {
+            name: {'sent': 0, 'retried': 0, 'failed': 0, 'wait_ms': 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self.flood_waits = 0
+
+    def start(self):
+        """Spawn the sender workers (inside the running event loop)"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        """Stop the workers and fail whatever is still queued"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        while not self.queue.empty():
+            _, _, job = self.queue.get_nowait()
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Outbound dispatcher stopped"))
+
+    async def send(self, priority: int, chat_id: ChatId, send: Callable[[], Awaitable],
+                   timeout: Optional[float] = None) -> Any:
+        """Queue send() and wait for its result; raises the final error if every attempt fails.
+
+        send must build a fresh Bot API call each time it is invoked, since
+        a retried job calls it again. timeout bounds queueing, flood control
+        pauses and retries; an attempt already on the wire is still awaited,
+        so a message that went out is never reported as failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + timeout if timeout else None
+        job = _Job(priority, chat_id, send, future, deadline)
+        self._enqueue(job)
+        if deadline is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                # A worker may already have expired it
+                if not job.sending and not future.done():
+                    self._time_out(job)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+        return await future
+
+    async def send_media(self, priority: int, chat_id: ChatId, bot, file_type: str, file_id: str,
+                         timeout: Optional[float] = None, **kwargs) -> Any:
+        """Send a stored video, photo or document"""
+        if file_type == 'video':
+            method = bot.send_video
+        elif file_type == 'photo':
+            method = bot.send_photo
+        else:
+            method = bot.send_document
+        return await self.send(priority, chat_id, lambda: method(chat_id, file_id, **kwargs), timeout)
+
+    def _enqueue(self, job: _Job, delay: float = 0):
+        item = (job.priority, next(self._sequence), job)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, item)
+        else:
+            self.queue.put_nowait(item)
+
+    def _chat_interval(self, chat_id: ChatId) -> float:
+        # Channels (@name) and groups (negative ids) have a much lower limit
+        if isinstance(chat_id, str) or chat_id < 0:
+            return self.group_chat_interval
+        return self.private_chat_interval
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job.future.done() or self._expire(job):
+                continue
+
+            # Per-chat pacing: requeue instead of blocking this worker
+            now = time.monotonic()
+            ready_at = self._chat_ready.get(job.chat_id, 0.0)
+            if ready_at > now:
+                self._enqueue(job, ready_at - now)
+                continue
+
+            # Claim the chat's slot before waiting on the bucket so another
+            # worker cannot pick up a second message for the same chat
+            self._chat_ready[job.chat_id] = now + self._chat_interval(job.chat_id)
+            await self.bucket.acquire()
+            # The bucket may have been paused by flood control for longer than the job can wait
+            if job.future.done() or self._expire(job):
+                continue
+            await self._attempt(job)
+            self._prune_chats()
+
+    async def _attempt(self, job: _Job):
+        metrics = self.metrics[PRIORITY_NAMES[job.priority]]
+        job.attempts += 1
+        job.sending = True
+        try:
+            result = await job.send()
+        except RetryAfter as e:
+            self.flood_waits += 1
+            logger.warning(f"Flood control: pausing all sends for {e.retry_after}s")
+            self.bucket.pause(e.retry_after)
+            self._retry(job, metrics, e, e.retry_after)
+        except BadRequest as e:
+            self._fail(job, metrics, e)
+        except NetworkError as e:
+            # Timeouts and connection errors; exponential backoff with jitter
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (job.attempts - 1))
+            self._retry(job, metrics, e, backoff * random.uniform(0.5, 1.5))
+        except Exception as e:
+            self._fail(job, metrics, e)
+        else:
+            metrics['sent'] += 1
+            metrics['wait_ms'] += (time.monotonic() - job.queued_at) * 1000
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            job.sending = False
+
+    def _retry(self, job: _Job, metrics: Dict, error: Exception, delay: float):
+        out_of_time = job.deadline is not None and time.monotonic() + delay > job.deadline
+        if job.attempts > self.max_retries or out_of_time:
+            self._fail(job, metrics, error)
+            return
+        metrics['retried'] += 1
+        self._enqueue(job, delay)
+
+    def _expire(self, job: _Job) -> bool:
+        """Fail a job whose deadline passed before its next attempt started"""
+        if job.deadline is None or time.monotonic() < job.deadline:
+            return False
+        self._time_out(job)
+        return True
+
+    def _time_out(self, job: _Job):
+        waited = time.monotonic() - job.queued_at
+        self._fail(job, self.metrics[PRIORITY_NAMES[job.priority]],
+                   asyncio.TimeoutError(f"Send to {job.chat_id} not attempted within {waited:.1f}s"))
+
+    def _fail(self, job: _Job, metrics: Dict, error: Exception):
+        # Count each job's failure once, however many paths reach it
+        if job.future.done():
+            return
+        metrics['failed'] += 1
+        job.future.set_exception(error)
+
+    def _prune_chats(self):
+        # Entries are only needed until their interval has passed
+        if len(self._chat_ready) > 10000:
+            now = time.monotonic()
+            self._chat_ready = {chat: ready for chat, ready in self._chat_ready.items() if ready > now}
+
+    def stats(self) -> Dict:
+        """Per-class counters for monitoring"""
+        return {
+            'queued': self.queue.qsize(),
+            'flood_waits': self.flood_waits,
+            'classes': {
+                name: dict(values, avg_wait_ms=round(values['wait_ms'] / values['sent'], 1) if values['sent'] else 0)
+                for name, values in self.metrics.items()
+            }
+        }
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Rate Limiting for Telegram Bot
+Constant-time token buckets with pluggable quota backends (in-process or shared SQLite)
+"""
+
+import datetime
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    MAX_REQUESTS_PER_MINUTE, MAX_REDEMPTIONS_PER_DAY,
+    COMMAND_COOLDOWN, REDEMPTION_COOLDOWN, RATE_LIMIT_IDLE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+class MemoryRateLimitBackend:
+    """Quota counters kept in this process only"""
+
+    def __init__(self):
+        # scope -> (window, {user_id: count}); a new window replaces the old dict
+        self._windows: Dict[str, Tuple[int, Dict[int, int]]] = {}
+
+    def _counts(self, scope: str, window: int) -> Dict[int, int]:
+        current = self._windows.get(scope)
+        if current is None or current[0] != window:
+            current = self._windows[scope] = (window, {})
+        return current[1]
+
+    def count(self, scope: str, user_id: int, window: int) -> int:
+        return self._counts(scope, window).get(user_id, 0)
+
+    def hit(self, scope: str, user_id: int, window: int):
+        counts = self._counts(scope, window)
+        counts[user_id] = counts.get(user_id, 0) + 1
+
+class SQLiteRateLimitBackend(MemoryRateLimitBackend):
+    """Quota counters shared by every bot process through a SQLite table
+
+    Hits are counted locally and written in one batched upsert per flush; the
+    same flush pulls in counters other processes changed since the previous
+    one. Limits therefore stay consistent across workers and restarts to
+    within one flush interval, without a database write per update.
+    """
+
+    # Re-read this many seconds before the last sync to catch transactions
+    # that were still committing when it ran
+    SYNC_OVERLAP = 1.0
+
+    def __init__(self):
+        super().__init__()
+        # Hits not yet written: (scope, user_id, window) -> count
+        self.pending: Dict[Tuple[str, int, int], int] = {}
+        self.synced_at = 0.0
+
+    def hit(self, scope: str, user_id: int, window: int):
+        super().hit(scope, user_id, window)
+        key = (scope, user_id, window)
+        self.pending[key] = self.pending.get(key, 0) + 1
+
+    def take_pending(self) -> Dict[Tuple[str, int, int], int]:
+        """Detach the hits to flush (event loop side)"""
+        batch, self.pending = self.pending, {}
+        return batch
+
+    @staticmethod
+    def write_batch(conn, batch: Dict[Tuple[str, int, int], int], expires_after: Dict[str, float],
+                    since: float) -> Tuple[List[tuple], float]:
+        """Add a batch to the shared table and read back every counter changed since `since` (pool thread)"""
+        now = time.time()
+        conn.executemany("""
+            INSERT INTO rate_limit_counters (scope, user_id, window, count, updated_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (scope, user_id, window) DO UPDATE
+            SET count = count + excluded.count, updated_at = excluded.updated_at
+        """, [
+            (scope, user_id, window, hits, now, now + expires_after[scope])
+            for (scope, user_id, window), hits in batch.items()
+        ])
+
+        totals = conn.execute("""
+            SELECT scope, user_id, window, count FROM rate_limit_counters
+            WHERE updated_at >= ?
+        """, (since,)).fetchall()
+
+        conn.execute("DELETE FROM rate_limit_counters WHERE expires_at < ?", (now,))
+        return totals, now
+
+    def apply_totals(self, totals: List[tuple], synced_at: float):
+        """Adopt the merged counts, keeping hits that arrived during the flush"""
+        for scope, user_id, window, total in totals:
+            current = self._windows.get(scope)
+            if current is not None and window < current[0]:
+                continue
+            # Windows only move forward, so a newer one replaces ours
+            self._counts(scope, window)[user_id] = total + self.pending.get((scope, user_id, window), 0)
+        self.synced_at = synced_at - self.SYNC_OVERLAP
+
+    def restore(self, batch: Dict[Tuple[str, int, int], int]):
+        """Put back a batch whose flush failed"""
+        for key, hits in batch.items():
+            self.pending[key] = self.pending.get(key, 0) + hits
+
+class _UserState:
+    """Fixed-size local limiter state for one user"""
+    __slots__ = ('tokens', 'refilled_at', 'last_command', 'last_redemption', 'seen_at')
+
+    def __init__(self, now: float, capacity: float):
+        self.tokens = capacity
+        self.refilled_at = now
+        self.last_command = float('-inf')
+        self.last_redemption = float('-inf')
+        self.seen_at = now
+
+class RateLimiter:
+    """Rate limiting for bot actions"""
+
+    # Idle entries examined per call; keeps eviction O(1) per request
+    EVICTION_BUDGET = 2
+
+    # How long a quota window must be kept in a shared backend
+    WINDOW_SECONDS = {'request': 60, 'redemption': 86400 * 2}
+
+    def __init__(self, backend=None,
+                 requests_per_minute: int = MAX_REQUESTS_PER_MINUTE,
+                 redemptions_per_day: int = MAX_REDEMPTIONS_PER_DAY,
+                 command_cooldown: float = COMMAND_COOLDOWN,
+                 redemption_cooldown: float = REDEMPTION_COOLDOWN,
+                 idle_ttl: float = RATE_LIMIT_IDLE_TTL):
+        self.backend = backend or MemoryRateLimitBackend()
+        self.requests_per_minute = requests_per_minute
+        self.capacity = float(requests_per_minute)
+        self.refill_rate = requests_per_minute / 60.0
+        self.redemptions_per_day = redemptions_per_day
+        self.command_cooldown = command_cooldown
+        self.redemption_cooldown = redemption_cooldown
+        # Never forget a user before their bucket refills or cooldowns expire
+        self.idle_ttl = max(idle_ttl, 60.0, command_cooldown, redemption_cooldown)
+        # Least recently seen users first
+        self.users = OrderedDict()
+
+    def check_rate_limit(self, user_id: int, action: str = 'request') -> bool:
+        now = time.monotonic()
+        state = self._touch(user_id, now)
+        self._evict_idle(now)
+
+        if action == 'request':
+            if now - state.last_command < self.command_cooldown:
+                return False
+
+            # Refill the local burst bucket for the time elapsed since the last request
+            state.tokens = min(self.capacity, state.tokens + (now - state.refilled_at) * self.refill_rate)
+            state.refilled_at = now
+
+            if state.tokens < 1:
+                return False
+
+            # Per-minute quota across every process sharing the backend
+            minute = int(time.time() // 60)
+            if self.backend.count('request', user_id, minute) >= self.requests_per_minute:
+                return False
+
+            self.backend.hit('request', user_id, minute)
+            state.tokens -= 1
+            state.last_command = now
+            return True
+
+        elif action == 'redemption':
+            return self.check_redemption(user_id) is None
+
+        return True
+
+    def check_redemption(self, user_id: int) -> Optional[str]:
+        """Count a redemption; None if allowed, else 'cooldown' or 'daily_limit'"""
+        now = time.monotonic()
+        state = self._touch(user_id, now)
+        self._evict_idle(now)
+
+        if now - state.last_redemption < self.redemption_cooldown:
+            return 'cooldown'
+
+        # Daily counts live in the backend, so evicting an idle user's local
+        # state never resets them
+        today = datetime.date.today().toordinal()
+        if self.backend.count('redemption', user_id, today) >= self.redemptions_per_day:
+            return 'daily_limit'
+
+        self.backend.hit('redemption', user_id, today)
+        state.last_redemption = now
+        return None
+
+    def _touch(self, user_id: int, now: float) -> _UserState:
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = _UserState(now, self.capacity)
+        else:
+            self.users.move_to_end(user_id)
+        state.seen_at = now
+        return state
+
+    def _evict_idle(self, now: float):
+        """Drop a few users idle longer than idle_ttl from the cold end"""
+        for _ in range(self.EVICTION_BUDGET):
+            if not self.users:
+                return
+
+            user_id, state = next(iter(self.users.items()))
+            if now - state.seen_at < self.idle_ttl:
+                return
+
+            del self.users[user_id]
+
+    def __len__(self) -> int:
+        return len(self.users)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Admin Report Benchmark for Telegram Bot
+Statement counts and timings of AdminToolkit analytics on a synthetic database
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adimn_tools import AdminToolkit
+from synthetic_data import populate
+
+class CountingToolkit(AdminToolkit):
+    """AdminToolkit that counts the statements its connections run"""
+
+    statements = 0
+
+    def get_database_connection(self):
+        conn = super().get_database_connection()
+        if conn:
+            conn.set_trace_callback(self._count)
+        return conn
+
+    @classmethod
+    def _count(cls, sql: str):
+        if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            cls.statements += 1
+
+def measure(toolkit: CountingToolkit, call, runs: int):
+    """Best-of-runs time and the statements of one run"""
+    timings = []
+    for _ in range(runs):
+        CountingToolkit.statements = 0
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return min(timings), CountingToolkit.statements
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AdminToolkit analytics')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--referrals', type=int, default=200_000)
+    parser.add_argument('--content', type=int, default=50_000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        populate(path, users=args.users, transactions=args.transactions,
+                 referrals=args.referrals, content=args.content)
+        toolkit = CountingToolkit(path)
+        report = os.path.join(tmp, 'report.json')
+
+        paths = {
+            'generate_admin_report': lambda: toolkit.generate_admin_report(report),
+            'user section': toolkit.get_user_analytics,
+            'content section': toolkit.get_content_analytics,
+            'financial section': toolkit.get_financial_analytics,
+            'referral section': toolkit.get_referral_analytics,
+        }
+        # Warm the page cache once
+        toolkit.generate_admin_report(report)
+        print(f"{args.users} users, {args.transactions} transactions, {args.referrals} referrals, "
+              f"{args.content} content rows (warm cache, best of {args.runs})")
+        for label, call in paths.items():
+            elapsed, statements = measure(toolkit, call, args.runs)
+            print(f"{label:24s} {statements:3d} queries  {elapsed:6.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+User Cleanup Benchmark for Telegram Bot
+cleanup_inactive_users against the old per-user loop while a live writer keeps running
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adimn_tools import AdminToolkit
+from synthetic_data import populate
+
+def per_user_cleanup(path: str, days: int) -> int:
+    """The pre-chunking implementation: one transaction, four DELETEs per user"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    inactive_users = cursor.execute("""
+        SELECT id FROM users
+        WHERE last_activity < datetime('now', '-' || ? || ' days')
+        AND tokens = 0
+        AND redemptions = 0
+    """, (days,)).fetchall()
+    for user_id, in inactive_users:
+        cursor.execute("DELETE FROM referrals WHERE referrer_id = ? OR referred_id = ?", (user_id, user_id))
+        cursor.execute("DELETE FROM feedback WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM token_transactions WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM logs WHERE user_id = ?", (user_id,))
+    cursor.execute("""
+        DELETE FROM users
+        WHERE last_activity < datetime('now', '-' || ? || ' days')
+        AND tokens = 0
+        AND redemptions = 0
+    """, (days,))
+    conn.commit()
+    conn.close()
+    return len(inactive_users)
+
+class LiveWriter(threading.Thread):
+    """Touches one active user every `interval`, like the bot serving /start"""
+
+    def __init__(self, path: str, user_ids, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.path = path
+        self.user_ids = user_ids
+        self.interval = interval
+        self.latencies = []
+        self.locked = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        n = 0
+        while not self.stopping.is_set():
+            started = time.perf_counter()
+            try:
+                conn.execute("UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE id = ?",
+                             (self.user_ids[n % len(self.user_ids)],))
+                conn.commit()
+            except sqlite3.OperationalError:
+                self.locked += 1
+                conn.rollback()
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            n += 1
+            time.sleep(self.interval)
+        conn.close()
+
+    def summary(self) -> str:
+        ordered = sorted(self.latencies) or [0.0]
+        p99 = ordered[int(len(ordered) * 0.99) - 1] if len(ordered) > 1 else ordered[0]
+        return f"writer p99 {p99:.0f} ms, max {ordered[-1]:.0f} ms, 'database is locked' x{self.locked}"
+
+def run(label: str, path: str, active_ids, cleanup) -> None:
+    writer = LiveWriter(path, active_ids)
+    writer.start()
+    started = time.perf_counter()
+    removed = cleanup()
+    elapsed = time.perf_counter() - started
+    writer.stopping.set()
+    writer.join()
+    print(f"{label:10s} removed {removed} users in {elapsed:.1f}s; {writer.summary()}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cleanup_inactive_users')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--inactive', type=float, default=0.3)
+    parser.add_argument('--logs', type=int, default=1_000_000)
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--feedback', type=int, default=100_000)
+    parser.add_argument('--referrals', type=int, default=200_000)
+    parser.add_argument('--baseline', action='store_true', help='Also time the old per-user loop')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.db')
+        populate(template, users=args.users, transactions=args.transactions, referrals=args.referrals,
+                 content=1_000, logs=args.logs, feedback=args.feedback, inactive=args.inactive)
+        conn = sqlite3.connect(template)
+        active_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE redemptions > 0 LIMIT 10000")]
+        conn.close()
+
+        def copy(name: str) -> str:
+            path = os.path.join(tmp, name)
+            source = sqlite3.connect(template)
+            source.execute("VACUUM INTO ?", (path,))
+            source.close()
+            return path
+
+        toolkit_path = copy('chunked.db')
+        toolkit = AdminToolkit(toolkit_path)
+        started = time.perf_counter()
+        candidates = toolkit.cleanup_inactive_users(days=90, dry_run=True)
+        print(f"dry run: {candidates} candidates in {time.perf_counter() - started:.2f}s")
+        run("chunked", toolkit_path, active_ids, lambda: toolkit.cleanup_inactive_users(days=90))
+
+        if args.baseline:
+            baseline_path = copy('baseline.db')
+            sqlite3.connect(baseline_path).execute("PRAGMA journal_mode = WAL").close()
+            run("per-user", baseline_path, active_ids, lambda: per_user_cleanup(baseline_path, 90))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Date Filter Benchmark for Telegram Bot
+DATE(column) = DATE('now') against an index-friendly half-open timestamp range
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_data import populate
+
+QUERIES = {
+    'DATE(timestamp) = DATE(now)': """
+        SELECT COUNT(*) FROM token_transactions WHERE DATE(timestamp) = DATE('now')
+    """,
+    'timestamp range': """
+        SELECT COUNT(*) FROM token_transactions
+        WHERE timestamp >= datetime('now', 'start of day')
+        AND timestamp < datetime('now', 'start of day', '+1 day')
+    """,
+}
+
+def best_of(conn, sql: str, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        conn.execute(sql).fetchone()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark today's-count date filters")
+    parser.add_argument('--transactions', type=int, default=3_000_000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        populate(path, users=100_000, transactions=args.transactions, referrals=0, content=100)
+        conn = sqlite3.connect(path)
+        print(f"token_transactions: {args.transactions} rows over a year")
+        for label, sql in QUERIES.items():
+            count = conn.execute(sql).fetchone()[0]
+            plan = "; ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            print(f"{label:30s} {best_of(conn, sql, args.runs) * 1000:9.2f} ms  rows={count}  plan: {plan}")
+        conn.close()
+
+if __name__ == '__main__':
+    main()
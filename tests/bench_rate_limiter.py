@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter Benchmark for Telegram Bot
+Per-call cost and tracked-user count over simulated days of traffic
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter
+
+class SimulatedClock:
+    """Stands in for time.monotonic, time.time and date.today inside rate_limiter"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return 1_700_000_000 + self.now
+
+    def today(self) -> datetime.date:
+        return datetime.date.fromtimestamp(self.time())
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RateLimiter')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--calls', type=int, default=2_100_000)
+    parser.add_argument('--users', type=int, default=200_000)
+    args = parser.parse_args()
+
+    clock = SimulatedClock()
+    fake_time = SimpleNamespace(monotonic=clock.monotonic, time=clock.time)
+    fake_datetime = SimpleNamespace(date=SimpleNamespace(today=clock.today))
+    per_day = args.calls // args.days
+    step = 86400 / per_day
+    random.seed(1)
+
+    with mock.patch('rate_limiter.time', fake_time), mock.patch('rate_limiter.datetime', fake_datetime):
+        limiter = RateLimiter()
+        elapsed = 0.0
+        for day in range(1, args.days + 1):
+            users = [random.randrange(args.users) for _ in range(per_day)]
+            actions = ['redemption' if random.random() < 0.2 else 'request' for _ in range(per_day)]
+            started = time.perf_counter()
+            for user_id, action in zip(users, actions):
+                clock.now += step
+                limiter.check_rate_limit(user_id, action)
+            elapsed += time.perf_counter() - started
+            if day in (1, args.days) or day % 10 == 0:
+                print(f"day {day:3d}: {len(limiter)} users tracked")
+
+    print(f"{per_day * args.days} calls over {args.users} users: {elapsed / (per_day * args.days) * 1e6:.2f} us/call")
+
+if __name__ == '__main__':
+    main()
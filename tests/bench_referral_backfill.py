@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Referral Counter Backfill Benchmark for Telegram Bot
+Times migration 15 (referral_counters) on sparse, Telegram-style user ids
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import MIGRATIONS, MigrationRunner
+
+def build(path: str, users: int, referrers: int, referrals: int):
+    """Schema up to migration 14 with users spread over ~100..7.2e9"""
+    MigrationRunner(lambda: sqlite3.connect(path), [m for m in MIGRATIONS if m.version < 15]).migrate()
+    conn = sqlite3.connect(path)
+    ids = random.sample(range(100, 7_200_000_000), users)
+    conn.executemany("INSERT INTO users (id) VALUES (?)", [(user_id,) for user_id in ids])
+    sources = random.sample(ids, referrers)
+    conn.executemany(
+        "INSERT INTO referrals (referrer_id, referred_id, bonus_amount) VALUES (?, ?, 5)",
+        [(random.choice(sources), referred) for referred in random.sample(ids, referrals)]
+    )
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the referral_counters migration')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--referrers', type=int, default=20_000)
+    parser.add_argument('--referrals', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build(path, args.users, args.referrers, args.referrals)
+
+        runner = MigrationRunner(lambda: sqlite3.connect(path))
+        started = time.monotonic()
+        runner.migrate()
+        elapsed = time.monotonic() - started
+
+        conn = sqlite3.connect(path)
+        counted = conn.execute("SELECT SUM(referral_count) FROM users").fetchone()[0]
+        conn.close()
+        pages = -(-args.users // runner.chunk_size)
+        print(f"{args.users} users, {args.referrals} referrals: migrations 15+ took {elapsed:.2f}s "
+              f"({pages} pages, {pages * runner.pause:.1f}s of that is lock-yield pauses); "
+              f"referral_count total {counted}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data for Telegram Bot Benchmarks
+Populates a migrated database with sparse Telegram-style ids and a year of history
+"""
+
+import datetime
+import os
+import random
+import sys
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_setup import DatabaseManager
+
+BATCH = 50_000
+TRANSACTION_TYPES = ('redeem', 'purchase', 'welcome_bonus', 'referral_bonus', 'admin_gift', 'loyalty_bonus')
+CATEGORIES = ('General', 'Movies', 'Music', 'Sports', 'Education', 'Gaming')
+
+def _timestamp(now: datetime.datetime, days: int) -> str:
+    moment = now - datetime.timedelta(seconds=random.randrange(days * 86400))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+def _batched(conn, sql: str, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+    conn.commit()
+
+def populate(path: str, users: int = 100_000, transactions: int = 100_000, referrals: int = 20_000,
+             content: int = 5_000, logs: int = 0, feedback: int = 0, inactive: float = 0.0,
+             days: int = 365, seed: int = 1) -> List[int]:
+    """Create and fill the database at `path`; returns the user ids.
+
+    `inactive` is the share of users with no tokens or redemptions and no
+    activity in the last 180 days, i.e. eligible for cleanup.
+    """
+    random.seed(seed)
+    db = DatabaseManager(path)
+    conn = db.connect()
+    conn.execute("PRAGMA synchronous = OFF")
+    now = datetime.datetime.utcnow()
+
+    user_ids = sorted(random.sample(range(100, 7_200_000_000), users))
+
+    def user_rows():
+        for user_id in user_ids:
+            joined = _timestamp(now, days)
+            if random.random() < inactive:
+                yield (user_id, f"user{user_id}", "Idle", 0, 0, joined,
+                       (now - datetime.timedelta(days=180 + random.randrange(180))).strftime("%Y-%m-%d %H:%M:%S"))
+            else:
+                yield (user_id, f"user{user_id}", "User", random.randrange(50), random.randrange(40),
+                       joined, _timestamp(now, 30))
+    _batched(conn, """
+        INSERT INTO users (id, username, first_name, tokens, redemptions, joined_on, last_activity)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, user_rows())
+
+    _batched(conn, """
+        INSERT INTO content (file_id, file_type, caption, category, views, uploaded_by, uploaded_on, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, ((f"file{n}", random.choice(('video', 'photo', 'document')), f"Item {n}", random.choice(CATEGORIES),
+           random.randrange(10_000), user_ids[0], _timestamp(now, days), random.random() > 0.05)
+          for n in range(content)))
+
+    def transaction_rows():
+        for _ in range(transactions):
+            kind = random.choice(TRANSACTION_TYPES)
+            amount = -1 if kind == 'redeem' else random.choice((1, 5, 10, 25))
+            yield (random.choice(user_ids), amount, kind, kind, random.randrange(1, content + 1) if content else None,
+                   _timestamp(now, days))
+    _batched(conn, """
+        INSERT INTO token_transactions (user_id, amount, transaction_type, description, content_id, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, transaction_rows())
+
+    referrers = random.sample(user_ids, max(1, min(len(user_ids), referrals // 5)))
+    _batched(conn, """
+        INSERT INTO referrals (referrer_id, referred_id, bonus_amount, referred_on) VALUES (?, ?, ?, ?)
+    """, ((random.choice(referrers), referred, 5, _timestamp(now, days))
+          for referred in random.sample(user_ids, min(referrals, len(user_ids)))))
+
+    _batched(conn, """
+        INSERT INTO logs (log_type, message, user_id, severity, timestamp) VALUES (?, ?, ?, 'INFO', ?)
+    """, (("user_activity", "seen", random.choice(user_ids), _timestamp(now, days)) for _ in range(logs)))
+
+    _batched(conn, """
+        INSERT INTO feedback (user_id, rating, comment, submitted_on) VALUES (?, ?, ?, ?)
+    """, ((random.choice(user_ids), random.randint(1, 5), "ok", _timestamp(now, days)) for _ in range(feedback)))
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return user_ids
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Content Catalog Test for Telegram Bot
+Catalog refreshes follow deactivation, reactivation and deletion through the change log
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_catalog import ContentCatalog
+from database_setup import DatabaseManager
+from db_pool import AsyncConnectionPool
+from main import TelegramBotAdvanced
+
+class ContentCatalogRefreshTest(unittest.TestCase):
+    """Incremental refreshes against a real database"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, 'catalog.db'))
+        conn = self.db.connect()
+        conn.executemany(
+            "INSERT INTO content (id, file_id, file_type, caption, uploaded_by, is_active) VALUES (?, ?, 'video', ?, 1, ?)",
+            [(content_id, f"file{content_id}", f"Item {content_id}", content_id != 3) for content_id in range(1, 6)]
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, *statements):
+        conn = self.db.connect()
+        for sql in statements:
+            conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+    async def _refresh(self, bot: TelegramBotAdvanced):
+        rows = await bot.db_pool.run(bot.content_catalog.fetch, bot.content_catalog.max_id)
+        bot.content_catalog.merge(rows)
+        await bot.apply_catalog_changes()
+
+    async def _scenario(self):
+        bot = TelegramBotAdvanced.__new__(TelegramBotAdvanced)
+        bot.db = self.db
+        bot.db_pool = AsyncConnectionPool(self.db.db_file, connect=self.db.connect)
+        bot.content_catalog = ContentCatalog()
+        try:
+            change_seq = await bot.db_pool.run(ContentCatalog.fetch_change_seq)
+            bot.content_catalog.load(await bot.db_pool.run(ContentCatalog.fetch), change_seq)
+            loaded = sorted(bot.content_catalog.items)
+
+            self._write(
+                "UPDATE content SET is_active = FALSE WHERE id = 2",
+                "UPDATE content SET is_active = TRUE WHERE id = 3",
+                "DELETE FROM content WHERE id = 5",
+                # Inserted hidden, published later: arrives once, via fetch()
+                "INSERT INTO content (id, file_id, file_type, uploaded_by, is_active) VALUES (6, 'file6', 'video', 1, FALSE)",
+                "UPDATE content SET is_active = TRUE WHERE id = 6",
+            )
+            await self._refresh(bot)
+            refreshed = sorted(bot.content_catalog.items)
+
+            # Nothing changed since: the refresh reads no change rows at all
+            pending = await bot.db_pool.run(ContentCatalog.fetch_changes, bot.content_catalog.change_seq)
+            return loaded, refreshed, pending, bot.content_catalog
+        finally:
+            bot.db_pool.close()
+
+    def test_refresh_follows_deactivation_reactivation_and_deletion(self):
+        loaded, refreshed, pending, catalog = asyncio.run(self._scenario())
+
+        self.assertEqual(loaded, [1, 2, 4, 5])
+        self.assertEqual(refreshed, [1, 3, 4, 6])
+        self.assertEqual(pending, [])
+        self.assertEqual(catalog.get(3)['caption'], "Item 3")
+        self.assertEqual(sorted(content_id for _, content_id in catalog._order), [1, 3, 4, 6])
+
+    def test_changes_are_read_in_bounded_batches(self):
+        self._write(*[f"UPDATE content SET is_active = NOT is_active WHERE id = {n % 5 + 1}" for n in range(25)])
+        conn = self.db.connect()
+        try:
+            first = ContentCatalog.fetch_changes(conn, 0, limit=10)
+            rest = ContentCatalog.fetch_changes(conn, first[-1][0], limit=100)
+        finally:
+            conn.close()
+
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(rest), 15)
+
+if __name__ == '__main__':
+    unittest.main()
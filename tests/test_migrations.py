@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration Tests for Telegram Bot
+Backfills page over the rowids that exist, however sparse
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import Backfill, MigrationRunner
+
+class BackfillTest(unittest.TestCase):
+    """Chunked backfills over Telegram-style sparse ids"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmp.name, 'backfill.db'))
+        self.conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, flag INTEGER NOT NULL DEFAULT 0)")
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def _backfill(self, ids, chunk_size: int, where: str = "1"):
+        self.conn.executemany("INSERT INTO users (id) VALUES (?)", [(user_id,) for user_id in ids])
+        self.conn.commit()
+        runner = MigrationRunner(connect=lambda: self.conn, chunk_size=chunk_size, pause=0.01)
+        updates = []
+        self.conn.set_trace_callback(lambda sql: updates.append(sql) if sql.lstrip().startswith("UPDATE") else None)
+        started = time.monotonic()
+        Backfill("users", "flag = 1", where).apply(self.conn, runner)
+        self.conn.set_trace_callback(None)
+        return len(updates), time.monotonic() - started
+
+    def test_sparse_ids_take_one_chunk_per_page(self):
+        # 10k Telegram-style ids spread from ~100 to ~7.2e9
+        ids = {100, 7_200_000_000} | set(random.sample(range(101, 7_200_000_000), 9_998))
+        chunks, elapsed = self._backfill(ids, chunk_size=1000)
+
+        self.assertEqual(chunks, 10)
+        self.assertLess(elapsed, 5)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM users WHERE flag = 0").fetchone()[0], 0)
+
+    def test_where_limits_rows_and_partial_last_page(self):
+        # 2000 ids, every other one matching
+        chunks, _ = self._backfill(range(0, 2_000_000_000, 1_000_000), chunk_size=300, where="id % 2000000 = 0")
+
+        self.assertEqual(chunks, 7)
+        flagged = self.conn.execute("SELECT COUNT(*) FROM users WHERE flag = 1").fetchone()[0]
+        self.assertEqual(flagged, 1000)
+
+    def test_empty_table(self):
+        chunks, _ = self._backfill([], chunk_size=100)
+        self.assertEqual(chunks, 0)
+
+if __name__ == '__main__':
+    unittest.main()
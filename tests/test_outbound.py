@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Outbound Dispatcher Tests for Telegram Bot
+Send deadlines while queued, paused by flood control or on the wire
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter
+
+from outbound import DELIVERY, OutboundDispatcher, _Job
+
+class SendDeadlineTest(unittest.TestCase):
+    """send(timeout) bounds waiting, never an attempt already sent"""
+
+    def _dispatcher(self) -> OutboundDispatcher:
+        dispatcher = OutboundDispatcher(rate=1000, workers=2, private_chat_interval=0)
+        dispatcher.start()
+        return dispatcher
+
+    def test_timeout_while_paused_by_flood_control(self):
+        async def scenario():
+            dispatcher = self._dispatcher()
+
+            async def flood():
+                raise RetryAfter(2)
+
+            async def ok():
+                return 'sent'
+
+            flooded = asyncio.ensure_future(dispatcher.send(DELIVERY, 1, flood, timeout=5))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            with self.assertRaises(asyncio.TimeoutError):
+                await dispatcher.send(DELIVERY, 2, ok, timeout=0.3)
+            waited = time.monotonic() - started
+            # The worker holding the job after the pause must not count it again
+            await asyncio.sleep(2)
+            failed = dispatcher.metrics['delivery']['failed']
+            flooded.cancel()
+            await dispatcher.stop()
+            return waited, failed
+
+        waited, failed = asyncio.run(scenario())
+        self.assertLess(waited, 0.5)
+        self.assertEqual(failed, 1)
+
+    def test_attempt_on_the_wire_outlives_the_deadline(self):
+        async def scenario():
+            dispatcher = self._dispatcher()
+
+            async def slow():
+                await asyncio.sleep(0.4)
+                return 'sent'
+
+            try:
+                return await dispatcher.send(DELIVERY, 1, slow, timeout=0.1)
+            finally:
+                await dispatcher.stop()
+
+        self.assertEqual(asyncio.run(scenario()), 'sent')
+
+    def test_failure_counted_once(self):
+        async def scenario():
+            dispatcher = OutboundDispatcher()
+            job = _Job(DELIVERY, 1, None, asyncio.get_running_loop().create_future(), time.monotonic() - 1)
+            # A worker expires the job, then the caller's own timeout fires
+            self.assertTrue(dispatcher._expire(job))
+            dispatcher._time_out(job)
+            with self.assertRaises(asyncio.TimeoutError):
+                await job.future
+            return dispatcher.metrics['delivery']['failed']
+
+        self.assertEqual(asyncio.run(scenario()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
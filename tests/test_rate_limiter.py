@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter Tests for Telegram Bot
+Cooldowns, daily redemption caps and idle eviction on a simulated clock
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter
+
+class Clock:
+    """Monotonic clock advanced by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class RedemptionLimitTest(unittest.TestCase):
+    """check_redemption tells a cooldown from the daily cap"""
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('rate_limiter.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(redemptions_per_day=3, redemption_cooldown=5, idle_ttl=60)
+
+    def test_cooldown_is_not_the_daily_limit(self):
+        self.assertIsNone(self.limiter.check_redemption(1))
+        self.clock.now += 1
+        self.assertEqual(self.limiter.check_redemption(1), 'cooldown')
+        self.clock.now += 5
+        self.assertIsNone(self.limiter.check_redemption(1))
+
+    def test_daily_limit(self):
+        for _ in range(3):
+            self.assertIsNone(self.limiter.check_redemption(1))
+            self.clock.now += 6
+        self.assertEqual(self.limiter.check_redemption(1), 'daily_limit')
+        self.assertFalse(self.limiter.check_rate_limit(1, 'redemption'))
+
+    def test_eviction_keeps_the_daily_count(self):
+        for _ in range(3):
+            self.limiter.check_redemption(1)
+            self.clock.now += 6
+
+        # User 1 goes idle and other users' calls evict its local state
+        self.clock.now += 3600
+        for user_id in range(2, 10):
+            self.limiter.check_rate_limit(user_id)
+        self.assertNotIn(1, self.limiter.users)
+
+        self.assertEqual(self.limiter.check_redemption(1), 'daily_limit')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Unlock Stress Test for Telegram Bot
+Thousands of parallel unlocks against one database never overdraw a balance
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import LRUCache
+from config import LOYALTY_BONUS, LOYALTY_THRESHOLD
+from content_catalog import ContentCatalog
+from database_setup import DatabaseManager
+from db_pool import AsyncConnectionPool
+from main import TelegramBotAdvanced
+from view_counter import ViewCounter
+
+USERS = 50
+STARTING_TOKENS = 20
+UNLOCKS = 4000
+FAILURE_RATE = 0.3
+
+class FlakyOutbound:
+    """Delivers after a short random delay; a share of deliveries fail"""
+
+    def __init__(self):
+        self.delivered = 0
+
+    async def send_media(self, *args, **kwargs):
+        await asyncio.sleep(random.random() / 100)
+        if random.random() < FAILURE_RATE:
+            raise RuntimeError("delivery failed")
+        self.delivered += 1
+
+class FakeQuery:
+    """Minimal callback query: id, sender and an editable message"""
+
+    def __init__(self, query_id: str, user_id: int):
+        self.id = query_id
+        self.from_user = type('User', (), {'id': user_id})()
+        self.edits = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+        if random.random() < FAILURE_RATE:
+            raise RuntimeError("message to edit not found")
+
+class UnlockStressTest(unittest.TestCase):
+    """Parallel unlocks, retried query ids and failed deliveries"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, 'stress.db'))
+        conn = self.db.connect()
+        conn.executemany(
+            "INSERT INTO users (id, tokens) VALUES (?, ?)",
+            [(user_id, STARTING_TOKENS) for user_id in range(1, USERS + 1)]
+        )
+        conn.execute(
+            "INSERT INTO content (id, file_id, file_type, caption, uploaded_by) VALUES (1, 'file', 'video', 'clip', 1)"
+        )
+        conn.commit()
+        conn.close()
+
+        self.outbound = FlakyOutbound()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def _bot(self) -> TelegramBotAdvanced:
+        bot = TelegramBotAdvanced.__new__(TelegramBotAdvanced)
+        bot.db = self.db
+        bot.db_pool = AsyncConnectionPool(self.db.db_file, connect=self.db.connect)
+        bot.user_cache = LRUCache(USERS, 300)
+        bot.content_catalog = ContentCatalog()
+        bot.view_counter = ViewCounter()
+        bot.outbound = self.outbound
+        bot.unlock_tasks = set()
+        bot.unfinished_unlocks = {}
+        bot.content_catalog.load(await bot.db_pool.run(ContentCatalog.fetch))
+        return bot
+
+    async def _run_unlocks(self):
+        bot = await self._bot()
+        context = type('Context', (), {'bot': None})()
+
+        queries = [FakeQuery(f"q{n}", random.randint(1, USERS)) for n in range(UNLOCKS)]
+        # Redelivered updates replay earlier query ids once their lane is free
+        replays = random.sample(queries, UNLOCKS // 10)
+        try:
+            for wave in (queries, replays):
+                # A failed message edit may still escape a handler, as it would to the
+                # application's error handler; only the database outcome matters here
+                await asyncio.gather(
+                    *(bot.handle_unlock(query, context, 'unlock_1') for query in wave),
+                    return_exceptions=True
+                )
+        finally:
+            bot.db_pool.close()
+
+    def test_parallel_unlocks_keep_balances_consistent(self):
+        asyncio.run(self._run_unlocks())
+
+        conn = self.db.connect()
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM users WHERE tokens < 0").fetchone()[0], 0)
+            self.assertEqual(
+                conn.execute("SELECT COUNT(*) FROM unlock_reservations WHERE state = 'reserved'").fetchone()[0], 0
+            )
+
+            # Content that reached a user is never refunded, even when the
+            # confirmation edit afterwards fails
+            self.assertEqual(
+                conn.execute("SELECT COUNT(*) FROM unlock_reservations WHERE state = 'delivered'").fetchone()[0],
+                self.outbound.delivered
+            )
+
+            delivered = dict(conn.execute("""
+                SELECT user_id, COUNT(*) FROM unlock_reservations
+                WHERE state = 'delivered' GROUP BY user_id
+            """).fetchall())
+            ledger = dict(conn.execute(
+                "SELECT user_id, SUM(amount) FROM token_transactions GROUP BY user_id"
+            ).fetchall())
+            # Bonus a refund could not take back because it was already spent
+            uncollected = dict(conn.execute("""
+                SELECT user_id, SUM(? + amount) FROM token_transactions
+                WHERE transaction_type = 'loyalty_bonus' AND amount < 0
+                GROUP BY user_id
+            """, (LOYALTY_BONUS,)).fetchall())
+            for user_id, tokens, redemptions in conn.execute("SELECT id, tokens, redemptions FROM users"):
+                unlocked = delivered.get(user_id, 0)
+                # The balance is fully explained by the ledger, and refunds
+                # never leave a user richer than the deliveries they paid for
+                self.assertEqual(tokens, STARTING_TOKENS + ledger.get(user_id, 0))
+                self.assertEqual(redemptions, unlocked)
+                self.assertEqual(
+                    tokens,
+                    STARTING_TOKENS - unlocked + LOYALTY_BONUS * (unlocked // LOYALTY_THRESHOLD)
+                    + uncollected.get(user_id, 0)
+                )
+        finally:
+            conn.close()
+
+    async def _unlock_with_failed_completion(self):
+        bot = await self._bot()
+        complete = bot._complete_unlock
+        failures = [RuntimeError("database is locked")]
+
+        def flaky_complete(conn, *args):
+            if failures:
+                raise failures.pop()
+            return complete(conn, *args)
+        bot._complete_unlock = flaky_complete
+
+        query = FakeQuery("q-complete", 1)
+        try:
+            while True:
+                # Retry until a delivery succeeds; the fake fails some at random
+                await bot.handle_unlock(query, type('Context', (), {'bot': None})(), 'unlock_1')
+                state = self._reservation_state(query.id)
+                if state != 'refunded':
+                    break
+                query = FakeQuery(f"{query.id}-again", 1)
+            pending = dict(bot.unfinished_unlocks)
+            await bot.complete_unfinished_unlocks()
+            return query, state, pending, dict(bot.unfinished_unlocks)
+        finally:
+            bot.db_pool.close()
+
+    def _reservation_state(self, query_id: str) -> str:
+        conn = self.db.connect()
+        try:
+            return conn.execute("SELECT state FROM unlock_reservations WHERE query_id = ?", (query_id,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_failed_completion_after_delivery_is_retried_not_refunded(self):
+        query, state, pending, remaining = asyncio.run(self._unlock_with_failed_completion())
+
+        self.assertEqual(state, 'reserved')
+        self.assertEqual(pending, {query.id: (1, 1)})
+        self.assertFalse(any("failed" in text.lower() for text in query.edits))
+        self.assertEqual(remaining, {})
+        self.assertEqual(self._reservation_state(query.id), 'delivered')
+
+if __name__ == '__main__':
+    unittest.main()
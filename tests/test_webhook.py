@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Webhook Tests for Telegram Bot
+A fake Telegram sender against PTB's webhook listener, and main()'s config checks
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sys
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+from telegram.ext._utils.webhookhandler import WebhookAppClass, WebhookServer
+
+import config
+import main
+
+SECRET = "test_secret-123"
+UPDATE = {"update_id": 1, "message": {
+    "message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"}, "text": "/start"
+}}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def post(port: int, secret: str) -> int:
+    """Deliver UPDATE the way Telegram does; returns the HTTP status"""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/telegram", data=json.dumps(UPDATE).encode(), method="POST",
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+class WebhookListenerTest(unittest.TestCase):
+    """The listener run_webhook() starts: secret check, queue, immediate ack"""
+
+    async def _deliver(self, secret: str):
+        queue = asyncio.Queue()
+        port = free_port()
+        app = WebhookAppClass("/telegram", Bot("123:fake"), queue, SECRET)
+        server = WebhookServer("127.0.0.1", port, app, None)
+        ready = asyncio.Event()
+        serving = asyncio.create_task(server.serve_forever(ready=ready))
+        await ready.wait()
+        try:
+            status = await asyncio.to_thread(post, port, secret)
+            return status, queue.qsize()
+        finally:
+            await server.shutdown()
+            await serving
+
+    def test_valid_secret_is_queued_and_acked(self):
+        self.assertEqual(asyncio.run(self._deliver(SECRET)), (200, 1))
+
+    def test_wrong_secret_is_rejected(self):
+        self.assertEqual(asyncio.run(self._deliver("wrong")), (403, 0))
+
+class WebhookConfigTest(unittest.TestCase):
+    """main() refuses webhook mode with a malformed URL or secret"""
+
+    def _main(self, url: str, secret: str) -> bool:
+        """Run main(); True if it got as far as building the bot"""
+        webhook = {'WEBHOOK_URL': url, 'WEBHOOK_SECRET': secret}
+        with mock.patch.multiple(main, WEBHOOK_ENABLED=True, BOT_TOKEN="123:fake", ADMIN_ID=1, **webhook), \
+                mock.patch.multiple(config, **webhook), \
+                mock.patch.object(main, 'TelegramBotAdvanced') as bot:
+            main.main()
+            return bot.called
+
+    def test_plain_http_url_aborts(self):
+        self.assertFalse(self._main("http://bot.example.com", SECRET))
+
+    def test_malformed_secret_aborts(self):
+        self.assertFalse(self._main("https://bot.example.com", "has spaces"))
+
+    def test_valid_config_starts(self):
+        self.assertTrue(self._main("https://bot.example.com", SECRET))
+
+if __name__ == '__main__':
+    unittest.main()
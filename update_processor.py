@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Concurrent Update Processing for Telegram Bot
+Runs updates from different users in parallel while keeping each user's updates in order
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import MAX_CONCURRENT_REQUESTS, REQUEST_TIMEOUT, USER_LANE_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+class _Lane:
+    """Serializes the updates of one user"""
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+class UserLaneUpdateProcessor(BaseUpdateProcessor):
+    """At most max_concurrent updates in flight, one at a time per user"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 timeout: float = REQUEST_TIMEOUT,
+                 max_pending_per_user: int = USER_LANE_MAX_PENDING):
+        super().__init__(max_concurrent)
+        self.timeout = timeout
+        self.max_pending_per_user = max_pending_per_user
+        # Lanes exist only while a user has updates queued or running
+        self.lanes: Dict[int, _Lane] = {}
+        self.dropped = 0
+        self.timed_out = 0
+
+    @staticmethod
+    def lane_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.lane_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = _Lane()
+
+        # Queued updates hold a concurrency slot, so one user flooding the bot
+        # must not be able to occupy them all
+        if lane.pending >= self.max_pending_per_user:
+            self.dropped += 1
+            coroutine.close()
+            logger.warning(f"Dropped update from {key}: {lane.pending} already pending")
+            return
+
+        lane.pending += 1
+        try:
+            async with lane.lock:
+                await self._run(update, coroutine)
+        finally:
+            lane.pending -= 1
+            if lane.pending == 0:
+                del self.lanes[key]
+
+    async def _run(self, update: object, coroutine: Awaitable[Any]):
+        try:
+            await asyncio.wait_for(coroutine, self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            update_id = update.update_id if isinstance(update, Update) else None
+            logger.error(f"Update {update_id} timed out after {self.timeout}s")
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        """Lane counters for monitoring"""
+        return {
+            'active_lanes': len(self.lanes),
+            'dropped': self.dropped,
+            'timed_out': self.timed_out
+        }
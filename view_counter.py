@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Coalesced View Counting for Telegram Bot
+Accumulates content views in memory and writes them as one batched update
+"""
+
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+class ViewCounter:
+    """Pending per-content view increments not yet written to the database"""
+
+    def __init__(self):
+        self.pending: Dict[int, int] = {}
+
+    def record(self, content_id: int, views: int = 1):
+        self.pending[content_id] = self.pending.get(content_id, 0) + views
+
+    def take_pending(self) -> Dict[int, int]:
+        """Detach the counts to flush"""
+        batch, self.pending = self.pending, {}
+        return batch
+
+    def restore(self, batch: Dict[int, int]):
+        """Put back a batch whose flush failed"""
+        for content_id, views in batch.items():
+            self.record(content_id, views)
+
+    @staticmethod
+    def write_batch(conn, batch: Dict[int, int]) -> int:
+        """One UPDATE per touched row, in id order, in a single transaction (pool thread)"""
+        rows: List[tuple] = [(views, content_id) for content_id, views in sorted(batch.items())]
+        conn.executemany("UPDATE content SET views = views + ? WHERE id = ?", rows)
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self.pending)